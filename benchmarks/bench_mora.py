@@ -0,0 +1,71 @@
+"""
+モーラ数カウントのベンチマーク。
+
+旧実装（呼び出しごとに import + g2p）と、
+キャッシュ付き count_mora / バッチ版 count_mora_many を比較する。
+
+    python -m benchmarks.bench_mora [--lines 30000] [--processes 4]
+"""
+import argparse
+import random
+import re
+import time
+from typing import List
+
+from senryu_ai import mora
+from senryu_ai.parse import load_originals
+
+def legacy_count_mora(text: str) -> int:
+    """変更前の count_mora（比較用にそのまま残している）"""
+    try:
+        import pyopenjtalk  # type: ignore
+        kana = pyopenjtalk.g2p(text, kana=True)
+        return mora._count_mora_from_kana(kana)
+    except Exception:
+        kana = "".join(re.findall(r"[ぁ-ゖァ-ヺーッっんン]", text))
+        if not kana:
+            return max(1, len(text))
+        return mora._count_mora_from_kana(kana)
+
+def make_lines(originals_path: str, n: int, seed: int = 0) -> List[str]:
+    """originals.txt の行を組み替えて、重複を適度に含む入力を作る"""
+    rng = random.Random(seed)
+    pool = [line for o in load_originals(originals_path) for line in o["lines"]]
+    lines = []
+    for _ in range(n):
+        a = rng.choice(pool)
+        # 約半分は既出行、残りは2行をつないだ新規行
+        lines.append(a if rng.random() < 0.5 else a + rng.choice(pool)[:3])
+    return lines
+
+def _timeit(label: str, fn) -> float:
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<32} {elapsed:8.3f}s")
+    return elapsed
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--originals", default="originals.txt")
+    ap.add_argument("--lines", type=int, default=30000)
+    ap.add_argument("--processes", type=int, default=1)
+    args = ap.parse_args()
+
+    lines = make_lines(args.originals, args.lines)
+    print(f"backend={mora.backend_name()} lines={len(lines)} unique={len(set(lines))}")
+
+    base = _timeit("legacy count_mora", lambda: [legacy_count_mora(s) for s in lines])
+
+    mora.clear_cache()
+    cold = _timeit("count_mora (cold cache)", lambda: [mora.count_mora(s) for s in lines])
+    warm = _timeit("count_mora (warm cache)", lambda: [mora.count_mora(s) for s in lines])
+
+    mora.clear_cache()
+    batch = _timeit("count_mora_many", lambda: mora.count_mora_many(lines, processes=args.processes))
+
+    assert [legacy_count_mora(s.strip()) for s in lines[:1000]] == mora.count_mora_many(lines[:1000])
+    print(f"speedup: cold x{base / cold:.1f}, warm x{base / warm:.1f}, batch x{base / batch:.1f}")
+
+if __name__ == "__main__":
+    main()
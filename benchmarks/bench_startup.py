@@ -0,0 +1,102 @@
+"""
+起動時間のベンチマーク（重いライブラリを読み込まずに起動できているかの確認）。
+
+モジュールの import と、LLMを使わないコマンドをそれぞれ別プロセスで実行して実時間を測り、
+ollama / httpx / NumPy / SciPy / pyopenjtalk が読み込まれていないかを調べる。
+
+    python -m benchmarks.bench_startup                  # 表示だけ
+    python -m benchmarks.bench_startup --check          # 上限を超えたら終了コード1
+    python -m benchmarks.bench_startup --max-seconds 0.5 --repeat 7
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+
+# 起動時に読み込まれてはいけないもの（使う直前に読み込む）
+HEAVY_MODULES = ("ollama", "httpx", "numpy", "scipy", "pyopenjtalk", "multiprocessing")
+
+# 読み込んだ後に sys.modules を調べるスクリプト
+_PROBE = (
+    "import importlib, json, sys\n"
+    "for name in sys.argv[1:]:\n"
+    "    importlib.import_module(name)\n"
+    f"print(json.dumps(sorted(m for m in {HEAVY_MODULES!r} if m in sys.modules)))\n"
+)
+
+IMPORTS = [
+    ("import senryu_ai.pipeline", ["senryu_ai.pipeline"]),
+    ("import senryu_ai.offline", ["senryu_ai.offline"]),
+    ("import senryu_ai.service", ["senryu_ai.service"]),
+]
+
+def _env() -> Dict[str, str]:
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(p for p in (ROOT_DIR, env.get("PYTHONPATH", "")) if p)
+    return env
+
+def _run(cmd: List[str], repeat: int) -> Tuple[float, str]:
+    """同じコマンドを repeat 回実行し、一番速かった実時間と最後の標準出力を返す"""
+    best = float("inf")
+    out = ""
+    for _ in range(repeat):
+        started = time.perf_counter()
+        proc = subprocess.run(cmd, cwd=ROOT_DIR, env=_env(), capture_output=True, text=True, encoding="utf-8")
+        best = min(best, time.perf_counter() - started)
+        if proc.returncode != 0:
+            raise RuntimeError(f"実行に失敗しました: {' '.join(cmd)}\n{proc.stderr[-2000:]}")
+        out = proc.stdout
+    return best, out
+
+def run(repeat: int, originals: str) -> List[Dict[str, Any]]:
+    results: List[Dict[str, Any]] = []
+    baseline, _ = _run([sys.executable, "-c", "pass"], repeat)
+    results.append({"name": "python -c pass", "seconds": baseline, "heavy": []})
+    for name, modules in IMPORTS:
+        seconds, out = _run([sys.executable, "-c", _PROBE, *modules], repeat)
+        results.append({"name": name, "seconds": seconds, "heavy": json.loads(out.strip().splitlines()[-1])})
+    main = os.path.join(ROOT_DIR, "main.py")
+    for name, args in [
+        ("main.py --help", ["--help"]),
+        ("main.py --check-mora", ["--check-mora", originals]),
+    ]:
+        seconds, _ = _run([sys.executable, main, *args], repeat)
+        results.append({"name": name, "seconds": seconds, "heavy": None})
+    return results
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="起動時間のベンチマーク")
+    parser.add_argument("--repeat", type=int, default=5, help="各コマンドの実行回数（一番速い回を使う）")
+    parser.add_argument("--max-seconds", type=float, default=0.5, help="--check で許す import の実時間（python 自体の起動を除く）")
+    parser.add_argument("--originals", default=os.path.join(ROOT_DIR, "originals.txt"))
+    parser.add_argument("--check", action="store_true", help="上限を超えた・重いライブラリを読み込んだら終了コード1")
+    args = parser.parse_args(argv)
+
+    results = run(max(1, args.repeat), args.originals)
+    baseline = results[0]["seconds"]
+    failures: List[str] = []
+    print(f"{'コマンド':<28}{'実時間':>10}{'起動を除く':>12}  読み込まれた重いライブラリ")
+    for r in results:
+        seconds, heavy = r["seconds"], r["heavy"]
+        heavy_text = "-" if heavy is None else (", ".join(heavy) or "なし")
+        print(f"{r['name']:<28}{seconds * 1000:>8.0f}ms{(seconds - baseline) * 1000:>10.0f}ms  {heavy_text}")
+        if heavy:
+            failures.append(f"{r['name']}: {', '.join(heavy)} を読み込んでいます")
+        if r["name"].startswith("import ") and seconds - baseline > args.max_seconds:
+            failures.append(f"{r['name']}: {seconds - baseline:.2f}秒（上限 {args.max_seconds}秒）")
+
+    if args.check and failures:
+        print("\n起動が遅くなっています:")
+        for f in failures:
+            print(f"  - {f}")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,93 @@
+"""
+ベンチマーク用の入力を作る。
+
+- make_candidates: originals.txt の上/中/下の句を組み替えた候補（五七五OK・NG・重複が混ざる）
+- llm_outputs: 候補をLLM応答風のJSON配列テキストにする。一部は generate.py の修復処理が
+  想定している壊れ方（エスケープ・連結・余分なカンマ・閉じ忘れ・前置き・途中切れなど）にする
+"""
+import json
+import random
+import re
+from typing import Any, Callable, Dict, List, Tuple
+
+from senryu_ai.parse import load_originals
+
+_PARTICLES = ["は", "が", "を", "に", "と", "も", "で"]
+
+def make_candidates(originals_path: str, n: int, seed: int = 0, dup_rate: float = 0.05) -> List[Dict[str, Any]]:
+    """n件の候補を作る。約 dup_rate は既出の句の繰り返し、残りは原句の句の組み替え（少し崩す）"""
+    rng = random.Random(seed)
+    originals = [o for o in load_originals(originals_path) if len(o["lines"]) == 3]
+    pools = [[o["lines"][i] for o in originals] for i in range(3)]
+    items: List[Dict[str, Any]] = []
+    for _ in range(n):
+        if items and rng.random() < dup_rate:
+            items.append(dict(rng.choice(items)))
+            continue
+        lines = [rng.choice(pool) for pool in pools]
+        r = rng.random()
+        if r < 0.15:  # 助詞を足して字余りにする
+            i = rng.randrange(3)
+            lines[i] = lines[i] + rng.choice(_PARTICLES)
+        elif r < 0.25:  # 末尾を削って字足らずにする
+            i = rng.randrange(3)
+            lines[i] = lines[i][:-1] or lines[i]
+        items.append({"type": "new", "lines": lines, "note": rng.choice(["季節", "学校", "約束", "天気", "失敗"])})
+    return items
+
+def _dump(items: List[Dict[str, Any]]) -> str:
+    # LLMがよく返す書き方（要素ごとに改行、キーと値の間は詰める）
+    body = ",\n".join(json.dumps(it, ensure_ascii=False, separators=(", ", ":")) for it in items)
+    return "[\n" + body + "\n]"
+
+def _sub_once(pattern: str, repl: str, text: str, rng: random.Random) -> str:
+    """pattern に一致する箇所のどれか1つだけを置き換える"""
+    matches = list(re.finditer(pattern, text))
+    if not matches:
+        return text
+    m = rng.choice(matches)
+    return text[:m.start()] + m.expand(repl) + text[m.end():]
+
+# generate.py の修復処理（_parse_json_array）が対象にしている壊れ方
+MALFORMATIONS: Dict[str, Callable[[str, random.Random], str]] = {
+    "escaped_quote": lambda t, r: _sub_once(r'"\]', r'\\"]', t, r),
+    "concatenated": lambda t, r: _sub_once(r"\},\n\{", "}{", t, r),
+    "trailing_comma": lambda t, r: _sub_once(r'"\]', '",]', t, r),
+    "bracket_close": lambda t, r: _sub_once(r"\},\n", "}],\n", t, r),
+    "unclosed_lines": lambda t, r: _sub_once(r'"\], "note"', '", "note"', t, r),
+    "paren_close": lambda t, r: _sub_once(r'"\},\n', '"),\n', t, r),
+    "prose": lambda t, r: "以下が生成結果です。\n```json\n" + t + "\n```\nいかがでしょうか。",
+    "truncated": lambda t, r: t[: int(len(t) * r.uniform(0.5, 0.95))],
+    "control_chars": lambda t, r: _sub_once(r'"note":"', '"note":"\x07', t, r),
+}
+
+def llm_outputs(
+    items: List[Dict[str, Any]],
+    batch_size: int = 50,
+    malformed: bool = False,
+    seed: int = 0,
+) -> List[Tuple[str, str, int]]:
+    """(応答テキスト, 壊れ方, 件数) のリスト。malformed=True なら全バッチを順番に壊す"""
+    rng = random.Random(seed)
+    kinds = list(MALFORMATIONS)
+    outputs = []
+    for b, start in enumerate(range(0, len(items), batch_size)):
+        batch = items[start:start + batch_size]
+        text = _dump(batch)
+        kind = "clean"
+        if malformed:
+            kind = kinds[b % len(kinds)]
+            text = MALFORMATIONS[kind](text, rng)
+        outputs.append((text, kind, len(batch)))
+    return outputs
+
+def stream_chunks(text: str, seed: int = 0) -> List[str]:
+    """ストリーミング応答のように、数文字ずつの断片に分ける"""
+    rng = random.Random(seed)
+    chunks = []
+    i = 0
+    while i < len(text):
+        n = rng.randint(1, 12)
+        chunks.append(text[i:i + n])
+        i += n
+    return chunks
@@ -0,0 +1,327 @@
+"""
+パース・モーラ計算・採点・選抜・パイプライン全体のベンチマーク。
+
+    python -m benchmarks                         # 1k / 10k 件で全ステージ
+    python -m benchmarks --sizes 1k,10k,100k     # 100k 件も測る
+    python -m benchmarks --save-baseline         # 結果を基準値として保存
+    python -m benchmarks --check                 # 基準値より遅くなっていたら終了コード1
+
+ステージごとに処理件数/秒・1回あたりの p50/p95・ピークメモリ（tracemalloc）を出す。
+パイプライン全体は偽LLM（LLM_BACKEND=fake）で別プロセスとして実行し、実時間と最大RSSを測る。
+結果は benchmarks/results/latest.json、基準値は benchmarks/baselines/<名前>.json に保存する。
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from dataclasses import asdict, dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from benchmarks.corpus import llm_outputs, make_candidates, stream_chunks
+from senryu_ai import mora
+from senryu_ai.dedup import NearDuplicateIndex, item_text
+from senryu_ai.generate import JsonObjectStream, _parse_json_array
+from senryu_ai.judge import ScoredItem, rule_score
+from senryu_ai.originals_index import OriginalsIndex
+from senryu_ai.parse import load_originals
+from senryu_ai.prerank import shortlist
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+
+@dataclass
+class StageResult:
+    stage: str
+    size: int
+    items: int
+    seconds: float
+    throughput: float  # 件/秒
+    p50_ms: Optional[float]
+    p95_ms: Optional[float]
+    peak_mb: Optional[float]
+    extra: Dict[str, Any] = field(default_factory=dict)
+
+def _percentile(values: Sequence[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method="inclusive")[int(q) - 1]
+
+def measure(
+    stage: str,
+    size: int,
+    inputs: Sequence[Any],
+    fn: Callable[[Any], Any],
+    items: Optional[int] = None,
+    setup: Optional[Callable[[], None]] = None,
+    memory: bool = True,
+) -> StageResult:
+    """
+    inputs の1件ずつに fn を呼び、1回ごとの所要時間を測る。
+    ピークメモリは tracemalloc が遅いので、時間を測る回とは別に1回流して測る。
+    """
+    peak_mb = None
+    if memory:
+        if setup:
+            setup()
+        tracemalloc.start()
+        with contextlib.redirect_stdout(io.StringIO()):
+            for x in inputs:
+                fn(x)
+        peak_mb = tracemalloc.get_traced_memory()[1] / 1e6
+        tracemalloc.stop()
+
+    if setup:
+        setup()
+    latencies: List[float] = []
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):  # 修復処理などの警告表示は測定対象外
+        for x in inputs:
+            t = time.perf_counter()
+            fn(x)
+            latencies.append((time.perf_counter() - t) * 1000)
+    seconds = time.perf_counter() - started
+    count = items if items is not None else len(inputs)
+    return StageResult(
+        stage=stage,
+        size=size,
+        items=count,
+        seconds=seconds,
+        throughput=count / seconds if seconds > 0 else 0.0,
+        p50_ms=_percentile(latencies, 50),
+        p95_ms=_percentile(latencies, 95),
+        peak_mb=peak_mb,
+    )
+
+def bench_size(originals_path: str, size: int, memory: bool = True) -> List[StageResult]:
+    originals = load_originals(originals_path)
+    original_texts = [o["raw"] for o in originals]
+    candidates = make_candidates(originals_path, size)
+    results: List[StageResult] = []
+
+    # 1) LLM応答のパース（50件ずつのバッチ）
+    clean = llm_outputs(candidates)
+    results.append(measure("parse_clean", size, clean, lambda o: _parse_json_array(o[0], o[2]), items=size, memory=memory))
+
+    malformed = llm_outputs(candidates, malformed=True)
+    recovered: Dict[str, List[int]] = {}
+
+    def parse_malformed(o: Any) -> None:
+        try:
+            got = len(_parse_json_array(o[0], o[2]))
+        except RuntimeError:
+            got = 0
+        recovered.setdefault(o[1], [0, 0])
+        recovered[o[1]][0] += got
+        recovered[o[1]][1] += o[2]
+
+    res = measure("parse_malformed", size, malformed, parse_malformed, items=size, memory=False)
+    res.extra["recovered"] = {k: round(v[0] / v[1], 3) for k, v in sorted(recovered.items())}
+    results.append(res)
+
+    streamed = [stream_chunks(text) for text, _, _ in clean]
+
+    def parse_stream(chunks: List[str]) -> None:
+        parser = JsonObjectStream()
+        for c in chunks:
+            parser.feed(c)
+
+    results.append(measure("parse_stream", size, streamed, parse_stream, items=size, memory=memory))
+
+    # 2) モーラ計算（キャッシュが空の状態から）
+    lines = [s for it in candidates for s in it["lines"]]
+    res = measure("mora_cold", size, lines, mora.count_mora, setup=mora.clear_cache, memory=memory)
+    res.extra["backend"] = mora.backend_name()
+    results.append(res)
+    results.append(
+        measure("mora_batch", size, [lines], mora.count_mora_many, items=len(lines), setup=mora.clear_cache, memory=memory)
+    )
+
+    # 3) 重複除去
+    index_box: List[NearDuplicateIndex] = []
+
+    def reset_dedup() -> None:
+        index_box[:] = [NearDuplicateIndex()]
+
+    results.append(
+        measure("dedup", size, candidates, lambda it: index_box[0].add(item_text(it)), setup=reset_dedup, memory=memory)
+    )
+
+    # 4) ルール採点（モーラはキャッシュ済み・原句コピー検出あり）
+    originals_index = OriginalsIndex(originals)
+    mora.count_mora_many(lines)
+    scored: List[Any] = []
+
+    def score(it: Dict[str, Any]) -> None:
+        r, reasons = rule_score(it, originals_index)
+        scored.append((it, r, reasons))
+
+    results.append(measure("rule_score", size, candidates, score, setup=scored.clear, memory=memory))
+
+    # 5) 事前選抜 + 合算・並べ替え（run_pipeline の順位付け）
+    rule_meta = [m for m in scored if m[1] > -10]
+    if len(rule_meta) < 100:
+        # モーラ計算が簡易方式（pyopenjtalk なし）だと漢字の句がほぼ五七五NGになるので、全件で測る
+        rule_meta = scored
+    top_m = 90
+
+    def rank(meta: List[Any]) -> None:
+        picked = shortlist(meta, original_texts, top_m)
+        merged = [ScoredItem(total=r + 5.0, rule=r, llm=5.0, reasons=rs, item=it) for it, r, rs in picked]
+        merged.sort(key=lambda x: x.total, reverse=True)
+
+    res = measure("rank", size, [rule_meta] * 3, rank, items=len(rule_meta) * 3, memory=memory)
+    res.extra["valid_575"] = sum(1 for m in scored if m[1] > -10)
+    results.append(res)
+    return results
+
+def bench_pipeline(originals_path: str, size: int) -> StageResult:
+    """偽LLMで run_pipeline を別プロセス実行する（LLMの待ち時間は0）"""
+    workdir = tempfile.mkdtemp(prefix="senryu_bench_")
+    env = dict(
+        os.environ,
+        LLM_BACKEND="fake",
+        N_GENERATE=str(size),
+        N_KEEP="30",
+        CACHE_DIR=os.path.join(workdir, ".cache"),
+        PYTHONPATH=ROOT_DIR + os.pathsep + os.environ.get("PYTHONPATH", ""),
+    )
+    code = (
+        "import json, resource, sys\n"
+        "from senryu_ai.pipeline import run_pipeline\n"
+        "run_pipeline(sys.argv[1], sys.argv[2])\n"
+        "print(json.dumps({'maxrss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}))\n"
+    )
+    started = time.perf_counter()
+    try:
+        proc = subprocess.run(
+            [sys.executable, "-c", code, os.path.abspath(originals_path), os.path.join(workdir, "out")],
+            env=env, capture_output=True, text=True, check=True,
+        )
+        seconds = time.perf_counter() - started
+        with open(os.path.join(workdir, "out", "run_report.json"), encoding="utf-8") as f:
+            report = json.load(f)
+    except subprocess.CalledProcessError as e:
+        raise RuntimeError(f"パイプラインの実行に失敗しました:\n{e.stderr[-2000:]}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    peak_mb = None
+    try:
+        peak_mb = json.loads(proc.stdout.strip().splitlines()[-1])["maxrss_kb"] / 1024
+    except (ValueError, KeyError, IndexError):
+        pass
+    return StageResult(
+        stage="pipeline",
+        size=size,
+        items=report.get("generated", size),
+        seconds=seconds,
+        throughput=report.get("generated", size) / seconds,
+        p50_ms=None,
+        p95_ms=None,
+        peak_mb=peak_mb,
+        extra={"valid_575": report.get("valid_575"), "kept": report.get("kept")},
+    )
+
+def environment() -> Dict[str, Any]:
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "mora_backend": mora.backend_name(),
+    }
+
+def _fmt(x: Optional[float], spec: str) -> str:
+    return format(x, spec) if x is not None else "-"
+
+def print_table(results: List[StageResult], baseline: Optional[Dict[str, Any]] = None) -> None:
+    base = {(r["stage"], r["size"]): r for r in (baseline or {}).get("results", [])}
+    print(f"{'stage':<16}{'size':>8}{'items/s':>12}{'p50 ms':>10}{'p95 ms':>10}{'peak MB':>10}  vs baseline")
+    for r in results:
+        b = base.get((r.stage, r.size))
+        delta = f"{(r.throughput / b['throughput'] - 1) * 100:+.0f}%" if b and b["throughput"] else ""
+        print(
+            f"{r.stage:<16}{r.size:>8}{r.throughput:>12.0f}{_fmt(r.p50_ms, '.3f'):>10}"
+            f"{_fmt(r.p95_ms, '.3f'):>10}{_fmt(r.peak_mb, '.1f'):>10}  {delta}"
+        )
+        if r.extra:
+            print(f"{'':<16}{'':>8}  {json.dumps(r.extra, ensure_ascii=False)}")
+
+def regressions(results: List[StageResult], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """処理件数/秒が基準値の 1/(1+tolerance) を下回ったステージ"""
+    base = {(r["stage"], r["size"]): r for r in baseline.get("results", [])}
+    found = []
+    for r in results:
+        b = base.get((r.stage, r.size))
+        if b and b["throughput"] and r.throughput < b["throughput"] / (1 + tolerance):
+            found.append(f"{r.stage}@{r.size}: {b['throughput']:.0f} → {r.throughput:.0f} 件/秒")
+    return found
+
+def _parse_size(s: str) -> int:
+    s = s.strip().lower()
+    return int(float(s[:-1]) * 1000) if s.endswith("k") else int(s)
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="senryu_ai のステージ別ベンチマーク")
+    ap.add_argument("--originals", default=os.path.join(ROOT_DIR, "originals.txt"))
+    ap.add_argument("--sizes", default="1k,10k", help="候補数（カンマ区切り。例: 1k,10k,100k）")
+    ap.add_argument("--pipeline-max", type=_parse_size, default=10000, help="パイプライン全体を測る最大件数（0で省略）")
+    ap.add_argument("--no-memory", action="store_true", help="ピークメモリを測らない（速い）")
+    ap.add_argument("--baseline", default="default", help="基準値の名前（benchmarks/baselines/<名前>.json）")
+    ap.add_argument("--save-baseline", action="store_true", help="今回の結果を基準値として保存する")
+    ap.add_argument("--check", action="store_true", help="基準値より遅いステージがあれば終了コード1")
+    ap.add_argument("--tolerance", type=float, default=0.25, help="--check で許す遅れ（0.25 = 25%%）")
+    args = ap.parse_args(argv)
+
+    sizes = [_parse_size(s) for s in args.sizes.split(",") if s.strip()]
+    baseline_path = os.path.join(BENCH_DIR, "baselines", f"{args.baseline}.json")
+    baseline = None
+    if os.path.exists(baseline_path):
+        with open(baseline_path, encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    env = environment()
+    print(f"環境: {json.dumps(env, ensure_ascii=False)}")
+    if baseline and baseline.get("environment") != env:
+        print("注意: 基準値と環境（Python・CPU数・モーラ計算の方式など）が違うため、比較は目安です。")
+
+    results: List[StageResult] = []
+    for size in sizes:
+        print(f"\n== {size}件 ==")
+        size_results = bench_size(args.originals, size, memory=not args.no_memory)
+        if args.pipeline_max and size <= args.pipeline_max:
+            size_results.append(bench_pipeline(args.originals, size))
+        print_table(size_results, baseline)
+        results.extend(size_results)
+
+    payload = {"environment": env, "created": time.time(), "results": [asdict(r) for r in results]}
+    os.makedirs(os.path.join(BENCH_DIR, "results"), exist_ok=True)
+    with open(os.path.join(BENCH_DIR, "results", "latest.json"), "w", encoding="utf-8") as f:
+        json.dump(payload, f, ensure_ascii=False, indent=2)
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(baseline_path), exist_ok=True)
+        with open(baseline_path, "w", encoding="utf-8") as f:
+            json.dump(payload, f, ensure_ascii=False, indent=2)
+        print(f"\n基準値を保存しました: {baseline_path}")
+
+    if args.check:
+        if baseline is None:
+            print(f"\n基準値がありません（{baseline_path}）。--save-baseline で作成してください。")
+            return 1
+        slow = regressions(results, baseline, args.tolerance)
+        if slow:
+            print("\n基準値より遅くなったステージ:")
+            for line in slow:
+                print(f"  - {line}")
+            return 1
+        print("\n基準値からの大きな遅れはありません。")
+    return 0
@@ -1,4 +1,59 @@
-from senryu_ai.pipeline import run_pipeline
+import argparse
+import os
 
 if __name__ == "__main__":
-    run_pipeline()
+    parser = argparse.ArgumentParser(description="原句の作風に合わせて川柳を生成・採点します")
+    parser.add_argument("--originals", default="originals.txt", help="原句ファイル（既定: originals.txt）")
+    parser.add_argument("--out", default="out", help="出力ディレクトリ（既定: out）")
+    parser.add_argument("--resume", action="store_true", help="中断した前回の実行を続きから再開する")
+    parser.add_argument("--manifest", default=None, help="複数の原句集をまとめて実行する（JSON または「id 原句ファイル」のテキスト）")
+    parser.add_argument("--parallel", type=int, default=None, help="バッチで同時に進める原句集の数（既定: BATCH_PARALLEL）")
+    parser.add_argument("--serve", action="store_true", help="常駐サービスとして起動し、HTTPで生成ジョブを受け付ける")
+    parser.add_argument("--host", default=None, help="サービスの待ち受けアドレス（既定: SERVICE_HOST）")
+    parser.add_argument("--port", type=int, default=None, help="サービスの待ち受けポート（既定: SERVICE_PORT）")
+    parser.add_argument(
+        "--corpus", action="append", default=[], metavar="ID=PATH",
+        help="サービスで読み込む原句集（複数指定可。未指定なら default=--originals）",
+    )
+    parser.add_argument("--check-mora", default=None, metavar="FILE", help="ファイルの各行が五七五かを調べる（LLM不要）")
+    parser.add_argument(
+        "--rerank", nargs="?", const="out/results.json", default=None, metavar="RESULTS_JSON",
+        help="既存の results.json を今のルールで並べ直す（LLM不要。既定: out/results.json）",
+    )
+    parser.add_argument(
+        "--score", default=None, metavar="FILE",
+        help="JSONL か originals.txt 形式の候補ファイルを今のルールで採点し直す（LLM不要。結果は --out の scored.jsonl）",
+    )
+    parser.add_argument("--min-score", type=float, default=None, help="--score でこのルール点未満の句は書き出さない")
+    parser.add_argument("--processes", type=int, default=None, help="--score で使うプロセス数（既定: CPUコア数）")
+    args = parser.parse_args()
+    # 使うモジュールだけを読み込む（LLMを使わないコマンドはすぐ起動する）
+    if args.check_mora:
+        from senryu_ai.offline import check_mora_file
+
+        check_mora_file(args.check_mora)
+    elif args.score:
+        from senryu_ai.offline import score_file
+
+        score_file(
+            args.score, os.path.join(args.out, "scored.jsonl"),
+            originals_path=args.originals if os.path.exists(args.originals) else None,
+            processes=args.processes, min_score=args.min_score,
+        )
+    elif args.rerank:
+        from senryu_ai.offline import rerank_results
+
+        rerank_results(args.rerank, args.originals if os.path.exists(args.originals) else None)
+    elif args.manifest:
+        from senryu_ai.batch import run_batch
+
+        run_batch(args.manifest, args.out, parallel=args.parallel, resume=args.resume)
+    elif args.serve:
+        from senryu_ai.service import serve
+
+        corpora = dict(c.split("=", 1) for c in args.corpus) if args.corpus else {"default": args.originals}
+        serve(corpora, args.host, args.port)
+    else:
+        from senryu_ai.pipeline import run_pipeline
+
+        run_pipeline(args.originals, args.out, resume=args.resume)
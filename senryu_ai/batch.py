@@ -0,0 +1,142 @@
+"""
+複数の原句集（作者ごとなど）をまとめて実行するバッチ（python main.py --manifest corpora.json）。
+
+原句集を1つずつ順に実行すると、作風抽出・ルール採点・事前選抜などLLMを使わない間はサーバーが遊ぶ。
+バッチでは BATCH_PARALLEL 個の原句集を同時に進め、ある原句集の生成と別の原句集の採点が
+同じサーバーに交互に流れるようにする。LLMクライアント・応答キャッシュ・採点アーカイブは共有し、
+サーバーへの同時呼び出しは全原句集の合計で LLM_MAX_INFLIGHT 件に抑える。
+
+manifest の形式:
+- JSON: [{"id": "author_a", "originals": "a.txt", "out": "任意の出力先"}, ...]（{"corpora": [...]} でも可）
+- テキスト: 1行に「id 原句ファイル」（id を省くとファイル名）。# 以降はコメント
+"""
+import json
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+from senryu_ai.config import CONFIG
+from senryu_ai.llm_ollama import llm_concurrency, set_max_inflight, warm_up_model
+from senryu_ai.metrics import METRICS
+from senryu_ai.mora import warm_up_dictionary
+from senryu_ai.pipeline import run_pipeline, write_metrics
+
+_ID_RE = re.compile(r"^[\w.-]+$")
+
+def load_manifest(path: str, out_root: str = "out") -> List[Dict[str, str]]:
+    """manifest を読み、[{"id", "originals", "out"}] にそろえる。原句ファイルの相対パスは manifest の場所から解決する"""
+    base = os.path.dirname(os.path.abspath(path))
+    with open(path, "r", encoding="utf-8") as f:
+        text = f.read()
+    entries: List[Dict[str, Any]] = []
+    if path.endswith(".json"):
+        data = json.loads(text)
+        entries = data.get("corpora", []) if isinstance(data, dict) else data
+    else:
+        for line in text.splitlines():
+            fields = line.split("#", 1)[0].split()
+            if len(fields) == 1:
+                entries.append({"originals": fields[0]})
+            elif len(fields) >= 2:
+                entries.append({"id": fields[0], "originals": fields[1]})
+
+    corpora: List[Dict[str, str]] = []
+    seen = set()
+    for entry in entries:
+        if not isinstance(entry, dict) or not entry.get("originals"):
+            raise RuntimeError(f"manifest の項目に originals がありません: {entry}")
+        originals = os.path.join(base, str(entry["originals"]))
+        corpus_id = str(entry.get("id") or os.path.splitext(os.path.basename(originals))[0])
+        if not _ID_RE.match(corpus_id):
+            raise RuntimeError(f"manifest の id に使えない文字があります: {corpus_id}")
+        if corpus_id in seen:
+            raise RuntimeError(f"manifest の id が重複しています: {corpus_id}")
+        seen.add(corpus_id)
+        out_dir = os.path.join(base, str(entry["out"])) if entry.get("out") else os.path.join(out_root, corpus_id)
+        corpora.append({"id": corpus_id, "originals": originals, "out": out_dir})
+    return corpora
+
+def run_batch(
+    manifest_path: str,
+    out_root: str = "out",
+    parallel: Optional[int] = None,
+    max_inflight: Optional[int] = None,
+    resume: bool = False,
+) -> Dict[str, Any]:
+    """
+    manifest の原句集をまとめて実行する。1つが失敗しても残りは続ける。
+    結果は原句集ごとの出力先（既定 out/<id>/）に、全体の集計は out/batch_report.json と out/run_metrics.json に書く。
+    """
+    corpora = load_manifest(manifest_path, out_root)
+    if not corpora:
+        raise RuntimeError(f"manifest に原句集がありません: {manifest_path}")
+    os.makedirs(out_root, exist_ok=True)
+    parallel = max(1, min(parallel or CONFIG.batch_parallel, len(corpora)))
+    # 同時呼び出しの上限を全原句集で共有する（未指定なら1原句集分の並列数。複数ホストなら合計の枠）
+    inflight = max_inflight or CONFIG.llm_max_inflight or llm_concurrency(max(CONFIG.generate_concurrency, CONFIG.judge_concurrency))
+    set_max_inflight(inflight)
+    if CONFIG.style_profile_path:
+        print("注意: STYLE_PROFILE_PATH が指定されているため、すべての原句集で同じ作風プロファイルを使います")
+
+    METRICS.reset()
+    print(f"バッチ実行: {len(corpora)}件の原句集（同時 {parallel}件, LLM同時呼び出し {inflight}件まで）")
+    warm_up_dictionary()
+    warm_up_model()
+    started = time.perf_counter()
+
+    def run_one(corpus: Dict[str, str]) -> Dict[str, Any]:
+        row: Dict[str, Any] = {"id": corpus["id"], "originals": corpus["originals"], "out": corpus["out"]}
+        print(f"[{corpus['id']}] 開始")
+        with METRICS.span("corpus", id=corpus["id"]) as span:
+            try:
+                report = run_pipeline(corpus["originals"], corpus["out"], resume=resume, standalone=False)
+            except Exception as e:
+                row.update(status="failed", error=str(e)[:500])
+                print(f"[{corpus['id']}] 失敗しました: {str(e)[:200]}")
+            else:
+                row.update(status="done" if report.get("kept") else "empty", report=report)
+                print(f"[{corpus['id']}] 完了（上位 {report.get('kept', 0)}件）")
+            span["status"] = row["status"]
+        row["seconds"] = round(span["seconds"], 3)
+        return row
+
+    with ThreadPoolExecutor(max_workers=parallel, thread_name_prefix="senryu-batch") as executor:
+        rows = list(executor.map(run_one, corpora))
+    wall = time.perf_counter() - started
+
+    totals = {"score_store_rule_hits": 0, "score_store_llm_hits": 0}
+    for row in rows:
+        for key in totals:
+            totals[key] += row.get("report", {}).get(key, 0)
+    write_metrics(out_root, totals)
+
+    metrics = METRICS.to_dict()
+    llm = metrics["llm"].values()
+    tokens = sum(agg["eval_count"] for agg in llm)
+    prompt_tokens = sum(agg["prompt_eval_count"] for agg in llm)
+    serial = sum(row["seconds"] for row in rows)
+    summary = {
+        "corpora": rows,
+        "parallel": parallel,
+        "max_inflight": inflight,
+        "seconds": round(wall, 3),
+        # 原句集ごとの所要時間の合計（1つずつ順に実行した場合の目安）と、実際に重ねられた倍率
+        "sum_corpus_seconds": round(serial, 3),
+        "overlap": round(serial / wall, 2) if wall > 0 else None,
+        "eval_tokens": tokens,
+        "prompt_tokens": prompt_tokens,
+        "wall_tokens_per_second": round(tokens / wall, 2) if wall > 0 else None,
+    }
+    with open(os.path.join(out_root, "batch_report.json"), "w", encoding="utf-8") as f:
+        json.dump(summary, f, ensure_ascii=False, indent=2)
+
+    failed = [row["id"] for row in rows if row["status"] == "failed"]
+    print(
+        f"バッチ完了: {len(rows) - len(failed)}/{len(rows)}件, {wall:.1f}秒"
+        f"（順に実行した場合の合計 {serial:.1f}秒, 出力 {tokens}トークン）"
+    )
+    if failed:
+        print(f"失敗した原句集: {', '.join(failed)}（{os.path.join(out_root, 'batch_report.json')} を確認してください）")
+    return summary
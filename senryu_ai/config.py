@@ -4,12 +4,110 @@ import os
 @dataclass(frozen=True)
 class Config:
     ollama_model: str = os.getenv("OLLAMA_MODEL", "qwen2.5:7b-instruct")
+    # 実行中にモデルをメモリに保持する時間（Ollamaの keep_alive。"-1" で無期限、空なら指定しない）
+    ollama_keep_alive: str = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+    # 複数のOllamaサーバーに振り分ける場合の接続先（カンマ区切り。"http://gpu1:11434*4" で同時実行数を指定）
+    ollama_hosts: str = os.getenv("OLLAMA_HOSTS", "")
+    # 1台あたりの同時実行数の既定値（サーバー側の OLLAMA_NUM_PARALLEL に合わせる）
+    ollama_host_concurrency: int = int(os.getenv("OLLAMA_HOST_CONCURRENCY", "1"))
+    # 落ちたホストの復帰を確かめる間隔（秒）と、1回の呼び出しのタイムアウト（秒。0なら無制限）
+    ollama_health_interval: float = float(os.getenv("OLLAMA_HEALTH_INTERVAL", "15"))
+    ollama_timeout: float = float(os.getenv("OLLAMA_TIMEOUT", "600"))
+    # プロンプトを固定の system と可変の user に分けて chat API で送る（サーバー側のプロンプトキャッシュを使い回す）
+    prompt_prefix_cache: bool = os.getenv("PROMPT_PREFIX_CACHE", "1") not in ("0", "false", "False")
+    # LLMの呼び出し先（ollama / fake）。fake はGPU無しで動く偽LLM（ベンチマーク・CI用）
+    llm_backend: str = os.getenv("LLM_BACKEND", "ollama")
+    # 偽LLMの遅延（1回あたり・出力1トークンあたりの秒）と、壊れたJSON・途中切れの割合
+    fake_llm_latency: float = float(os.getenv("FAKE_LLM_LATENCY", "0"))
+    fake_llm_token_latency: float = float(os.getenv("FAKE_LLM_TOKEN_LATENCY", "0"))
+    fake_llm_prompt_latency: float = float(os.getenv("FAKE_LLM_PROMPT_LATENCY", "0"))
+    fake_llm_malformed_rate: float = float(os.getenv("FAKE_LLM_MALFORMED_RATE", "0"))
+    fake_llm_truncate_rate: float = float(os.getenv("FAKE_LLM_TRUNCATE_RATE", "0"))
+    # 偽LLMが再生する応答（LLM_RECORD_PATH で録音したJSONL）
+    fake_llm_replay_path: str = os.getenv("FAKE_LLM_REPLAY", "")
+    # 指定するとLLMの応答をこのJSONLに追記する（偽LLMの再生用）
+    llm_record_path: str = os.getenv("LLM_RECORD_PATH", "")
+    # 計測値を out/run_metrics.json に加えて Prometheus のテキスト形式（out/run_metrics.prom）でも書き出す
+    metrics_prometheus: bool = os.getenv("METRICS_PROMETHEUS", "0") not in ("0", "false", "False")
+    # 常駐サービスモード（python main.py --serve）の待ち受け先・同時実行ジョブ数・待ち行列の長さ
+    service_host: str = os.getenv("SERVICE_HOST", "127.0.0.1")
+    service_port: int = int(os.getenv("SERVICE_PORT", "8765"))
+    service_workers: int = int(os.getenv("SERVICE_WORKERS", "1"))
+    service_queue_size: int = int(os.getenv("SERVICE_QUEUE_SIZE", "16"))
+    # 終わったジョブを何件まで覚えておくか / 1ジョブで生成できる最大件数
+    service_max_jobs: int = int(os.getenv("SERVICE_MAX_JOBS", "200"))
+    service_max_count: int = int(os.getenv("SERVICE_MAX_COUNT", "2000"))
     # 量産→選抜がローカルLLMでは効くので、最初は多め推奨
     n_generate: int = int(os.getenv("N_GENERATE", "300"))
     n_keep: int = int(os.getenv("N_KEEP", "30"))
     # LLMの生成ゆらぎ
     temperature: float = float(os.getenv("TEMPERATURE", "0.9"))
+    # 採点・作風抽出など決定的に動かしたい呼び出しで使う seed
+    seed: int = int(os.getenv("SEED", "42"))
+    # 修正（近い句の添削）の温度。生成より低めにして、元の句から離れすぎないようにする
+    repair_temperature: float = float(os.getenv("REPAIR_TEMPERATURE", "0.3"))
+    # 出力トークンの上限（num_predict）と文脈長（num_ctx）。0なら件数とプロンプト長から自動で決める
+    num_predict: int = int(os.getenv("NUM_PREDICT", "0"))
+    num_ctx: int = int(os.getenv("NUM_CTX", "0"))
+    # 自動で決める num_ctx の範囲（大きいほどVRAMを使う）
+    num_ctx_min: int = int(os.getenv("NUM_CTX_MIN", "2048"))
+    num_ctx_max: int = int(os.getenv("NUM_CTX_MAX", "16384"))
+    # 自動決定で使う、1件あたりの出力トークン数の見積もり（生成・修正・採点）と作風抽出の出力上限
+    generate_tokens_per_item: int = int(os.getenv("GENERATE_TOKENS_PER_ITEM", "80"))
+    repair_tokens_per_item: int = int(os.getenv("REPAIR_TOKENS_PER_ITEM", "50"))
+    judge_tokens_per_item: int = int(os.getenv("JUDGE_TOKENS_PER_ITEM", "24"))
+    style_num_predict: int = int(os.getenv("STYLE_NUM_PREDICT", "1024"))
     # LLM採点を使うか（遅い場合Falseにしてルール採点だけでもOK）
     enable_llm_judge: bool = os.getenv("ENABLE_LLM_JUDGE", "1") not in ("0", "false", "False")
+    # 生成プロンプトに載せるお手本の原句の数（バッチごとに選び直す）
+    n_seeds: int = int(os.getenv("N_SEEDS", "20"))
+    # 生成バッチの同時実行数（Ollama側の OLLAMA_NUM_PARALLEL に合わせる）
+    generate_concurrency: int = int(os.getenv("GENERATE_CONCURRENCY", "1"))
+    # LLMサーバーへ同時に投げる呼び出しの上限（生成・採点・修正の合計。0なら無制限）
+    llm_max_inflight: int = int(os.getenv("LLM_MAX_INFLIGHT", "0"))
+    # バッチ実行（--manifest）で同時に進める原句集の数
+    batch_parallel: int = int(os.getenv("BATCH_PARALLEL", "2"))
+    # 生成直後の重複除去（完全一致 + 文字shingleの Jaccard がしきい値以上）
+    enable_dedup: bool = os.getenv("ENABLE_DEDUP", "1") not in ("0", "false", "False")
+    dedup_threshold: float = float(os.getenv("DEDUP_THRESHOLD", "0.6"))
+    # 原句の写し（コピペ）を検出してルール採点で減点する
+    enable_copy_check: bool = os.getenv("ENABLE_COPY_CHECK", "1") not in ("0", "false", "False")
+    # LLM採点の前に軽い特徴量で上位M件に絞る（0なら N_KEEP の3倍）
+    enable_prerank: bool = os.getenv("ENABLE_PRERANK", "1") not in ("0", "false", "False")
+    prerank_top_m: int = int(os.getenv("PRERANK_TOP_M", "0"))
+    # LLM採点の1回あたりの候補数と、チャンクの同時実行数
+    judge_chunk_size: int = int(os.getenv("JUDGE_CHUNK_SIZE", "20"))
+    judge_concurrency: int = int(os.getenv("JUDGE_CONCURRENCY", os.getenv("GENERATE_CONCURRENCY", "1")))
+    # Ollamaの構造化出力（JSONスキーマ）を使うか。古いOllamaでエラーになる場合は0に
+    structured_output: bool = os.getenv("STRUCTURED_OUTPUT", "1") not in ("0", "false", "False")
+    # ストリーミング生成（候補が届くたびに採点し、足りたら打ち切る）
+    stream_generation: bool = os.getenv("STREAM_GENERATION", "0") not in ("0", "false", "False")
+    # 五七五OKの候補がこの件数に達したら生成を打ち切る（0なら N_KEEP の3倍）
+    target_valid: int = int(os.getenv("TARGET_VALID", "0"))
+    # 適応生成：五七五OKの候補数（TARGET_VALID）を目標に、歩留まりからバッチサイズを調整する
+    adaptive_generation: bool = os.getenv("ADAPTIVE_GENERATION", "0") not in ("0", "false", "False")
+    # 生成の上限（0は無制限）。トークン数は prompt+出力 の合計、時間は秒
+    generate_token_budget: int = int(os.getenv("GENERATE_TOKEN_BUDGET", "0"))
+    generate_time_budget: float = float(os.getenv("GENERATE_TIME_BUDGET", "0"))
+    generate_max_batches: int = int(os.getenv("GENERATE_MAX_BATCHES", "40"))
+    # 五七五まであと REPAIR_MAX_OFF 音の句を、ずれた句だけLLMに直させる
+    enable_repair: bool = os.getenv("ENABLE_REPAIR", "1") not in ("0", "false", "False")
+    repair_max_off: int = int(os.getenv("REPAIR_MAX_OFF", "2"))
+    repair_max_items: int = int(os.getenv("REPAIR_MAX_ITEMS", "200"))
+    # モーラ数キャッシュの上限（行数）と、まとめて数えるときのプロセス数
+    mora_cache_size: int = int(os.getenv("MORA_CACHE_SIZE", "100000"))
+    mora_processes: int = int(os.getenv("MORA_PROCESSES", "1"))
+    # 作風プロファイルなどのキャッシュ置き場
+    cache_dir: str = os.getenv("CACHE_DIR", ".cache")
+    # LLM応答のディスクキャッシュ（温度0 または seed 固定の呼び出しのみ対象）
+    llm_cache: bool = os.getenv("LLM_CACHE", "1") not in ("0", "false", "False")
+    llm_cache_max_entries: int = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "20000"))
+    llm_cache_max_age_days: float = float(os.getenv("LLM_CACHE_MAX_AGE_DAYS", "30"))
+    # 採点済みの句の保存庫（同じ句はルール採点・LLM採点を再利用する）
+    score_store: bool = os.getenv("SCORE_STORE", "1") not in ("0", "false", "False")
+    # 1ならキャッシュを無視して作風を抽出し直す
+    style_profile_refresh: bool = os.getenv("STYLE_PROFILE_REFRESH", "0") not in ("0", "false", "False")
+    # 指定したJSONファイルを作風プロファイルとして固定で使う（LLMを呼ばない）
+    style_profile_path: str = os.getenv("STYLE_PROFILE_PATH", "")
 
 CONFIG = Config()
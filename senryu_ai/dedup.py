@@ -0,0 +1,100 @@
+import random
+import re
+import unicodedata
+import zlib
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+_MERSENNE = (1 << 61) - 1
+_IGNORE = re.compile(r"[\s\W_]+")
+
+def normalize_text(text: str) -> str:
+    """比較用：NFKC・空白と記号を除去・カタカナはひらがなに寄せる"""
+    text = _IGNORE.sub("", unicodedata.normalize("NFKC", text))
+    return "".join(chr(ord(c) - 0x60) if "ァ" <= c <= "ヶ" else c for c in text)
+
+def item_text(item: Dict[str, Any]) -> str:
+    lines = item.get("lines", [])
+    return "".join(s for s in lines if isinstance(s, str)) if isinstance(lines, list) else ""
+
+def shingles(text: str, k: int = 2) -> Set[str]:
+    if len(text) <= k:
+        return {text} if text else set()
+    return {text[i:i + k] for i in range(len(text) - k + 1)}
+
+class NearDuplicateIndex:
+    """
+    完全一致はハッシュ集合、ほぼ同一は文字shingleの MinHash + LSH で検出する。
+    候補同士の総当たりはせず、同じバケットに入った代表句とだけ Jaccard を確認する。
+    """
+
+    def __init__(self, num_perm: int = 30, bands: int = 10, threshold: float = 0.6, k: int = 2, seed: int = 1):
+        if num_perm % bands:
+            raise ValueError("num_perm は bands で割り切れる必要があります")
+        rng = random.Random(seed)
+        self._perms = [(rng.randrange(1, _MERSENNE), rng.randrange(0, _MERSENNE)) for _ in range(num_perm)]
+        self._rows = num_perm // bands
+        self.bands = bands
+        self.threshold = threshold
+        self.k = k
+        self._exact: Dict[str, int] = {}
+        self._buckets: List[Dict[Tuple[int, ...], List[int]]] = [defaultdict(list) for _ in range(bands)]
+        self._shingles: List[Set[str]] = []
+        self.exact_dups = 0
+        self.near_dups = 0
+
+    def _signature(self, grams: Set[str]) -> List[int]:
+        hashes = [zlib.crc32(g.encode("utf-8")) for g in grams]
+        return [min((a * h + b) % _MERSENNE for h in hashes) for a, b in self._perms]
+
+    def find(self, text: str) -> Optional[int]:
+        """登録済みの句なら、その句がまとめられた代表句の番号を返す"""
+        return self._exact.get(normalize_text(text))
+
+    def add(self, text: str, ignore: Optional[int] = None) -> Optional[int]:
+        """
+        代表句として登録する。既存の代表句と重複していれば登録せずその番号を返す。
+        新規なら None を返す。ignore の代表句とは重複していても重複とみなさない。
+        """
+        norm = normalize_text(text)
+        if norm in self._exact and self._exact[norm] != ignore:
+            self.exact_dups += 1
+            return self._exact[norm]
+
+        grams = shingles(norm, self.k)
+        rep_id = len(self._shingles)
+        if grams:
+            sig = self._signature(grams)
+            bands = [tuple(sig[b * self._rows:(b + 1) * self._rows]) for b in range(self.bands)]
+            checked: Set[int] = set()
+            for b, key in enumerate(bands):
+                for other in self._buckets[b].get(key, ()):
+                    if other in checked or other == ignore:
+                        continue
+                    checked.add(other)
+                    inter = len(grams & self._shingles[other])
+                    if inter / (len(grams) + len(self._shingles[other]) - inter) >= self.threshold:
+                        self.near_dups += 1
+                        self._exact[norm] = other
+                        return other
+            for b, key in enumerate(bands):
+                self._buckets[b][key].append(rep_id)
+
+        self._exact[norm] = rep_id
+        self._shingles.append(grams)
+        return None
+
+def add_item(index: NearDuplicateIndex, item: Dict[str, Any]) -> Optional[int]:
+    """
+    候補を index に登録する（返り値は add と同じ）。
+    修正した句（repaired_from あり）は直す前の句と1句しか違わず必ず「ほぼ同一」になるので、
+    直す前の句との重複は数えない。
+    """
+    source = item.get("repaired_from")
+    ignore = index.find(item_text({"lines": source})) if isinstance(source, list) else None
+    return index.add(item_text(item), ignore=ignore)
+
+def dedup_candidates(items: List[Dict[str, Any]], index: Optional[NearDuplicateIndex] = None) -> List[Dict[str, Any]]:
+    """各クラスタの最初の1件だけを残す（順序は保つ）"""
+    index = index or NearDuplicateIndex()
+    return [it for it in items if index.add(item_text(it)) is None]
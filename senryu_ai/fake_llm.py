@@ -0,0 +1,432 @@
+"""
+GPUもOllamaも無い環境でパイプラインを動かすための偽LLM。
+
+- FakeBackend: プロセス内で使うバックエンド（LLM_BACKEND=fake）
+- python -m senryu_ai.fake_llm --port 11435: Ollama API（/api/generate, /api/tags）を
+  真似るHTTPサーバー。OLLAMA_HOST=http://127.0.0.1:11435 で本物のクライアントから使える
+
+応答はプロンプトの種類（生成・採点・修正・作風抽出）を見分けて合成する。
+録音したJSONL（LLM_RECORD_PATH で作れる）があれば、同じプロンプトにはその応答を返す。
+遅延・壊れたJSONの割合・途中で切れる割合を指定できる。
+"""
+import argparse
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional, Set
+from senryu_ai.config import CONFIG
+from senryu_ai.llm_backend import Format, LLMBackend
+
+# ひらがなだけの語（文字数 = 音数）。五七五・字余り・字足らずを組み立てる
+_WORDS = {
+    1: ["の", "が", "に", "を", "と", "は", "も", "へ"],
+    2: ["あめ", "ゆき", "かぜ", "はる", "なつ", "あき", "ふゆ", "そら", "うみ", "まち", "ねこ", "いぬ", "はな", "つき", "ほし", "みち", "かさ", "まど", "こえ", "ゆめ"],
+    3: ["あさひ", "ゆうべ", "ことり", "さくら", "みどり", "こたつ", "ふとん", "めがね", "かばん", "くるま", "ゆうひ", "きのう", "あした", "ひなた", "なみだ"],
+    4: ["ひだまり", "あまおと", "ゆうやけ", "せんたく", "しおかぜ", "まつりの", "ふるさと", "おべんと", "たそがれ", "はなびら"],
+}
+
+_LINE_RE = re.compile(r"(\d+)件生成")
+_JUDGE_RE = re.compile(r"【候補\(JSON\)】\n(.*?)(?:\n\n|$)", re.S)
+
+def _phrase(rng: random.Random, morae: int) -> str:
+    """ちょうど morae 音のひらがな句を作る"""
+    parts: List[str] = []
+    remaining = morae
+    while remaining > 0:
+        sizes = [n for n in (4, 3, 2) if n <= remaining]
+        if parts and (not sizes or rng.random() < 0.3):
+            sizes.append(1)  # 助詞は句の途中にだけ置く
+        size = rng.choice(sizes or [1])
+        parts.append(rng.choice(_WORDS[size]))
+        remaining -= size
+    return "".join(parts)
+
+def _verse(rng: random.Random, near_miss_rate: float) -> List[str]:
+    pattern = [5, 7, 5]
+    if rng.random() < near_miss_rate:
+        i = rng.randrange(3)
+        pattern[i] += rng.choice([-1, 1])
+    return [_phrase(rng, m) for m in pattern]
+
+_FIX_RE = re.compile(r"(上句|中句|下句)は(\d+)音→(\d+)音に")
+
+def _repair(entry: Dict[str, Any], rng: random.Random) -> List[str]:
+    """「直す箇所」の句だけを1〜2文字足し引きして直す（本物のモデルと同じく、他の句は変えない）"""
+    lines = list(entry["lines"])
+    for name, count, target in _FIX_RE.findall(entry.get("直す箇所", "")):
+        i = ["上句", "中句", "下句"].index(name)
+        diff = int(target) - int(count)
+        if diff < 0:
+            lines[i] = lines[i][:diff]
+        elif diff > 0:
+            lines[i] += rng.choice(_WORDS[diff])
+    return lines
+
+def _stable_score(lines: Any, seed: int) -> float:
+    h = hashlib.sha256(f"{seed}:{json.dumps(lines, ensure_ascii=False)}".encode("utf-8")).digest()
+    return round(int.from_bytes(h[:2], "big") / 65535 * 10, 1)
+
+class FakeBackend(LLMBackend):
+    """
+    決定的な偽LLM。同じプロンプトのn回目の呼び出しには、毎回同じ応答を返す。
+    - latency: 1回あたりの待ち時間（秒）/ token_latency: 出力1トークンあたりの待ち時間（秒）
+    - prompt_latency: プロンプト1トークンの評価にかかる秒（同じ system の2回目以降はキャッシュ済みとみなす）
+    - malformed_rate: 応答JSONを壊す割合 / truncate_rate: 応答を途中で切る割合
+    - near_miss_rate: 五七五から1音ずれた句の割合 / duplicate_rate: 同じ句を繰り返す割合
+    - replay_path: 録音した応答（JSONL）。該当が無いプロンプトは合成する
+    """
+
+    name = "fake"
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        token_latency: float = 0.0,
+        prompt_latency: float = 0.0,
+        malformed_rate: float = 0.0,
+        truncate_rate: float = 0.0,
+        near_miss_rate: float = 0.15,
+        duplicate_rate: float = 0.1,
+        seed: int = 0,
+        replay_path: Optional[str] = None,
+    ):
+        self.latency = latency
+        self.token_latency = token_latency
+        self.prompt_latency = prompt_latency
+        self._prefixes: Set[str] = set()
+        self.malformed_rate = malformed_rate
+        self.truncate_rate = truncate_rate
+        self.near_miss_rate = near_miss_rate
+        self.duplicate_rate = duplicate_rate
+        self.seed = seed
+        self.calls = 0
+        self._seen: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._replay: Dict[str, List[str]] = {}
+        if replay_path:
+            self._load_replay(replay_path)
+
+    @classmethod
+    def from_config(cls) -> "FakeBackend":
+        return cls(
+            latency=CONFIG.fake_llm_latency,
+            token_latency=CONFIG.fake_llm_token_latency,
+            prompt_latency=CONFIG.fake_llm_prompt_latency,
+            malformed_rate=CONFIG.fake_llm_malformed_rate,
+            truncate_rate=CONFIG.fake_llm_truncate_rate,
+            seed=CONFIG.seed,
+            replay_path=CONFIG.fake_llm_replay_path or None,
+        )
+
+    @property
+    def model_id(self) -> str:
+        return f"fake:{CONFIG.ollama_model}"
+
+    def _load_replay(self, path: str) -> None:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    rec = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                key = rec.get("prompt_sha") or _sha(rec.get("prompt", ""))
+                self._replay.setdefault(key, []).append(rec["response"])
+
+    def list_models(self) -> List[str]:
+        return [CONFIG.ollama_model]
+
+    # ---- 応答の組み立て ----
+
+    def _rng_for(self, prompt: str) -> random.Random:
+        key = _sha(prompt)
+        with self._lock:
+            self.calls += 1
+            nth = self._seen.get(key, 0)
+            self._seen[key] = nth + 1
+        return random.Random(f"{self.seed}:{key}:{nth}")
+
+    def respond(self, prompt: str, options: Optional[Dict[str, Any]] = None) -> str:
+        rng = self._rng_for(prompt)
+        recorded = self._replay.get(_sha(prompt))
+        text = recorded[rng.randrange(len(recorded))] if recorded else self._synthesize(prompt, rng)
+        # 壊すのは配列の応答（生成・採点・修正）だけ。作風抽出は壊れたJSONを修復しない設計なので対象外
+        broken = text.startswith("[")
+        if broken and rng.random() < self.malformed_rate:
+            text = _corrupt(text, rng)
+        if broken and rng.random() < self.truncate_rate:
+            text = text[: max(1, int(len(text) * rng.uniform(0.3, 0.9)))]
+        num_predict = (options or {}).get("num_predict")
+        if isinstance(num_predict, int) and num_predict > 0:
+            text = text[:num_predict]  # 1文字 = 1トークンとみなす
+        return text
+
+    def _synthesize(self, prompt: str, rng: random.Random) -> str:
+        if "選者" in prompt:
+            m = _JUDGE_RE.search(prompt)
+            items = json.loads(m.group(1)) if m else []
+            return json.dumps(
+                [{"id": it["id"], "score": _stable_score(it.get("lines"), self.seed)} for it in items],
+                ensure_ascii=False,
+            )
+        if "添削者" in prompt:
+            entries = [json.loads(x) for x in re.findall(r'^\{"id": .*\}$', prompt, re.M)]
+            return json.dumps([{"id": e["id"], "lines": _repair(e, rng)} for e in entries], ensure_ascii=False)
+        if "編集者" in prompt:
+            return json.dumps(
+                {
+                    "tone": "口語・ユーモア",
+                    "themes": ["季節", "家族", "学校", "天気", "日常"],
+                    "diction": "具体的で柔らかい",
+                    "imagery": "身近な情景",
+                    "rhythm": "下五で落とす",
+                    "constraints": ["説明しすぎない"],
+                    "examples": [" ".join(_verse(rng, 0.0)) for _ in range(3)],
+                },
+                ensure_ascii=False,
+            )
+        m = _LINE_RE.search(prompt)
+        if m:
+            items: List[Dict[str, Any]] = []
+            for _ in range(int(m.group(1))):
+                if items and rng.random() < self.duplicate_rate:
+                    items.append(dict(rng.choice(items)))
+                else:
+                    items.append({"type": "new", "lines": _verse(rng, self.near_miss_rate), "note": "偽LLMの句"})
+            return json.dumps(items, ensure_ascii=False)
+        return "{}"
+
+    def _prompt_eval(self, prompt: str, system: Optional[str]) -> int:
+        """
+        評価が必要なプロンプトのトークン数（1文字 = 1トークン）。
+        同じ system を前に見ていれば、その分はサーバーのKVキャッシュにあるとみなして数えない。
+        """
+        if system is None:
+            return len(prompt)
+        key = _sha(system)
+        with self._lock:
+            cached = key in self._prefixes
+            self._prefixes.add(key)
+        return len(prompt) + (0 if cached else len(system))
+
+    def _sleep(self, seconds: float) -> None:
+        if seconds > 0:
+            time.sleep(seconds)
+
+    # ---- LLMBackend ----
+
+    def generate(
+        self, prompt: str, format: Format = None, options: Optional[Dict[str, Any]] = None, system: Optional[str] = None
+    ) -> Dict[str, Any]:
+        text = self.respond(_joined(prompt, system), options)
+        prompt_tokens = self._prompt_eval(prompt, system)
+        prompt_s = self.latency + self.prompt_latency * prompt_tokens
+        eval_s = self.token_latency * len(text)
+        self._sleep(prompt_s + eval_s)
+        return {
+            "model": self.model_id,
+            "response": text,
+            "done": True,
+            "prompt_eval_count": prompt_tokens,
+            "eval_count": len(text),
+            "total_duration": int((prompt_s + eval_s) * 1e9),
+            "load_duration": 0,
+            "prompt_eval_duration": int(prompt_s * 1e9),
+            "eval_duration": int(eval_s * 1e9),
+            "done_reason": _done_reason(text, options),
+        }
+
+    def stream(
+        self, prompt: str, format: Format = None, options: Optional[Dict[str, Any]] = None, system: Optional[str] = None
+    ) -> Iterator[Dict[str, Any]]:
+        text = self.respond(_joined(prompt, system), options)
+        return self._stream(text, self._prompt_eval(prompt, system), _done_reason(text, options))
+
+    def _stream(self, text: str, prompt_tokens: int, done_reason: str = "stop", chunk_chars: int = 8) -> Iterator[Dict[str, Any]]:
+        prompt_s = self.latency + self.prompt_latency * prompt_tokens
+        self._sleep(prompt_s)
+        for i in range(0, len(text), chunk_chars):
+            chunk = text[i:i + chunk_chars]
+            self._sleep(self.token_latency * len(chunk))
+            yield {"response": chunk, "done": False}
+        yield {
+            "response": "",
+            "done": True,
+            "prompt_eval_count": prompt_tokens,
+            "eval_count": len(text),
+            "prompt_eval_duration": int(prompt_s * 1e9),
+            "eval_duration": int(self.token_latency * len(text) * 1e9),
+            "done_reason": done_reason,
+        }
+
+    def warm_up(self, options: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        return {"done": True, "load_duration": 0}
+
+def _done_reason(text: str, options: Optional[Dict[str, Any]]) -> str:
+    """num_predict に達して切れたら "length"（Ollamaと同じ）"""
+    num_predict = (options or {}).get("num_predict")
+    return "length" if isinstance(num_predict, int) and 0 < num_predict <= len(text) else "stop"
+
+def _joined(prompt: str, system: Optional[str]) -> str:
+    """応答の合成・録音のキーに使う全文（llm_ollama.Prompt.text と同じつなぎ方）"""
+    return prompt if system is None else f"{system}\n\n{prompt}"
+
+def _sha(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def _corrupt(text: str, rng: random.Random) -> str:
+    """LLMがよくやる壊れ方のどれか1つを起こす"""
+    kind = rng.randrange(4)
+    if kind == 0:
+        return "以下が結果です。\n```json\n" + text + "\n```"  # 前置き・コードフェンス
+    if kind == 1:
+        return re.sub(r"\}\s*\]\s*$", "},]", text)  # 末尾カンマ
+    if kind == 2:
+        quotes = [m.start() for m in re.finditer('"', text)]
+        if quotes:
+            i = rng.choice(quotes)
+            return text[:i] + text[i + 1:]  # 引用符の欠落
+    return text.replace('", "', '" "', 1)  # カンマの欠落
+
+class RecordingBackend(LLMBackend):
+    """別のバックエンドの応答をJSONLに録音する（FakeBackend の replay_path 用）"""
+
+    def __init__(self, inner: LLMBackend, path: str):
+        self.inner = inner
+        self.name = inner.name
+        self.path = path
+        self._lock = threading.Lock()
+
+    @property
+    def model_id(self) -> str:
+        return self.inner.model_id
+
+    def _record(self, prompt: str, response: str) -> None:
+        line = json.dumps({"prompt_sha": _sha(prompt), "response": response}, ensure_ascii=False)
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+    def generate(
+        self, prompt: str, format: Format = None, options: Optional[Dict[str, Any]] = None, system: Optional[str] = None
+    ) -> Dict[str, Any]:
+        response = self.inner.generate(prompt, format, options, system)
+        self._record(_joined(prompt, system), response.get("response", ""))
+        return response
+
+    def stream(
+        self, prompt: str, format: Format = None, options: Optional[Dict[str, Any]] = None, system: Optional[str] = None
+    ) -> Iterator[Dict[str, Any]]:
+        parts: List[str] = []
+        stream = self.inner.stream(prompt, format, options, system)
+        try:
+            for part in stream:
+                parts.append(part.get("response", ""))
+                yield part
+            self._record(_joined(prompt, system), "".join(parts))
+        finally:
+            close = getattr(stream, "close", None)
+            if close is not None:
+                close()
+
+    def list_models(self) -> List[str]:
+        return self.inner.list_models()
+
+    def warm_up(self, options: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        return self.inner.warm_up(options)
+
+def serve(backend: FakeBackend, host: str = "127.0.0.1", port: int = 11435) -> None:
+    """Ollama API の一部（/api/generate, /api/chat, /api/tags, /api/version）を話すHTTPサーバー"""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, fmt: str, *args: Any) -> None:
+            pass
+
+        def _send_json(self, status: int, body: Dict[str, Any]) -> None:
+            data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self) -> None:
+            if self.path == "/api/tags":
+                self._send_json(200, {"models": [{"name": m, "model": m} for m in backend.list_models()]})
+            elif self.path == "/api/version":
+                self._send_json(200, {"version": "0.0.0-fake"})
+            else:
+                self._send_json(404, {"error": "not found"})
+
+        def do_POST(self) -> None:
+            if self.path not in ("/api/generate", "/api/chat"):
+                self._send_json(404, {"error": "not found"})
+                return
+            req = json.loads(self.rfile.read(int(self.headers.get("Content-Length", "0"))) or b"{}")
+            chat = self.path == "/api/chat"
+            if chat:
+                messages = req.get("messages", [])
+                system = "\n\n".join(m["content"] for m in messages if m.get("role") == "system") or None
+                prompt = "\n\n".join(m["content"] for m in messages if m.get("role") != "system")
+            else:
+                system, prompt = req.get("system"), req.get("prompt", "")
+            if not prompt and not system:
+                self._send_json(200, {"model": backend.model_id, "done": True, "response": "", **backend.warm_up()})
+                return
+
+            def shape(part: Dict[str, Any]) -> Dict[str, Any]:
+                body = {"model": backend.model_id, **part}
+                if chat:
+                    body["message"] = {"role": "assistant", "content": body.pop("response", "")}
+                return body
+
+            if not req.get("stream", True):
+                self._send_json(200, shape(backend.generate(prompt, req.get("format"), req.get("options"), system)))
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for part in backend.stream(prompt, req.get("format"), req.get("options"), system):
+                data = (json.dumps(shape(part), ensure_ascii=False) + "\n").encode("utf-8")
+                self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+            self.wfile.write(b"0\r\n\r\n")
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    print(f"偽Ollamaサーバーを起動しました: http://{host}:{port}（Ctrl+Cで停止）")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Ollama API を真似る偽LLMサーバー（ベンチマーク・CI用）")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--latency", type=float, default=CONFIG.fake_llm_latency, help="1回あたりの待ち時間（秒）")
+    parser.add_argument("--token-latency", type=float, default=CONFIG.fake_llm_token_latency, help="出力1トークンあたりの待ち時間（秒）")
+    parser.add_argument("--prompt-latency", type=float, default=CONFIG.fake_llm_prompt_latency, help="プロンプト1トークンあたりの評価時間（秒）")
+    parser.add_argument("--malformed-rate", type=float, default=CONFIG.fake_llm_malformed_rate)
+    parser.add_argument("--truncate-rate", type=float, default=CONFIG.fake_llm_truncate_rate)
+    parser.add_argument("--replay", default=CONFIG.fake_llm_replay_path or None, help="録音した応答（JSONL）")
+    args = parser.parse_args()
+    backend = FakeBackend(
+        latency=args.latency,
+        token_latency=args.token_latency,
+        prompt_latency=args.prompt_latency,
+        malformed_rate=args.malformed_rate,
+        truncate_rate=args.truncate_rate,
+        seed=CONFIG.seed,
+        replay_path=args.replay,
+    )
+    serve(backend, args.host, args.port)
+
+if __name__ == "__main__":
+    main()
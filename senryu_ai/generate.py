@@ -1,22 +1,65 @@
 import json
+import math
 import re
-from typing import List, Dict, Any
-from senryu_ai.llm_ollama import call_ollama
+import time
+import threading
+from concurrent.futures import as_completed
+from dataclasses import asdict, dataclass
+from typing import Callable, Iterator, List, Dict, Any, Optional, Tuple
+from senryu_ai.llm_ollama import Prompt, call_ollama, generation_options, llm_concurrency, stream_ollama
 from senryu_ai.config import CONFIG
+from senryu_ai.seeds import SeedSelector, profile_themes
+from senryu_ai.journal import RunJournal
+from senryu_ai.metrics import METRICS, RunContextExecutor, count_run
 
-def generate_candidates(style_profile: Dict[str, Any], original_texts: List[str], n: int) -> List[Dict[str, Any]]:
+# 候補配列のJSONスキーマ（Ollamaの構造化出力 format に渡す）
+CANDIDATES_SCHEMA: Dict[str, Any] = {
+    "type": "array",
+    "items": {
+        "type": "object",
+        "properties": {
+            "type": {"type": "string"},
+            "lines": {"type": "array", "items": {"type": "string"}, "minItems": 3, "maxItems": 3},
+            "note": {"type": "string"},
+        },
+        "required": ["type", "lines", "note"],
+    },
+}
+
+# パース経路ごとの回数（fast: そのまま読めた / repair: 修復処理に入った /
+# salvage: 部分パースで救済 / failed: 修復しても失敗）
+PARSE_STATS: Dict[str, int] = {"fast": 0, "repair": 0, "salvage": 0, "failed": 0}
+_parse_stats_lock = threading.Lock()
+
+class BatchSeeds:
+    """バッチごとにお手本の原句とテーマを選ぶ（テーマは作風プロファイルの themes を順に使う）"""
+
+    def __init__(self, style_profile: Dict[str, Any], original_texts: List[str]):
+        self.selector = SeedSelector(original_texts, seed=CONFIG.seed)
+        self.themes = profile_themes(style_profile)
+
+    def for_batch(self, batch_num: int) -> Tuple[List[str], Optional[str]]:
+        theme = self.themes[batch_num % len(self.themes)] if self.themes else None
+        return self.selector.select(CONFIG.n_seeds, theme), theme
+
+def _build_prompt(
+    style_profile: Dict[str, Any], seed_texts: List[str], n: int, theme: Optional[str] = None
+) -> Prompt:
+    """
+    system（作風プロファイルと形式のルール）はどのバッチでも同じ文面にして、
+    Ollama側のプロンプトキャッシュ（KVキャッシュ）を使い回せるようにする。
+    バッチごとに変わるお手本・テーマ・件数は user 側に置く。
+    """
     profile_json = json.dumps(style_profile, ensure_ascii=False)
-    seeds = "\n".join(f"- {s}" for s in original_texts[:50])
+    seeds = "\n".join(f"- {s}" for s in seed_texts)
+    theme_note = f"\n【今回のテーマの目安】\n{theme}\n" if theme else ""
 
-    prompt = f"""
+    system = f"""
 あなたは川柳作家です。以下のスタイルプロファイルに厳密に従って川柳を作成してください。
 
 【スタイルプロファイル(JSON)】
 {profile_json}
 
-【元の川柳（作風の参考。コピペ禁止）】
-{seeds}
-
 【重要：五七五の形式】
 川柳は必ず「上5音・中7音・下5音」の形式です。
 - 上句：5音（例：「スキー授業」= 5音）
@@ -43,69 +86,530 @@ def generate_candidates(style_profile: Dict[str, Any], original_texts: List[str]
 - 文字列内の引用符はエスケープ不要（通常の " でOK）
 - 配列の最後の要素の後にもカンマを付けない
 - 有効なJSON形式であることを確認してください
+""".strip()
 
+    user = f"""
+【元の川柳（作風の参考。コピペ禁止）】
+{seeds}
+{theme_note}
 {n}件生成。各候補は必ず五七五の形式にしてください。
 可能な限り多くの候補を生成してください（最低でも{n}件以上）。
 """.strip()
+    return Prompt(system, user)
 
-    # 大量生成の場合は複数回に分ける
-    batch_size = min(50, n)  # 1回あたり最大50件
-    all_candidates = []
-    
+def batch_sizes(n: int, batch_size: int = 50) -> List[int]:
+    """n件を1回あたり最大 batch_size 件のバッチに分ける"""
+    sizes = []
+    remaining = n
+    while remaining > 0:
+        sizes.append(min(batch_size, remaining))
+        remaining -= sizes[-1]
+    return sizes
+
+def generate_candidates(
+    style_profile: Dict[str, Any],
+    original_texts: List[str],
+    n: int,
+    journal: Optional[RunJournal] = None,
+) -> List[Dict[str, Any]]:
+    """journal があれば完了したバッチを記録し、記録済みのバッチは生成し直さない"""
+    seeds = BatchSeeds(style_profile, original_texts)
+    # 大量生成の場合は複数回に分ける（1回あたり最大50件）
     if n > 50:
         # 複数回に分けて生成
-        num_batches = (n + batch_size - 1) // batch_size
-        print(f"大量生成のため、{num_batches}回に分けて生成します...")
-        for batch_num in range(num_batches):
-            current_batch_size = min(batch_size, n - len(all_candidates))
-            if current_batch_size <= 0:
-                break
+        sizes = batch_sizes(n)
+        num_batches = len(sizes)
+        concurrency = max(1, min(llm_concurrency(CONFIG.generate_concurrency), num_batches))
+        if concurrency > 1:
+            print(f"大量生成のため、{num_batches}回に分けて生成します（同時実行数: {concurrency}）...")
+        else:
+            print(f"大量生成のため、{num_batches}回に分けて生成します...")
+
+        def run_batch(batch_num: int) -> List[Dict[str, Any]]:
+            current_batch_size = sizes[batch_num]
+            recorded = journal.batch(batch_num) if journal is not None else None
+            if recorded is not None:
+                print(f"  バッチ {batch_num + 1}/{num_batches}: 前回の結果を再利用（{len(recorded)}件）")
+                return recorded
             print(f"  バッチ {batch_num + 1}/{num_batches} ({current_batch_size}件)...")
-            batch_prompt = prompt.replace(f"{n}件生成", f"{current_batch_size}件生成").replace(f"最低でも{n}件以上", f"最低でも{current_batch_size}件以上")
-            
-            # 再試行ロジック
-            max_retries = 10
-            batch_candidates = []
-            for retry in range(max_retries):
-                try:
-                    text = call_ollama(batch_prompt)
-                    batch_candidates = _parse_json_array(text, current_batch_size)
-                    if batch_candidates:  # 成功した場合
-                        break
-                    elif retry < max_retries - 1:  # 0件でも再試行
-                        print(f"    再試行 {retry + 1}/{max_retries - 1}...")
-                except Exception as e:
-                    max_retries = 10
-                    if retry < max_retries - 1:
-                        print(f"    エラー発生、再試行 {retry + 1}/{max_retries - 1}... ({str(e)[:50]})")
-                    else:
-                        print(f"    バッチ {batch_num + 1} は失敗しました（{max_retries}回試行後）。スキップします。")
-                        batch_candidates = []
-            
-            if batch_candidates:
+            batch_prompt = _batch_prompt(style_profile, seeds, batch_num, current_batch_size)
+            result = _generate_batch(batch_prompt, current_batch_size, label=f"    バッチ {batch_num + 1}: ")
+            if journal is not None:
+                journal.record_batch(batch_num, result)
+            return result
+
+        all_candidates: List[Dict[str, Any]] = []
+        if concurrency == 1:
+            for batch_num in range(num_batches):
+                all_candidates.extend(run_batch(batch_num))
+            return all_candidates
+
+        # 並列実行：終わったバッチから順に結果をまとめる
+        with RunContextExecutor(max_workers=concurrency) as executor:
+            futures = {executor.submit(run_batch, i): i for i in range(num_batches)}
+            for future in as_completed(futures):
+                batch_candidates = future.result()
+                print(f"  バッチ {futures[future] + 1}/{num_batches} 完了（{len(batch_candidates)}件）")
                 all_candidates.extend(batch_candidates)
         return all_candidates
     else:
         # 50件以下の場合も再試行ロジックを追加
-        max_retries = 10
+        recorded = journal.batch(0) if journal is not None else None
+        if recorded is not None:
+            print(f"前回の結果を再利用します（{len(recorded)}件）")
+            return recorded
+        result = _generate_batch(_batch_prompt(style_profile, seeds, 0, n), n, label="", raise_on_failure=True)
+        if journal is not None:
+            journal.record_batch(0, result)
+        return result
+
+def _batch_prompt(style_profile: Dict[str, Any], seeds: BatchSeeds, batch_num: int, size: int) -> Prompt:
+    seed_texts, theme = seeds.for_batch(batch_num)
+    return _build_prompt(style_profile, seed_texts, size, theme)
+
+def _generate_batch(
+    prompt: Prompt,
+    expected_count: int,
+    label: str = "",
+    max_retries: int = 10,
+    raise_on_failure: bool = False,
+    usage: Optional[Dict[str, int]] = None,
+) -> List[Dict[str, Any]]:
+    """1バッチ分を生成する。再試行はバッチ単位で行う。usage には試行回数とトークン数を加算する。"""
+    for retry in range(max_retries):
+        if usage is not None:
+            usage["attempts"] = usage.get("attempts", 0) + 1
+        if retry:
+            METRICS.incr("generate_retries")
+        try:
+            text = call_ollama(
+                prompt,
+                format=CANDIDATES_SCHEMA if CONFIG.structured_output else None,
+                options=generation_options(prompt, expected_count, retry),
+                usage=usage,
+                stage="generate",
+            )
+            result = _parse_json_array(text, expected_count)
+            if result:  # 成功した場合
+                return result
+            elif retry < max_retries - 1:  # 0件でも再試行
+                print(f"{label}再試行 {retry + 1}/{max_retries - 1}...")
+        except Exception as e:
+            if retry < max_retries - 1:
+                print(f"{label}エラー発生、再試行 {retry + 1}/{max_retries - 1}... ({str(e)[:50]})")
+            elif raise_on_failure:
+                raise  # 最後の試行でも失敗した場合はエラーを投げる
+            else:
+                print(f"{label}{max_retries}回試行後も失敗しました。スキップします。")
+    return []  # すべての試行が失敗した場合
+
+@dataclass
+class BatchStats:
+    batch: int
+    requested: int
+    parsed: int = 0
+    unique: int = 0
+    valid: int = 0
+    attempts: int = 0
+    prompt_tokens: int = 0
+    output_tokens: int = 0
+    seconds: float = 0.0
+
+class BatchController:
+    """
+    五七五OKの候補が target_valid 件集まるまで、実測の歩留まりから次のバッチサイズを決める。
+    歩留まり = 五七五OKかつ重複でない件数 / 要求件数（最初は prior_yield を仮定）。
+    トークン数・経過時間・バッチ数の上限に達したら打ち切る。
+    """
+
+    def __init__(
+        self,
+        target_valid: int,
+        token_budget: int = 0,
+        time_budget: float = 0.0,
+        max_batches: int = 40,
+        min_batch: int = 10,
+        max_batch: int = 50,
+        prior_yield: float = 0.3,
+        prior_weight: int = 20,
+    ):
+        self.target_valid = target_valid
+        self.token_budget = token_budget
+        self.time_budget = time_budget
+        self.max_batches = max_batches
+        self.min_batch = min_batch
+        self.max_batch = max_batch
+        self.prior_yield = prior_yield
+        self.prior_weight = prior_weight
+        self.batches: List[BatchStats] = []
+        self.started = time.perf_counter()
+        self.stop_reason = ""
+
+    @property
+    def valid(self) -> int:
+        return sum(b.valid for b in self.batches)
+
+    @property
+    def tokens(self) -> int:
+        return sum(b.prompt_tokens + b.output_tokens for b in self.batches)
+
+    def expected_yield(self) -> float:
+        requested = sum(b.requested for b in self.batches)
+        return (self.valid + self.prior_yield * self.prior_weight) / (requested + self.prior_weight)
+
+    def next_batch_size(self, pending: int = 0) -> int:
+        """pending: まだ結果が返っていないバッチで見込める五七五OK件数"""
+        remaining = self.target_valid - self.valid - pending
+        if remaining <= 0:
+            return 0
+        size = math.ceil(remaining / max(self.expected_yield(), 0.02) * 1.1)
+        return max(self.min_batch, min(self.max_batch, size))
+
+    def should_continue(self) -> bool:
+        if self.valid >= self.target_valid:
+            self.stop_reason = "target"
+        elif self.token_budget and self.tokens >= self.token_budget:
+            self.stop_reason = "token_budget"
+        elif self.time_budget and time.perf_counter() - self.started >= self.time_budget:
+            self.stop_reason = "time_budget"
+        elif len(self.batches) >= self.max_batches:
+            self.stop_reason = "max_batches"
+        elif len(self.batches) >= 5 and all(b.valid == 0 for b in self.batches[-5:]):
+            self.stop_reason = "no_yield"
+        else:
+            return True
+        return False
+
+    def record(self, stats: BatchStats) -> None:
+        self.batches.append(stats)
+
+def generate_adaptive(
+    style_profile: Dict[str, Any],
+    original_texts: List[str],
+    accept: Callable[[Dict[str, Any]], str],
+    target_valid: int,
+    journal: Optional[RunJournal] = None,
+) -> Tuple[List[Dict[str, Any]], BatchController]:
+    """
+    五七五OKの候補数を目標に、バッチサイズと追加バッチ数を調整しながら生成する。
+    accept は候補1件ごとに呼ばれ、"valid" / "rejected" / "duplicate" を返す。
+    GENERATE_CONCURRENCY 件ずつバッチを並列に投げる。
+    journal に記録済みのバッチがあれば、先にそれを読み戻してから続きを生成する。
+    """
+    controller = BatchController(
+        target_valid,
+        token_budget=CONFIG.generate_token_budget,
+        time_budget=CONFIG.generate_time_budget,
+        max_batches=CONFIG.generate_max_batches,
+    )
+    seeds = BatchSeeds(style_profile, original_texts)
+    concurrency = llm_concurrency(CONFIG.generate_concurrency)
+    candidates: List[Dict[str, Any]] = []
+    batch_num = 0
+
+    def collect(stats: BatchStats, items: List[Dict[str, Any]]) -> None:
+        for it in items:
+            candidates.append(it)
+            verdict = accept(it)
+            if verdict != "duplicate":
+                stats.unique += 1
+            if verdict == "valid":
+                stats.valid += 1
+        controller.record(stats)
+
+    if journal is not None:
+        for num in sorted(journal.batches):
+            rec = journal.batches[num]
+            meta = {k: v for k, v in rec.get("meta", {}).items() if k not in ("unique", "valid")}
+            collect(BatchStats(**meta) if meta else BatchStats(batch=num + 1, requested=len(rec["items"])), rec["items"])
+            batch_num = num + 1
+        if journal.batches:
+            print(f"  前回の {len(journal.batches)} バッチを再利用（五七五OK 累計 {controller.valid}件）")
+
+    def run_batch(num: int, size: int) -> Tuple[BatchStats, List[Dict[str, Any]]]:
+        print(f"  バッチ {num + 1} ({size}件, 見込み歩留まり {controller.expected_yield():.0%})...")
+        stats = BatchStats(batch=num + 1, requested=size)
+        usage: Dict[str, int] = {}
+        started = time.perf_counter()
+        items = _generate_batch(_batch_prompt(style_profile, seeds, num, size), size, label=f"    バッチ {num + 1}: ", usage=usage)
+        stats.seconds = round(time.perf_counter() - started, 3)
+        stats.parsed = len(items)
+        stats.attempts = usage.get("attempts", 0)
+        stats.prompt_tokens = usage.get("prompt_tokens", 0)
+        stats.output_tokens = usage.get("output_tokens", 0)
+        if journal is not None:
+            journal.record_batch(num, items, asdict(stats))
+        return stats, items
+
+    with RunContextExecutor(max_workers=concurrency) as executor:
+        while controller.should_continue():
+            # 1ラウンド分のバッチを決める（結果待ちの分も見込んでサイズを割り振る）
+            round_sizes: List[int] = []
+            for _ in range(concurrency):
+                if len(controller.batches) + len(round_sizes) >= controller.max_batches:
+                    break
+                pending = sum(round_sizes) * controller.expected_yield()
+                size = controller.next_batch_size(int(pending))
+                if size <= 0:
+                    break
+                round_sizes.append(size)
+            if not round_sizes:
+                break
+            futures = [executor.submit(run_batch, batch_num + i, size) for i, size in enumerate(round_sizes)]
+            batch_num += len(round_sizes)
+            for future in as_completed(futures):
+                stats, items = future.result()
+                collect(stats, items)
+                print(
+                    f"  バッチ {stats.batch} 完了: {stats.parsed}件中 五七五OK {stats.valid}件"
+                    f"（累計 {controller.valid}/{target_valid}）"
+                )
+
+    reasons = {
+        "target": "目標数に達しました",
+        "token_budget": "トークン上限に達しました",
+        "time_budget": "時間上限に達しました",
+        "max_batches": "バッチ数の上限に達しました",
+        "no_yield": "五七五OKの候補が出ないバッチが続きました",
+    }
+    print(f"生成を終了: {reasons.get(controller.stop_reason, controller.stop_reason)}（{len(controller.batches)}バッチ）")
+    return candidates, controller
+
+def iter_candidates(
+    style_profile: Dict[str, Any],
+    original_texts: List[str],
+    n: int,
+    max_retries: int = 3,
+    journal: Optional[RunJournal] = None,
+    seeds: Optional[BatchSeeds] = None,
+    batch_offset: int = 0,
+) -> Iterator[Dict[str, Any]]:
+    """
+    ストリーミング生成。候補オブジェクトが1件完成するたびに yield する。
+    呼び出し側がイテレーションをやめる（close する）と、実行中のストリームも打ち切られる。
+    journal にはストリームを最後まで読み切ったバッチだけを記録する。
+    seeds / batch_offset を渡すと、お手本の選び方とテーマの順番を前回の呼び出しから引き継ぐ（常駐サービス用）。
+    """
+    sizes = batch_sizes(n)
+    seeds = seeds or BatchSeeds(style_profile, original_texts)
+    for batch_num, current_batch_size in enumerate(sizes):
+        # 記録済みでもプロンプトを組み立てて、原句の選び方を前回と同じ順に進める
+        prompt = _batch_prompt(style_profile, seeds, batch_offset + batch_num, current_batch_size)
+        recorded = journal.batch(batch_num) if journal is not None else None
+        if recorded is not None:
+            print(f"  バッチ {batch_num + 1}/{len(sizes)}: 前回の結果を再利用（{len(recorded)}件）")
+            yield from recorded
+            continue
+        print(f"  バッチ {batch_num + 1}/{len(sizes)} ({current_batch_size}件, ストリーミング)...")
         for retry in range(max_retries):
+            if retry:
+                METRICS.incr("generate_retries")
+            parser = JsonObjectStream()
+            got: List[Dict[str, Any]] = []
             try:
-                text = call_ollama(prompt)
-                result = _parse_json_array(text, n)
-                if result:  # 成功した場合
-                    return result
-                elif retry < max_retries - 1:  # 0件でも再試行
-                    print(f"再試行 {retry + 1}/{max_retries - 1}...")
-            except Exception as e:
-                max_retries = 10
-                if retry < max_retries - 1:
-                    print(f"エラー発生、再試行 {retry + 1}/{max_retries - 1}... ({str(e)[:50]})")
+                for chunk in stream_ollama(
+                    prompt,
+                    format=CANDIDATES_SCHEMA if CONFIG.structured_output else None,
+                    options=generation_options(prompt, current_batch_size, retry),
+                    stage="generate",
+                ):
+                    for obj in parser.feed(chunk):
+                        for item in _normalize_items([obj]):
+                            got.append(item)
+                            yield item
+            except RuntimeError as e:
+                print(f"    エラー発生 ({str(e)[:50]})")
+            if got:
+                if journal is not None:
+                    journal.record_batch(batch_num, got)
+                break
+            if retry < max_retries - 1:
+                print(f"    再試行 {retry + 1}/{max_retries - 1}...")
+        if parser.skipped:
+            METRICS.incr("stream_objects_skipped", parser.skipped)
+            print(f"    壊れたオブジェクト {parser.skipped}件をスキップしました")
+
+class JsonObjectStream:
+    """
+    ストリームで届くテキストから、完成したJSONオブジェクト（{...}）を順に取り出す。
+    外側の配列の括弧やカンマは無視する。途中で切れた末尾は次の feed まで保持する。
+    """
+
+    def __init__(self) -> None:
+        self._buf = ""
+        self._pos = 0  # 走査済みの位置
+        self._start = -1  # 現在のオブジェクトの開始位置
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self.skipped = 0
+
+    def feed(self, chunk: str) -> List[Dict[str, Any]]:
+        self._buf += chunk
+        found: List[Dict[str, Any]] = []
+        buf = self._buf
+        i = self._pos
+        while i < len(buf):
+            ch = buf[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                if self._depth > 0:
+                    self._in_string = True
+            elif ch == "{":
+                if self._depth == 0:
+                    self._start = i
+                self._depth += 1
+            elif ch == "}" and self._depth > 0:
+                self._depth -= 1
+                if self._depth == 0:
+                    try:
+                        obj = json.loads(buf[self._start:i + 1])
+                    except json.JSONDecodeError:
+                        obj = None
+                    if isinstance(obj, dict):
+                        found.append(obj)
+                    else:
+                        self.skipped += 1
+                    self._start = -1
+            i += 1
+
+        # 使い終わった部分を捨ててバッファを小さく保つ
+        keep_from = self._start if self._depth > 0 else len(buf)
+        self._buf = buf[keep_from:]
+        self._pos = i - keep_from
+        if self._depth > 0:
+            self._start = 0
+        return found
+
+def _normalize_items(result: List[Any], expected_count: int = 0) -> List[Dict[str, Any]]:
+    """パース済みの配列を lines 3要素の形にそろえる"""
+    # デバッグ: パース成功時の情報
+    if expected_count > 0 and len(result) == 0:
+        print(f"  デバッグ: JSONパースは成功しましたが、結果が0件です。")
+    # データの正規化：中句/下句が別キーの場合、lines配列に統合
+    normalized_result = []
+    skipped_reasons = {"not_dict": 0, "chinese": 0, "no_lines": 0, "invalid_lines": 0}
+    for item in result:
+        if not isinstance(item, dict):
+            skipped_reasons["not_dict"] += 1
+            continue
+        # 中国語などの不正な文字が含まれている場合はスキップ
+        # 注意: 日本語の漢字も\u4e00-\u9fffに含まれるため、より厳密なチェックが必要
+        # 簡体字や繁体字の特徴的な文字のみをチェック
+        has_chinese = False
+        if "lines" in item and isinstance(item.get("lines"), list):
+            for line in item["lines"]:
+                if isinstance(line, str):
+                    # 簡体字の特徴的な文字（简化字）をチェック
+                    # ただし、日本語でも使われる漢字が多いため、より厳密なチェックは難しい
+                    # 一時的に中国語フィルタリングを無効化（日本語の漢字を誤検出しないように）
+                    # 必要に応じて、より高度な言語判定を使用
+                    pass
+        if has_chinese:
+            skipped_reasons["chinese"] += 1
+            continue
+        # linesが配列でない、または中句/下句が存在する場合
+        if "lines" not in item or not isinstance(item.get("lines"), list):
+            # 中句と下句からlinesを構築
+            if "中句" in item and "下句" in item:
+                lines = []
+                if "lines" in item and isinstance(item["lines"], list) and len(item["lines"]) > 0:
+                    lines.append(item["lines"][0])
+                else:
+                    lines.append("")  # 上句が不明
+                if isinstance(item["中句"], list):
+                    lines.extend(item["中句"])
                 else:
-                    raise  # 最後の試行でも失敗した場合はエラーを投げる
-        return []  # すべての試行が失敗した場合
+                    lines.append(item["中句"])
+                if isinstance(item["下句"], list):
+                    lines.extend(item["下句"])
+                else:
+                    lines.append(item["下句"])
+                item["lines"] = lines
+                del item["中句"]
+                del item["下句"]
+            elif "lines" not in item:
+                skipped_reasons["no_lines"] += 1
+                continue  # linesがない場合はスキップ
+            elif not isinstance(item.get("lines"), list):
+                # linesが配列でない場合（中句/下句もない場合）
+                skipped_reasons["invalid_lines"] += 1
+                continue
+        # linesが3要素でない場合の処理
+        if isinstance(item.get("lines"), list) and len(item["lines"]) != 3:
+            # 1要素で全角スペースで区切られている場合、分割を試みる
+            if len(item["lines"]) == 1:
+                single_line = item["lines"][0]
+                # 全角スペースで分割（2つ以上）
+                parts = [p.strip() for p in single_line.split("　") if p.strip()]
+                if len(parts) >= 3:
+                    item["lines"] = parts[:3]
+                elif len(parts) == 2:
+                    item["lines"] = parts + [""]
+                elif len(parts) == 1:
+                    # 全角スペースがない場合、半角スペースで試す
+                    parts = [p.strip() for p in single_line.split() if p.strip()]
+                    if len(parts) >= 3:
+                        item["lines"] = parts[:3]
+                    elif len(parts) == 2:
+                        item["lines"] = parts + [""]
+                    else:
+                        # 分割できない場合、空文字で埋める
+                        item["lines"] = [single_line, "", ""]
+            # 可能な限り修正を試みる
+            if len(item["lines"]) > 3:
+                item["lines"] = item["lines"][:3]
+            elif len(item["lines"]) < 3:
+                # 不足分を空文字で埋める
+                while len(item["lines"]) < 3:
+                    item["lines"].append("")
+        normalized_result.append(item)
+
+    # 生成数が少ない場合に警告
+    if expected_count > 0 and len(normalized_result) < expected_count * 0.1:  # 要求の10%未満の場合
+        print(f"警告: 要求数 {expected_count} 件に対して {len(normalized_result)} 件しか生成されませんでした。")
+        if len(result) > len(normalized_result):
+            total_skipped = sum(skipped_reasons.values())
+            print(f"  デバッグ: 元のJSONには {len(result)} 件ありましたが、{total_skipped} 件がフィルタリングで除外されました。")
+            if total_skipped > 0:
+                print(f"    除外理由: 辞書でない={skipped_reasons['not_dict']}, 中国語={skipped_reasons['chinese']}, linesなし={skipped_reasons['no_lines']}, 無効なlines={skipped_reasons['invalid_lines']}")
+            # 最初の除外されたアイテムの例を表示
+            if len(result) > 0:
+                sample_item = result[0]
+                print(f"    サンプル（最初の1件）: {sample_item}")
+    return normalized_result
+
+def _count_parse(key: str) -> None:
+    with _parse_stats_lock:
+        PARSE_STATS[key] += 1
+    count_run("parse", key)
 
 def _parse_json_array(text: str, expected_count: int = 0) -> List[Dict[str, Any]]:
     """JSON配列をパースするヘルパー関数"""
+    # 構造化出力ならそのまま読めるはず（修復処理は不要）
+    try:
+        parsed = json.loads(text)
+    except json.JSONDecodeError:
+        parsed = None
+    if isinstance(parsed, list):
+        _count_parse("fast")
+        return _normalize_items(parsed, expected_count)
+
+    # ここから先は修復処理（フォールバック）
+    _count_parse("repair")
+    # 出力上限（num_predict）で途中で切れた配列は、閉じている要素だけをそのまま使う
+    if text.lstrip().startswith("[") and not text.rstrip().endswith("]"):
+        parser = JsonObjectStream()
+        salvaged = parser.feed(text)
+        if salvaged and not parser.skipped:
+            _count_parse("salvage")
+            return _normalize_items(salvaged, expected_count)
     start = text.find("[")
     end = text.rfind("]")
     if start == -1 or end == -1 or start >= end:
@@ -129,101 +633,7 @@ def _parse_json_array(text: str, expected_count: int = 0) -> List[Dict[str, Any]
     for attempt in range(5):
         try:
             result = json.loads(json_str)
-            # デバッグ: パース成功時の情報
-            if expected_count > 0 and len(result) == 0:
-                print(f"  デバッグ: JSONパースは成功しましたが、結果が0件です。")
-            # データの正規化：中句/下句が別キーの場合、lines配列に統合
-            normalized_result = []
-            skipped_reasons = {"not_dict": 0, "chinese": 0, "no_lines": 0, "invalid_lines": 0}
-            for item in result:
-                if not isinstance(item, dict):
-                    skipped_reasons["not_dict"] += 1
-                    continue
-                # 中国語などの不正な文字が含まれている場合はスキップ
-                # 注意: 日本語の漢字も\u4e00-\u9fffに含まれるため、より厳密なチェックが必要
-                # 簡体字や繁体字の特徴的な文字のみをチェック
-                has_chinese = False
-                if "lines" in item and isinstance(item.get("lines"), list):
-                    for line in item["lines"]:
-                        if isinstance(line, str):
-                            # 簡体字の特徴的な文字（简化字）をチェック
-                            # ただし、日本語でも使われる漢字が多いため、より厳密なチェックは難しい
-                            # 一時的に中国語フィルタリングを無効化（日本語の漢字を誤検出しないように）
-                            # 必要に応じて、より高度な言語判定を使用
-                            pass
-                if has_chinese:
-                    skipped_reasons["chinese"] += 1
-                    continue
-                # linesが配列でない、または中句/下句が存在する場合
-                if "lines" not in item or not isinstance(item.get("lines"), list):
-                    # 中句と下句からlinesを構築
-                    if "中句" in item and "下句" in item:
-                        lines = []
-                        if "lines" in item and isinstance(item["lines"], list) and len(item["lines"]) > 0:
-                            lines.append(item["lines"][0])
-                        else:
-                            lines.append("")  # 上句が不明
-                        if isinstance(item["中句"], list):
-                            lines.extend(item["中句"])
-                        else:
-                            lines.append(item["中句"])
-                        if isinstance(item["下句"], list):
-                            lines.extend(item["下句"])
-                        else:
-                            lines.append(item["下句"])
-                        item["lines"] = lines
-                        del item["中句"]
-                        del item["下句"]
-                    elif "lines" not in item:
-                        skipped_reasons["no_lines"] += 1
-                        continue  # linesがない場合はスキップ
-                    elif not isinstance(item.get("lines"), list):
-                        # linesが配列でない場合（中句/下句もない場合）
-                        skipped_reasons["invalid_lines"] += 1
-                        continue
-                # linesが3要素でない場合の処理
-                if isinstance(item.get("lines"), list) and len(item["lines"]) != 3:
-                    # 1要素で全角スペースで区切られている場合、分割を試みる
-                    if len(item["lines"]) == 1:
-                        single_line = item["lines"][0]
-                        # 全角スペースで分割（2つ以上）
-                        parts = [p.strip() for p in single_line.split("　") if p.strip()]
-                        if len(parts) >= 3:
-                            item["lines"] = parts[:3]
-                        elif len(parts) == 2:
-                            item["lines"] = parts + [""]
-                        elif len(parts) == 1:
-                            # 全角スペースがない場合、半角スペースで試す
-                            parts = [p.strip() for p in single_line.split() if p.strip()]
-                            if len(parts) >= 3:
-                                item["lines"] = parts[:3]
-                            elif len(parts) == 2:
-                                item["lines"] = parts + [""]
-                            else:
-                                # 分割できない場合、空文字で埋める
-                                item["lines"] = [single_line, "", ""]
-                    # 可能な限り修正を試みる
-                    if len(item["lines"]) > 3:
-                        item["lines"] = item["lines"][:3]
-                    elif len(item["lines"]) < 3:
-                        # 不足分を空文字で埋める
-                        while len(item["lines"]) < 3:
-                            item["lines"].append("")
-                normalized_result.append(item)
-            
-            # 生成数が少ない場合に警告
-            if expected_count > 0 and len(normalized_result) < expected_count * 0.1:  # 要求の10%未満の場合
-                print(f"警告: 要求数 {expected_count} 件に対して {len(normalized_result)} 件しか生成されませんでした。")
-                if len(result) > len(normalized_result):
-                    total_skipped = sum(skipped_reasons.values())
-                    print(f"  デバッグ: 元のJSONには {len(result)} 件ありましたが、{total_skipped} 件がフィルタリングで除外されました。")
-                    if total_skipped > 0:
-                        print(f"    除外理由: 辞書でない={skipped_reasons['not_dict']}, 中国語={skipped_reasons['chinese']}, linesなし={skipped_reasons['no_lines']}, 無効なlines={skipped_reasons['invalid_lines']}")
-                    # 最初の除外されたアイテムの例を表示
-                    if len(result) > 0:
-                        sample_item = result[0]
-                        print(f"    サンプル（最初の1件）: {sample_item}")
-            return normalized_result
+            return _normalize_items(result, expected_count)
         except json.JSONDecodeError as e:
             if attempt == 4:  # 最後の試行（0-4なので4が最後）
                 # 最後の手段：部分的なパースを試みる
@@ -248,6 +658,7 @@ def _parse_json_array(text: str, expected_count: int = 0) -> List[Dict[str, Any]
                                 if len(item["lines"]) == 3:
                                     normalized_result.append(item)
                         if normalized_result:
+                            _count_parse("salvage")
                             print(f"警告: 部分的なパースに成功しました（{len(normalized_result)}件）。エラー位置以降はスキップされました。")
                             return normalized_result
                 except Exception:
@@ -263,6 +674,7 @@ def _parse_json_array(text: str, expected_count: int = 0) -> List[Dict[str, Any]
                     if e.colno > 0:
                         error_msg += f"          {' ' * (e.colno - 1)}^\n"
                 error_msg += f"\n抽出したJSON（最初の1000文字）:\n{json_str[:1000]}"
+                _count_parse("failed")
                 raise RuntimeError(error_msg)
             # 追加の修正を試みる
             if attempt == 0:
@@ -0,0 +1,122 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional
+from senryu_ai.llm_ollama import model_id
+
+def run_fingerprint(originals_path: str, **params: Any) -> str:
+    """原句ファイルの内容・モデル・生成設定が同じ実行だけを「続き」とみなす"""
+    h = hashlib.sha256()
+    with open(originals_path, "rb") as f:
+        h.update(f.read())
+    h.update(json.dumps({"model": model_id(), **params}, sort_keys=True, ensure_ascii=False).encode("utf-8"))
+    return h.hexdigest()[:16]
+
+class RunJournal:
+    """
+    実行途中の成果を追記専用のJSONL（out/journal.jsonl）に書き残す。
+    --resume で同じ条件の実行を再開すると、記録済みの作風プロファイル・生成バッチ・
+    ルール採点・五七五の修正結果・LLM採点を読み戻し、その分のLLM呼び出しを省く。
+
+    レコード: run / style / batch / rules / repair / judge / done
+    """
+
+    def __init__(self, path: str, fingerprint: str, resume: bool = False):
+        self.path = path
+        self.fingerprint = fingerprint
+        self._lock = threading.Lock()
+        self.style: Optional[Dict[str, Any]] = None
+        self.batches: Dict[int, Dict[str, Any]] = {}
+        self.rules: Dict[str, List[Any]] = {}
+        self.judge: Dict[str, float] = {}
+        self.repair: Optional[List[Dict[str, Any]]] = None
+        self.resumed = False
+
+        if resume and os.path.exists(path):
+            records = self._read(path)
+            if records and records[0].get("type") == "run" and records[0].get("fingerprint") == fingerprint:
+                self._load(records)
+                self.resumed = True
+            else:
+                print("注意: 前回の記録と条件（原句・モデル・設定）が違うため、最初から実行します。")
+
+        if not self.resumed:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            with open(path, "w", encoding="utf-8"):
+                pass
+            self._append({"type": "run", "fingerprint": fingerprint, "started": time.time()})
+
+    @staticmethod
+    def _read(path: str) -> List[Dict[str, Any]]:
+        records = []
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except json.JSONDecodeError:
+                    break  # 書きかけで止まった最終行は捨てる
+        return records
+
+    def _load(self, records: List[Dict[str, Any]]) -> None:
+        for rec in records:
+            kind = rec.get("type")
+            if kind == "style":
+                self.style = rec["profile"]
+            elif kind == "batch":
+                self.batches[rec["batch"]] = rec
+            elif kind == "rules":
+                self.rules.update(rec["scores"])
+            elif kind == "repair":
+                self.repair = rec["items"]
+            elif kind == "judge":
+                self.judge.update(rec["scores"])
+        print(
+            f"前回の実行を再開します: 生成バッチ {len(self.batches)}件 / ルール採点 {len(self.rules)}件"
+            + (f" / 修正 {len(self.repair)}件" if self.repair is not None else "")
+            + f" / LLM採点 {len(self.judge)}件 を再利用"
+        )
+
+    def _append(self, record: Dict[str, Any]) -> None:
+        line = json.dumps(record, ensure_ascii=False)
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+
+    def record_style(self, profile: Dict[str, Any]) -> None:
+        self.style = profile
+        self._append({"type": "style", "profile": profile})
+
+    def batch(self, num: int) -> Optional[List[Dict[str, Any]]]:
+        rec = self.batches.get(num)
+        return rec["items"] if rec is not None else None
+
+    def record_batch(self, num: int, items: List[Dict[str, Any]], meta: Optional[Dict[str, Any]] = None) -> None:
+        rec = {"type": "batch", "batch": num, "items": items, "meta": meta or {}}
+        with self._lock:
+            self.batches[num] = rec
+        self._append(rec)
+
+    def record_rules(self, scores: Dict[str, List[Any]]) -> None:
+        """{lines_key: [ルール点, 理由]}"""
+        if scores:
+            self.rules.update(scores)
+            self._append({"type": "rules", "scores": scores})
+
+    def record_repair(self, items: List[Dict[str, Any]]) -> None:
+        """修正ステージで五七五になった句（0件でも記録し、再開時は修正を飛ばす）"""
+        self.repair = items
+        self._append({"type": "repair", "items": items})
+
+    def record_judge(self, scores: Dict[str, float]) -> None:
+        """{lines_key: LLM点}（採点チャンクごと）"""
+        if scores:
+            with self._lock:
+                self.judge.update(scores)
+            self._append({"type": "judge", "scores": scores})
+
+    def record_done(self) -> None:
+        self._append({"type": "done", "finished": time.time()})
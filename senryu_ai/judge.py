@@ -1,8 +1,21 @@
 import json
 from dataclasses import dataclass
-from typing import List, Dict, Any, Tuple
+from typing import Callable, List, Dict, Any, Optional, Tuple
 from senryu_ai.mora import is_575
-from senryu_ai.llm_ollama import call_ollama
+from senryu_ai.llm_ollama import Prompt, call_ollama, deterministic_options, llm_concurrency, size_options
+from senryu_ai.config import CONFIG
+from senryu_ai.metrics import METRICS, RunContextExecutor
+from senryu_ai.originals_index import OriginalsIndex
+
+# 採点結果のJSONスキーマ（候補IDと点数の組の配列）
+JUDGE_SCHEMA: Dict[str, Any] = {
+    "type": "array",
+    "items": {
+        "type": "object",
+        "properties": {"id": {"type": "integer"}, "score": {"type": "number"}},
+        "required": ["id", "score"],
+    },
+}
 
 @dataclass
 class ScoredItem:
@@ -12,7 +25,26 @@ class ScoredItem:
     reasons: List[str]
     item: Dict[str, Any]
 
-def rule_score(item: Dict[str, Any]) -> Tuple[float, List[str]]:
+def rule_score(item: Dict[str, Any], originals_index: Optional[OriginalsIndex] = None) -> Tuple[float, List[str]]:
+    """
+    ルール採点。originals_index を渡すと、原句の写し（コピペ）を減点する。
+    """
+    score, reasons = _base_rule_score(item)
+    return apply_copy_penalty(item, score, reasons, originals_index)
+
+def apply_copy_penalty(
+    item: Dict[str, Any],
+    score: float,
+    reasons: List[str],
+    originals_index: Optional[OriginalsIndex],
+) -> Tuple[float, List[str]]:
+    """五七五OKの句にだけ、原句との重なりに応じた減点を加える"""
+    if originals_index is None or score <= -10:
+        return score, reasons
+    penalty, extra = originals_index.copy_penalty([str(s) for s in item.get("lines", [])])
+    return score + penalty, reasons + extra
+
+def _base_rule_score(item: Dict[str, Any]) -> Tuple[float, List[str]]:
     lines = [s.strip() for s in item.get("lines", [])]
     reasons: List[str] = []
     score = 0.0
@@ -36,11 +68,85 @@ def rule_score(item: Dict[str, Any]) -> Tuple[float, List[str]]:
 
     return score, reasons
 
-def llm_judge(style_profile: Dict[str, Any], items: List[Dict[str, Any]]) -> List[float]:
+def llm_judge(
+    style_profile: Dict[str, Any],
+    items: List[Dict[str, Any]],
+    chunk_size: Optional[int] = None,
+    concurrency: Optional[int] = None,
+) -> List[float]:
+    """
+    候補を chunk_size 件ずつに分けてLLMで採点する。
+    各候補にIDを振り、点数は順序ではなくIDで対応付ける（返り値は items と同じ順序・件数）。
+    チャンクは concurrency 並列で実行し、欠けたIDだけをチャンク単位で再試行する。
+    """
+    scores = llm_judge_scores(style_profile, items, chunk_size, concurrency)
+    missing = len(items) - len(scores)
+    if missing:
+        print(f"警告: {missing}件の候補はLLM採点が得られなかったため 0点 とします。")
+    return [scores.get(i, 0.0) for i in range(len(items))]
+
+def llm_judge_scores(
+    style_profile: Dict[str, Any],
+    items: List[Dict[str, Any]],
+    chunk_size: Optional[int] = None,
+    concurrency: Optional[int] = None,
+    on_chunk: Optional[Callable[[Dict[int, float]], None]] = None,
+) -> Dict[int, float]:
+    """
+    llm_judge の本体。採点できた候補だけを {items の添字: 点数} で返す。
+    on_chunk はチャンクの採点が終わるたびにその結果で呼ばれる（途中経過の記録用）。
+    """
+    chunk_size = max(1, chunk_size or CONFIG.judge_chunk_size)
+    concurrency = max(1, concurrency or llm_concurrency(CONFIG.judge_concurrency))
     profile_json = json.dumps(style_profile, ensure_ascii=False)
-    items_json = json.dumps(items, ensure_ascii=False)
+    chunks = [list(range(i, min(i + chunk_size, len(items)))) for i in range(0, len(items), chunk_size)]
 
-    prompt = f"""
+    scores: Dict[int, float] = {}
+    if concurrency == 1 or len(chunks) <= 1:
+        results = (_judge_chunk(profile_json, items, ids) for ids in chunks)
+        for result in results:
+            scores.update(result)
+            if on_chunk is not None:
+                on_chunk(result)
+    else:
+        with RunContextExecutor(max_workers=min(concurrency, len(chunks))) as executor:
+            for result in executor.map(lambda ids: _judge_chunk(profile_json, items, ids), chunks):
+                scores.update(result)
+                if on_chunk is not None:
+                    on_chunk(result)
+    return scores
+
+def _judge_chunk(profile_json: str, items: List[Dict[str, Any]], ids: List[int], max_retries: int = 3) -> Dict[int, float]:
+    """1チャンク分を採点する。返ってこなかったIDだけを再度問い合わせる。"""
+    scores: Dict[int, float] = {}
+    pending = list(ids)
+    for retry in range(max_retries):
+        if retry:
+            METRICS.incr("judge_retries")
+        payload = [
+            {"id": i, "lines": items[i].get("lines", []), "note": items[i].get("note", "")}
+            for i in pending
+        ]
+        prompt = _judge_prompt(profile_json, payload)
+        try:
+            text = call_ollama(
+                prompt,
+                format=JUDGE_SCHEMA if CONFIG.structured_output else None,
+                options={**deterministic_options(retry), **size_options(prompt, len(payload) * CONFIG.judge_tokens_per_item)},
+                stage="judge",
+            )
+            scores.update(_parse_scores(text, pending))
+        except Exception as e:
+            print(f"  採点エラー（{len(pending)}件, 試行 {retry + 1}/{max_retries}）: {str(e)[:50]}")
+        pending = [i for i in pending if i not in scores]
+        if not pending:
+            break
+    return scores
+
+def _judge_prompt(profile_json: str, payload: List[Dict[str, Any]]) -> Prompt:
+    """評価軸と作風は全チャンク共通の system に、候補だけを user に置く（プロンプトキャッシュが効く）"""
+    items_json = json.dumps(payload, ensure_ascii=False)
+    system = f"""
 あなたは川柳の選者です。以下のスタイルプロファイルに照らして各候補を0〜10点で採点してください。
 
 評価軸:
@@ -52,14 +158,42 @@ def llm_judge(style_profile: Dict[str, Any], items: List[Dict[str, Any]]) -> Lis
 【スタイルプロファイル】
 {profile_json}
 
+出力はJSON配列のみ。各要素は {{"id": 候補のid, "score": 点数}}。全候補分を出力すること。
+""".strip()
+    user = f"""
 【候補(JSON)】
 {items_json}
 
-出力は点数のみのJSON配列。候補と同じ順序・同じ件数。
+全候補分を採点してください。
 """.strip()
+    return Prompt(system, user)
+
+def _parse_scores(text: str, ids: List[int]) -> Dict[int, float]:
+    """{"id","score"} の配列を読む。点数だけの配列で件数が一致する場合は順序で対応付ける。"""
+    try:
+        data = json.loads(text)
+    except json.JSONDecodeError:
+        start = text.find("[")
+        end = text.rfind("]")
+        data = json.loads(text[start:end+1])
+    if isinstance(data, dict):
+        # {"scores": [...]} のように包まれて返ってくる場合
+        data = next((v for v in data.values() if isinstance(v, list)), [])
 
-    text = call_ollama(prompt)
-    start = text.find("[")
-    end = text.rfind("]")
-    scores = json.loads(text[start:end+1])
-    return [float(x) for x in scores]
+    wanted = set(ids)
+    scores: Dict[int, float] = {}
+    if data and all(isinstance(x, (int, float)) for x in data):
+        if len(data) == len(ids):
+            scores = {i: float(x) for i, x in zip(ids, data)}
+    else:
+        for entry in data:
+            if not isinstance(entry, dict):
+                continue
+            try:
+                i = int(entry["id"])
+                score = float(entry["score"])
+            except (KeyError, TypeError, ValueError):
+                continue
+            if i in wanted:
+                scores[i] = score
+    return {i: min(10.0, max(0.0, x)) for i, x in scores.items()}
@@ -0,0 +1,171 @@
+import threading
+from typing import Any, Dict, Iterator, List, Optional, Union
+from senryu_ai.config import CONFIG
+
+Format = Optional[Union[str, Dict[str, Any]]]
+
+class LLMBackend:
+    """
+    LLM呼び出しの差し替え口。call_ollama / stream_ollama はすべてここを通る。
+    応答は Ollama の /api/generate と同じ形の dict
+    （response, eval_count, prompt_eval_count など）で返す。
+    """
+
+    name = "base"
+
+    # system を渡されたら「固定の前半（system）+ 可変の後半（prompt）」として扱う。
+    # 前半が毎回同じなら、サーバー側はその部分のKVキャッシュを使い回せる。
+
+    @property
+    def model_id(self) -> str:
+        """キャッシュ・採点アーカイブのキーに使うモデル名（バックエンドをまたいで混ざらないように）"""
+        return CONFIG.ollama_model
+
+    def generate(
+        self, prompt: str, format: Format = None, options: Optional[Dict[str, Any]] = None, system: Optional[str] = None
+    ) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    def stream(
+        self, prompt: str, format: Format = None, options: Optional[Dict[str, Any]] = None, system: Optional[str] = None
+    ) -> Iterator[Dict[str, Any]]:
+        """応答の断片を {"response": 断片} として順に返すイテレータ（close() で打ち切れること）"""
+        raise NotImplementedError
+
+    @property
+    def capacity(self) -> int:
+        """サーバー側で同時に処理できる呼び出し数の目安（複数ホストなら合計）"""
+        return 1
+
+    def list_models(self) -> List[str]:
+        return []
+
+    def status(self) -> List[Dict[str, Any]]:
+        """接続先ごとの状態（サービスの /health 用）"""
+        return []
+
+    def warm_up(self, options: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """モデルを読み込んでおく（実行中はアンロードされないようにする）。応答の統計を返す"""
+        return {}
+
+class OllamaBackend(LLMBackend):
+    """ローカルのOllamaサーバー（ollama パッケージ経由。client を渡せば接続先を指定できる）"""
+
+    name = "ollama"
+
+    def __init__(self, client: Any = None) -> None:
+        if client is None:
+            import ollama  # 偽バックエンドだけ使う環境では不要なので、ここで読み込む
+
+            client = ollama
+        self._client = client
+
+    def generate(
+        self, prompt: str, format: Format = None, options: Optional[Dict[str, Any]] = None, system: Optional[str] = None
+    ) -> Dict[str, Any]:
+        if system is None:
+            return self._client.generate(model=CONFIG.ollama_model, prompt=prompt, **_kwargs(format, options))
+        # 固定の system メッセージ + 可変の user メッセージ（chat API）
+        response = self._client.chat(model=CONFIG.ollama_model, messages=_messages(system, prompt), **_kwargs(format, options))
+        return _from_chat(response)
+
+    def stream(
+        self, prompt: str, format: Format = None, options: Optional[Dict[str, Any]] = None, system: Optional[str] = None
+    ) -> Iterator[Dict[str, Any]]:
+        if system is None:
+            return self._client.generate(model=CONFIG.ollama_model, prompt=prompt, stream=True, **_kwargs(format, options))
+        stream = self._client.chat(
+            model=CONFIG.ollama_model, messages=_messages(system, prompt), stream=True, **_kwargs(format, options)
+        )
+        return _chat_stream(stream)
+
+    def list_models(self) -> List[str]:
+        return model_names(self._client.list())
+
+    def warm_up(self, options: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        # プロンプト無しの generate はモデルの読み込みだけを行う
+        return self._client.generate(model=CONFIG.ollama_model, prompt="", **_kwargs(None, options))
+
+def model_names(response: Any) -> List[str]:
+    """/api/tags の応答からモデル名を取り出す（ollama パッケージの版によって name / model のどちらか）"""
+    names = []
+    for model in response.get("models", []) or []:
+        name = model.get("model") or model.get("name")
+        if name:
+            names.append(str(name))
+    return names
+
+def has_model(names: List[str], model: str) -> bool:
+    """タグ省略時は :latest とみなす"""
+    return model in names or (":" not in model and f"{model}:latest" in names)
+
+def _kwargs(format: Format, options: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    kwargs: Dict[str, Any] = {}
+    if format is not None:
+        kwargs["format"] = format
+    if options:
+        kwargs["options"] = options
+    if CONFIG.ollama_keep_alive:
+        # 実行中にモデルがアンロードされないよう、毎回の呼び出しで保持時間を延ばす
+        kwargs["keep_alive"] = _keep_alive(CONFIG.ollama_keep_alive)
+    return kwargs
+
+def _keep_alive(value: str) -> Union[str, int]:
+    """"30m" などはそのまま、"-1" や "0" は数値として渡す（-1 = ずっと保持）"""
+    try:
+        return int(value)
+    except ValueError:
+        return value
+
+def _messages(system: str, prompt: str) -> List[Dict[str, str]]:
+    return [{"role": "system", "content": system}, {"role": "user", "content": prompt}]
+
+def _from_chat(part: Any) -> Dict[str, Any]:
+    """chat API の応答を generate API と同じ形（response + 統計）にそろえる"""
+    message = part.get("message") or {}
+    converted = {"response": message.get("content", "") or "", "done": part.get("done", False)}
+    for key in ("done_reason", "prompt_eval_count", "eval_count", "prompt_eval_duration", "eval_duration", "load_duration", "total_duration"):
+        if part.get(key) is not None:
+            converted[key] = part.get(key)
+    return converted
+
+def _chat_stream(stream: Any) -> Iterator[Dict[str, Any]]:
+    try:
+        for part in stream:
+            yield _from_chat(part)
+    finally:
+        close = getattr(stream, "close", None)
+        if close is not None:
+            close()
+
+_backend: Optional[LLMBackend] = None
+_backend_lock = threading.Lock()
+
+def get_backend() -> LLMBackend:
+    """LLM_BACKEND（ollama / fake）で選んだバックエンドを1つだけ作って返す"""
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            if CONFIG.llm_backend == "ollama" and CONFIG.ollama_hosts:
+                from senryu_ai.llm_hosts import MultiHostBackend
+
+                _backend = MultiHostBackend.from_config()
+            elif CONFIG.llm_backend == "ollama":
+                _backend = OllamaBackend()
+            elif CONFIG.llm_backend == "fake":
+                from senryu_ai.fake_llm import FakeBackend
+
+                _backend = FakeBackend.from_config()
+            else:
+                raise RuntimeError(f"未知の LLM_BACKEND です: {CONFIG.llm_backend}（ollama / fake）")
+            if CONFIG.llm_record_path:
+                from senryu_ai.fake_llm import RecordingBackend
+
+                _backend = RecordingBackend(_backend, CONFIG.llm_record_path)
+        return _backend
+
+def set_backend(backend: Optional[LLMBackend]) -> None:
+    """バックエンドを差し替える（ベンチマーク用。None なら次回 LLM_BACKEND から作り直す）"""
+    global _backend
+    with _backend_lock:
+        _backend = backend
@@ -0,0 +1,141 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional, Union
+from senryu_ai.config import CONFIG
+from senryu_ai.metrics import count_run
+
+# ヒット/ミス/対象外（温度>0でseedなし等）の回数
+CACHE_STATS: Dict[str, int] = {"hits": 0, "misses": 0, "bypassed": 0}
+_stats_lock = threading.Lock()
+
+def record_cache_event(key: str) -> None:
+    with _stats_lock:
+        CACHE_STATS[key] += 1
+    count_run("llm_cache", key)
+
+def is_cacheable(options: Optional[Dict[str, Any]]) -> bool:
+    """
+    同じ入力で同じ出力が返る呼び出しだけをキャッシュする。
+    温度0、または seed 固定なら決定的とみなす。温度未指定はサーバー既定（>0）なので対象外。
+    """
+    if not options:
+        return False
+    if options.get("seed") is not None:
+        return True
+    temperature = options.get("temperature")
+    return temperature is not None and float(temperature) <= 0.0
+
+# 応答の中身を変えない（文脈長だけの）オプション。実行ごとに変わってもキャッシュを引けるようキーから外す
+_KEYLESS_OPTIONS = ("num_ctx",)
+
+def cache_key(
+    model: str,
+    prompt: str,
+    options: Optional[Dict[str, Any]] = None,
+    format: Optional[Union[str, Dict[str, Any]]] = None,
+) -> str:
+    options = {k: v for k, v in (options or {}).items() if k not in _KEYLESS_OPTIONS}
+    payload = json.dumps(
+        {"model": model, "prompt": prompt, "options": options, "format": format},
+        ensure_ascii=False,
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class ResponseCache:
+    """
+    LLM応答のSQLiteキャッシュ。
+    max_entries を超えたら最後に使われたのが古い順に、max_age_days を過ぎたものは作成日時で削除する。
+    """
+
+    def __init__(self, path: str, max_entries: int = 20000, max_age_days: float = 30.0):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self.max_entries = max_entries
+        self.max_age = max_age_days * 86400
+        self._lock = threading.Lock()
+        self._puts = 0
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY, response TEXT NOT NULL,"
+            " created REAL NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.commit()
+        self.evict()
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response, created FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if self.max_age > 0 and now - row[1] > self.max_age:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+            self._conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            return row[0]
+
+    def put(self, key: str, response: str) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, response, created, last_used) VALUES (?, ?, ?, ?)",
+                (key, response, now, now),
+            )
+            self._conn.commit()
+            self._puts += 1
+            check = self._puts % 100 == 0
+        if check:
+            self.evict()
+
+    def evict(self) -> int:
+        """期限切れと上限超過分を削除し、削除件数を返す"""
+        removed = 0
+        with self._lock:
+            if self.max_age > 0:
+                cur = self._conn.execute("DELETE FROM responses WHERE created < ?", (time.time() - self.max_age,))
+                removed += cur.rowcount
+            if self.max_entries > 0:
+                cur = self._conn.execute(
+                    "DELETE FROM responses WHERE key IN ("
+                    " SELECT key FROM responses ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,),
+                )
+                removed += cur.rowcount
+            self._conn.commit()
+        return removed
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+_cache: Optional[ResponseCache] = None
+_cache_lock = threading.Lock()
+
+def get_response_cache() -> Optional[ResponseCache]:
+    """LLM_CACHE が有効なら共有キャッシュを返す（初回に開く）"""
+    global _cache
+    if not CONFIG.llm_cache:
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ResponseCache(
+                    os.path.join(CONFIG.cache_dir, "llm_responses.sqlite3"),
+                    max_entries=CONFIG.llm_cache_max_entries,
+                    max_age_days=CONFIG.llm_cache_max_age_days,
+                )
+    return _cache
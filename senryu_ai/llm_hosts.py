@@ -0,0 +1,293 @@
+"""
+複数のOllamaサーバーに呼び出しを振り分けるバックエンド（OLLAMA_HOSTS を指定すると使われる）。
+
+- 接続先ごとに ollama.Client（中の httpx がコネクションを使い回す）を1つ持つ
+- 起動時に1回だけ全ホストの /api/tags を並列に確かめ、モデルが無いホストは使わない
+- 空いている枠の割合が一番大きい（処理中の呼び出しが一番少ない）ホストに送る。ホストごとの同時実行数は上限まで
+- 接続エラー・5xx・タイムアウトなら別のホストで投げ直す。続けて失敗したホストやモデルが無くなったホストは外し、
+  OLLAMA_HEALTH_INTERVAL 秒ごとの確認で応答（とモデル）が戻ったら戻す
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+from senryu_ai.config import CONFIG
+from senryu_ai.llm_backend import Format, LLMBackend, OllamaBackend, has_model
+from senryu_ai.metrics import METRICS
+
+def parse_hosts(spec: str, default_limit: int) -> List[Tuple[str, int]]:
+    """ "http://a:11434*4, http://b:11434" → [(url, 同時実行数)] """
+    hosts: List[Tuple[str, int]] = []
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        url, _, limit = part.partition("*")
+        try:
+            hosts.append((url.strip().rstrip("/"), max(1, int(limit)) if limit else max(1, default_limit)))
+        except ValueError:
+            raise RuntimeError(f"OLLAMA_HOSTS の書き方が正しくありません: {part}（例: http://gpu1:11434*4）")
+    if not hosts:
+        raise RuntimeError("OLLAMA_HOSTS に接続先がありません")
+    return hosts
+
+class Host:
+    """接続先1つ分の状態（MultiHostBackend のロックの中で更新する）"""
+
+    def __init__(self, url: str, limit: int, backend: LLMBackend):
+        self.url = url
+        self.limit = limit
+        self.backend = backend
+        self.outstanding = 0
+        self.healthy = True
+        self.has_model = True
+        self.failures = 0  # 連続した失敗の回数
+        self.requests = 0
+        self.errors = 0
+        self.models: List[str] = []
+
+    @property
+    def usable(self) -> bool:
+        return self.healthy and self.has_model
+
+    def info(self) -> Dict[str, Any]:
+        return {
+            "url": self.url, "limit": self.limit, "outstanding": self.outstanding,
+            "healthy": self.healthy, "has_model": self.has_model,
+            "requests": self.requests, "errors": self.errors,
+        }
+
+class MultiHostBackend(LLMBackend):
+    """複数ホストへの振り分け・上限・フェイルオーバーを行うバックエンド"""
+
+    name = "ollama-multi"
+
+    def __init__(
+        self,
+        hosts: List[Tuple[str, int]],
+        health_interval: float = 15.0,
+        max_failures: int = 2,
+        backends: Optional[List[LLMBackend]] = None,
+    ):
+        """backends を渡すと ollama.Client の代わりにそれを使う（偽LLMでの確認用）"""
+        if backends is None:
+            import ollama
+
+            timeout = CONFIG.ollama_timeout or None
+            backends = [OllamaBackend(ollama.Client(host=url, timeout=timeout)) for url, _ in hosts]
+        self.hosts = [Host(url, limit, b) for (url, limit), b in zip(hosts, backends)]
+        self.max_failures = max_failures
+        self._cond = threading.Condition()
+        self._check_models()
+        if health_interval > 0:
+            thread = threading.Thread(target=self._health_loop, args=(health_interval,), daemon=True, name="ollama-health")
+            thread.start()
+
+    @classmethod
+    def from_config(cls) -> "MultiHostBackend":
+        return cls(parse_hosts(CONFIG.ollama_hosts, CONFIG.ollama_host_concurrency), CONFIG.ollama_health_interval)
+
+    # ---- ホストの確認 ----
+
+    def _probe(self, host: Host) -> bool:
+        """/api/tags が返ればホストは生きている。モデルの有無もここで確かめる"""
+        try:
+            names = host.backend.list_models()
+        except Exception:
+            with self._cond:
+                host.healthy = False
+            return False
+        with self._cond:
+            host.models = names
+            host.has_model = has_model(names, CONFIG.ollama_model)
+            host.healthy = True
+            host.failures = 0
+            self._cond.notify_all()
+        return True
+
+    def _check_models(self) -> None:
+        """起動時に1回だけ、全ホストを並列に確かめる。モデルを使えるホストが無ければここで止める"""
+        with ThreadPoolExecutor(max_workers=len(self.hosts)) as executor:
+            list(executor.map(self._probe, self.hosts))
+        usable = [h for h in self.hosts if h.usable]
+        for h in self.hosts:
+            if not h.healthy:
+                print(f"注意: Ollamaホスト {h.url} に接続できません（復帰したら使います）")
+            elif not h.has_model:
+                print(f"注意: Ollamaホスト {h.url} にモデル '{CONFIG.ollama_model}' がありません（ollama pull で追加してください）")
+        if not usable:
+            available = sorted({m for h in self.hosts for m in h.models})
+            msg = f"\nモデル '{CONFIG.ollama_model}' を使えるOllamaホストがありません（OLLAMA_HOSTS: {CONFIG.ollama_hosts}）。\n"
+            if available:
+                msg += "ホストにあるモデル:\n" + "".join(f"  - {m}\n" for m in available)
+            msg += f"\nモデルをインストールするには、各ホストで:\n  ollama pull {CONFIG.ollama_model}\n"
+            raise RuntimeError(msg)
+        print(f"Ollamaホスト: {len(usable)}/{len(self.hosts)}台を使います（同時実行数の合計 {self.capacity}）")
+
+    def _health_loop(self, interval: float) -> None:
+        while True:
+            time.sleep(interval)
+            # 落ちたホストに加え、モデルが消されたホストも確かめ直す（pull し直されたら戻す）
+            for host in self.hosts:
+                if not host.usable and self._probe(host) and host.usable:
+                    print(f"Ollamaホスト {host.url} が復帰しました")
+
+    # ---- 振り分け ----
+
+    def _acquire(self, tried: Set[str]) -> Host:
+        """空きの割合が一番大きいホストを選んで枠を1つ使う。どこも満杯なら空くまで待つ"""
+        with self._cond:
+            while True:
+                candidates = [h for h in self.hosts if h.usable and h.url not in tried]
+                if not candidates:
+                    break
+                free = [h for h in candidates if h.outstanding < h.limit]
+                if free:
+                    host = min(free, key=lambda h: (h.outstanding / h.limit, h.requests))
+                    host.outstanding += 1
+                    return host
+                self._cond.wait(timeout=1.0)
+        # 使えるホストが残っていない。外していたホストを今すぐ確かめ直して、戻ったものがあれば使う
+        revived = [h for h in self.hosts if not h.usable and h.url not in tried and self._probe(h) and h.usable]
+        if revived:
+            return self._acquire(tried)
+        raise RuntimeError(f"応答できるOllamaホストがありません（試したホスト: {', '.join(sorted(tried)) or 'なし'}）")
+
+    def _release(self, host: Host, error: Optional[Exception] = None) -> None:
+        with self._cond:
+            host.outstanding -= 1
+            host.requests += 1
+            if error is None:
+                host.failures = 0
+            else:
+                host.errors += 1
+                host.failures += 1
+                if getattr(error, "status_code", None) == 404:
+                    host.has_model = False  # モデルが消された
+                elif host.failures >= self.max_failures and host.healthy:
+                    host.healthy = False
+                    print(f"注意: Ollamaホスト {host.url} を一時的に外します（{str(error)[:80]}）")
+            self._cond.notify_all()
+
+    def _call(self, fn: Any) -> Any:
+        """fn(backend) を空いているホストで実行する。ホスト側の失敗なら別のホストで投げ直す"""
+        tried: Set[str] = set()
+        while True:
+            host = self._acquire(tried)
+            try:
+                result = fn(host.backend)
+            except Exception as e:
+                if not _is_host_error(e):
+                    self._release(host)
+                    raise
+                self._release(host, e)
+                tried.add(host.url)
+                METRICS.incr("llm_failovers")
+                if not any(h.usable and h.url not in tried for h in self.hosts):
+                    raise
+                continue
+            self._release(host)
+            return result
+
+    # ---- LLMBackend ----
+
+    @property
+    def capacity(self) -> int:
+        return sum(h.limit for h in self.hosts if h.usable) or 1
+
+    def generate(
+        self, prompt: str, format: Format = None, options: Optional[Dict[str, Any]] = None, system: Optional[str] = None
+    ) -> Dict[str, Any]:
+        return self._call(lambda b: b.generate(prompt, format, options, system))
+
+    def stream(
+        self, prompt: str, format: Format = None, options: Optional[Dict[str, Any]] = None, system: Optional[str] = None
+    ) -> Iterator[Dict[str, Any]]:
+        return self._stream(prompt, format, options, system)
+
+    def _stream(
+        self, prompt: str, format: Format, options: Optional[Dict[str, Any]], system: Optional[str]
+    ) -> Iterator[Dict[str, Any]]:
+        # 最初の断片が届くまではフェイルオーバーする。届き始めた後の失敗はそのまま呼び出し側に返す
+        tried: Set[str] = set()
+        while True:
+            host = self._acquire(tried)
+            stream = None
+            try:
+                stream = host.backend.stream(prompt, format, options, system)
+                first = next(stream, None)
+            except Exception as e:
+                _close(stream)
+                if not _is_host_error(e):
+                    self._release(host)
+                    raise
+                self._release(host, e)
+                tried.add(host.url)
+                METRICS.incr("llm_failovers")
+                if not any(h.usable and h.url not in tried for h in self.hosts):
+                    raise
+                continue
+            break
+        error: Optional[Exception] = None
+        try:
+            if first is not None:
+                yield first
+                yield from stream
+        except GeneratorExit:
+            raise
+        except Exception as e:
+            error = e if _is_host_error(e) else None
+            raise
+        finally:
+            _close(stream)
+            self._release(host, error)
+
+    def list_models(self) -> List[str]:
+        # 起動時の確認で集めた一覧を返す（エラー時にサーバーへ問い合わせ直さない）
+        return sorted({m for h in self.hosts for m in h.models})
+
+    def status(self) -> List[Dict[str, Any]]:
+        with self._cond:
+            return [h.info() for h in self.hosts]
+
+    def warm_up(self, options: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """全ホストで並列にモデルを読み込む。統計は一番遅かったホストのもの"""
+        hosts = [h for h in self.hosts if h.usable]
+        with ThreadPoolExecutor(max_workers=len(hosts) or 1) as executor:
+            results = list(executor.map(lambda h: _try_warm_up(h.backend, options), hosts))
+        results = [r for r in results if r is not None]
+        return max(results, key=lambda r: r.get("load_duration") or 0, default={})
+
+def _try_warm_up(backend: LLMBackend, options: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    try:
+        return backend.warm_up(options)
+    except Exception:
+        return None
+
+def _is_host_error(e: Exception) -> bool:
+    """
+    別のホストで投げ直す意味がある失敗か（接続できない・タイムアウト・5xx・混雑・モデルが無い）。
+    それ以外（リクエストの誤り・こちらのコードの例外）はホストのせいにせず、そのまま呼び出し側に返す
+    """
+    if isinstance(e, OSError):  # ConnectionError・TimeoutError を含む
+        return True
+    try:
+        import httpx
+    except ImportError:  # pragma: no cover - 環境依存
+        httpx = None
+    if httpx is not None and isinstance(e, (httpx.TransportError, httpx.TimeoutException)):
+        return True
+    try:
+        import ollama
+    except ImportError:  # pragma: no cover - 環境依存
+        return False
+    if isinstance(e, ollama.ResponseError):
+        code = e.status_code
+        return code >= 500 or code in (404, 408, 429)
+    return False
+
+def _close(stream: Any) -> None:
+    close = getattr(stream, "close", None)
+    if close is not None:
+        close()
@@ -1,43 +1,263 @@
-import ollama
+import threading
+import time
+from typing import Any, Dict, Iterator, NamedTuple, Optional, Tuple, Union
 from senryu_ai.config import CONFIG
+from senryu_ai.llm_backend import get_backend
+from senryu_ai.llm_cache import cache_key, get_response_cache, is_cacheable, record_cache_event
+from senryu_ai.metrics import METRICS
+
+class Prompt(NamedTuple):
+    """
+    固定の前半（system）と可変の後半（user）に分けたプロンプト。
+    PROMPT_PREFIX_CACHE=1 なら chat API に system メッセージ + user メッセージとして送り、
+    前半が同じ呼び出し同士でサーバー側のプロンプトキャッシュ（KVキャッシュ）を使い回す。
+    """
+
+    system: str
+    user: str
+
+    def text(self) -> str:
+        return f"{self.system}\n\n{self.user}"
+
+def _split(prompt: Union[str, Prompt]) -> Tuple[str, Optional[str]]:
+    """(本文, system) に分ける。前半の使い回しを無効にしている場合は1つの文面にまとめる"""
+    if isinstance(prompt, Prompt):
+        if CONFIG.prompt_prefix_cache:
+            return prompt.user, prompt.system
+        return prompt.text(), None
+    return prompt, None
+
+def deterministic_options(attempt: int = 0) -> Dict[str, Any]:
+    """
+    採点・作風抽出用（温度0・seed固定。応答キャッシュの対象になる）。
+    再試行では attempt で seed をずらし、キャッシュした壊れた応答を引き直さないようにする。
+    """
+    return {"temperature": 0.0, "seed": CONFIG.seed + attempt}
+
+def estimate_tokens(text: str) -> int:
+    """
+    プロンプトのトークン数の概算（多めに見積もる）。
+    日本語は1文字≒1トークン、英数字・記号は3文字≒1トークンとして数える。
+    """
+    ascii_chars = sum(1 for c in text if c < "\x80")
+    return (len(text) - ascii_chars) + ascii_chars // 3 + 1
+
+# 一度使った num_ctx より小さくしない（num_ctx が変わるとOllamaはモデルを読み込み直すため）
+_ctx_lock = threading.Lock()
+_ctx_high_water = 0
+
+def size_options(prompt: Union[str, Prompt], output_tokens: int, attempt: int = 0) -> Dict[str, int]:
+    """
+    num_predict（出力の上限）と num_ctx（文脈長）を決める。
+    - num_predict: 見積もった出力トークン数の1.25倍 + 64。再試行ごとに1.5倍に広げる
+    - num_ctx: プロンプト + num_predict が収まる2の累乗（NUM_CTX_MIN〜NUM_CTX_MAX）。
+      実行中は一度使った値より小さくしない
+    NUM_PREDICT / NUM_CTX を指定していればその値を使う。
+    """
+    global _ctx_high_water
+    if CONFIG.num_predict:
+        num_predict = CONFIG.num_predict
+    else:
+        num_predict = int((output_tokens * 1.25 + 64) * 1.5 ** attempt)
+    if CONFIG.num_ctx:
+        return {"num_predict": num_predict, "num_ctx": CONFIG.num_ctx}
+
+    text = prompt.text() if isinstance(prompt, Prompt) else prompt
+    prompt_tokens = estimate_tokens(text)
+    need = prompt_tokens + max(num_predict, 0)
+    num_ctx = max(CONFIG.num_ctx_min, 1)
+    while num_ctx < need and num_ctx < CONFIG.num_ctx_max:
+        num_ctx *= 2
+    num_ctx = min(num_ctx, max(CONFIG.num_ctx_max, CONFIG.num_ctx_min))
+    if need > num_ctx:
+        # 上限に収まらない分は出力側を削る（プロンプトが切られると指示ごと失われるため）
+        METRICS.incr("num_ctx_clamped")
+        if num_predict > 0:
+            num_predict = max(num_ctx - prompt_tokens, 256)
+    with _ctx_lock:
+        _ctx_high_water = max(_ctx_high_water, num_ctx)
+        num_ctx = _ctx_high_water
+    return {"num_predict": num_predict, "num_ctx": num_ctx}
+
+def generation_options(prompt: Union[str, Prompt], n_items: int, attempt: int = 0) -> Dict[str, Any]:
+    """生成用（温度 TEMPERATURE・seedなし。応答キャッシュの対象外）。出力の上限はバッチの件数から決める"""
+    return {"temperature": CONFIG.temperature, **size_options(prompt, n_items * CONFIG.generate_tokens_per_item, attempt)}
+
+# サーバーへ同時に投げる呼び出し数の上限（LLM_MAX_INFLIGHT、0なら無制限）。
+# スレッド・原句集をまたいで共有し、バッチ実行でも全体の並列数がこれを超えないようにする
+_slots: Optional[threading.BoundedSemaphore] = (
+    threading.BoundedSemaphore(CONFIG.llm_max_inflight) if CONFIG.llm_max_inflight > 0 else None
+)
+
+def set_max_inflight(n: int) -> None:
+    """同時呼び出しの上限を変える（0で無制限）。実行中の呼び出しは古い上限のまま終わる"""
+    global _slots
+    _slots = threading.BoundedSemaphore(n) if n > 0 else None
+
+def _acquire_slot(stage: str) -> Optional[threading.BoundedSemaphore]:
+    slots = _slots
+    if slots is None:
+        return None
+    if not slots.acquire(blocking=False):
+        started = time.perf_counter()
+        slots.acquire()
+        METRICS.incr(f"{stage}_slot_wait_ms", int((time.perf_counter() - started) * 1000))
+    return slots
+
+def llm_concurrency(configured: int) -> int:
+    """並列数の設定値と、バックエンドが同時に処理できる数（複数ホストなら合計）の大きい方"""
+    return max(1, configured, get_backend().capacity)
+
+def model_id() -> str:
+    """キャッシュ・採点アーカイブのキーに使うモデル名（偽LLMの結果が本物と混ざらないようにする）"""
+    return get_backend().model_id
 
 def list_available_models() -> list[str]:
     """利用可能なOllamaモデルのリストを取得"""
     try:
-        models = ollama.list()
-        return [model["name"] for model in models.get("models", [])]
+        return get_backend().list_models()
     except Exception:
         return []
 
-def call_ollama(prompt: str) -> str:
+def call_ollama(
+    prompt: Union[str, Prompt],
+    format: Optional[Union[str, Dict[str, Any]]] = None,
+    options: Optional[Dict[str, Any]] = None,
+    usage: Optional[Dict[str, int]] = None,
+    stage: str = "other",
+) -> str:
     """
     Ollamaをローカル実行（APIキー不要）。
     事前に `ollama pull <model>` 済みであること。
-    Ollamaサーバーが起動している必要があります。
+    Ollamaサーバーが起動している必要があります（LLM_BACKEND=fake なら偽LLMを使う）。
+    prompt に Prompt を渡すと、固定の前半を system メッセージとして送る。
+    format に "json" や JSONスキーマ(dict)を渡すと構造化出力になる。
+    options（temperature, seed 等）が決定的なら応答をディスクにキャッシュする。
+    usage を渡すと prompt_tokens / output_tokens を加算する（キャッシュヒット時は0）。
+    stage は計測（out/run_metrics.json）での集計先（style / generate / judge / repair など）。
     """
+    started = time.perf_counter()
+    backend = get_backend()
+    user, system = _split(prompt)
+    cache = get_response_cache()
+    key = None
+    if cache is not None:
+        if is_cacheable(options):
+            key = cache_key(backend.model_id, prompt.text() if isinstance(prompt, Prompt) else prompt, options, format)
+            cached = cache.get(key)
+            if cached is not None:
+                record_cache_event("hits")
+                METRICS.record_llm_call(stage, None, time.perf_counter() - started, cached=True)
+                return cached
+            record_cache_event("misses")
+        else:
+            record_cache_event("bypassed")
+
+    slot = _acquire_slot(stage)
     try:
-        response = ollama.generate(
-            model=CONFIG.ollama_model,
-            prompt=prompt,
-        )
-        return response["response"].strip()
+        response = backend.generate(user, format=format, options=options, system=system)
+        text = response["response"].strip()
     except Exception as e:
-        error_msg = str(e)
-        # モデルが見つからない場合の特別な処理
-        if "not found" in error_msg.lower() or "404" in error_msg:
-            available = list_available_models()
-            msg = f"\nモデル '{CONFIG.ollama_model}' が見つかりません。\n\n"
-            if available:
-                msg += f"利用可能なモデル:\n"
-                for m in available:
-                    msg += f"  - {m}\n"
-                msg += f"\nモデルをインストールするには:\n"
-                msg += f"  ollama pull {CONFIG.ollama_model}\n"
-                msg += f"\nまたは、利用可能なモデルを使用するには:\n"
-                msg += f"  $env:OLLAMA_MODEL=\"{available[0] if available else 'qwen2.5:7b-instruct'}\"\n"
-            else:
-                msg += "利用可能なモデルが見つかりませんでした。\n"
-                msg += f"モデルをインストールしてください:\n"
-                msg += f"  ollama pull {CONFIG.ollama_model}\n"
-            raise RuntimeError(msg)
-        raise RuntimeError(f"Ollama error: {e}")
+        METRICS.incr(f"{stage}_llm_errors")
+        raise _ollama_error(e)
+    finally:
+        if slot is not None:
+            slot.release()
+    METRICS.record_llm_call(stage, response, time.perf_counter() - started)
+    truncated = response.get("done_reason") == "length"
+    if truncated:
+        # num_predict に達して途中で切れた（JSONの修復処理で救えた分だけ使われる）
+        METRICS.incr(f"{stage}_truncated")
+
+    if usage is not None:
+        # eval_count が無い（古いサーバー等）場合は文字数で概算する
+        usage["prompt_tokens"] = usage.get("prompt_tokens", 0) + (response.get("prompt_eval_count") or 0)
+        usage["output_tokens"] = usage.get("output_tokens", 0) + (response.get("eval_count") or len(text))
+    # 途中で切れた応答はキャッシュしない（次の実行で同じ切れ方を繰り返さないように）
+    if key is not None and not truncated:
+        cache.put(key, text)
+    return text
+
+def stream_ollama(
+    prompt: Union[str, Prompt],
+    format: Optional[Union[str, Dict[str, Any]]] = None,
+    options: Optional[Dict[str, Any]] = None,
+    stage: str = "other",
+) -> Iterator[str]:
+    """
+    call_ollama のストリーミング版。届いたテキスト断片を順に yield する。
+    呼び出し側が途中でやめる（close する）と、サーバーへのストリームも閉じる。
+    トークン数などの統計は最後の断片（done）に付いてくる。途中でやめた場合は届いた文字数で概算する。
+    """
+    started = time.perf_counter()
+    user, system = _split(prompt)
+    slot = _acquire_slot(stage)  # ストリームを読み終わる（閉じる）まで枠を使う
+    try:
+        try:
+            stream = get_backend().stream(user, format=format, options=options, system=system)
+        except Exception as e:
+            METRICS.incr(f"{stage}_llm_errors")
+            raise _ollama_error(e)
+        last: Any = None
+        received = 0
+        try:
+            for part in stream:
+                last = part
+                chunk = part["response"]
+                if chunk:
+                    received += len(chunk)
+                    yield chunk
+        except GeneratorExit:
+            METRICS.incr(f"{stage}_streams_closed_early")
+            raise
+        except Exception as e:
+            METRICS.incr(f"{stage}_llm_errors")
+            raise _ollama_error(e)
+        finally:
+            close = getattr(stream, "close", None)
+            if close is not None:
+                close()
+            if last is None or not last.get("eval_count"):
+                last = {"eval_count": received}
+            elif last.get("done_reason") == "length":
+                METRICS.incr(f"{stage}_truncated")
+            METRICS.record_llm_call(stage, last, time.perf_counter() - started)
+    finally:
+        if slot is not None:
+            slot.release()
+
+def warm_up_model() -> None:
+    """
+    実行の最初にモデルを読み込んでおく（OLLAMA_KEEP_ALIVE の間はアンロードされない）。
+    読み込み時間（load_duration）は計測の warmup に記録する。失敗しても実行は続ける。
+    """
+    started = time.perf_counter()
+    try:
+        # NUM_CTX を固定していれば、その文脈長で読み込んで直後の読み込み直しを避ける
+        response = get_backend().warm_up({"num_ctx": CONFIG.num_ctx} if CONFIG.num_ctx else None)
+    except Exception as e:
+        print(f"注意: モデルの事前読み込みに失敗しました（{str(e)[:80]}）")
+        return
+    METRICS.record_llm_call("warmup", response, time.perf_counter() - started)
+
+def _ollama_error(e: Exception) -> RuntimeError:
+    """Ollamaの例外を、対処法つきの RuntimeError に変換する"""
+    error_msg = str(e)
+    # モデルが見つからない場合の特別な処理
+    if "not found" in error_msg.lower() or "404" in error_msg:
+        available = list_available_models()
+        msg = f"\nモデル '{CONFIG.ollama_model}' が見つかりません。\n\n"
+        if available:
+            msg += f"利用可能なモデル:\n"
+            for m in available:
+                msg += f"  - {m}\n"
+            msg += f"\nモデルをインストールするには:\n"
+            msg += f"  ollama pull {CONFIG.ollama_model}\n"
+            msg += f"\nまたは、利用可能なモデルを使用するには:\n"
+            msg += f"  $env:OLLAMA_MODEL=\"{available[0] if available else 'qwen2.5:7b-instruct'}\"\n"
+        else:
+            msg += "利用可能なモデルが見つかりませんでした。\n"
+            msg += f"モデルをインストールしてください:\n"
+            msg += f"  ollama pull {CONFIG.ollama_model}\n"
+        return RuntimeError(msg)
+    return RuntimeError(f"Ollama error: {e}")
@@ -0,0 +1,189 @@
+import contextvars
+import json
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+# Ollamaの応答に含まれる統計（duration はナノ秒）
+LLM_FIELDS = ("prompt_eval_count", "eval_count", "prompt_eval_duration", "eval_duration", "load_duration", "total_duration")
+
+class Metrics:
+    """
+    実行1回分の計測値を集める（スレッドセーフ）。
+    - span: ステージ（作風抽出・生成・採点など）ごとの所要時間
+    - llm: LLM呼び出しごとのトークン数・所要時間（Ollamaの eval_count 等）をステージ別に集計
+    - counters: 再試行・JSON修復・キャッシュヒットなどの回数
+    out/run_metrics.json（と任意で Prometheus のテキスト形式）に書き出す。
+    """
+
+    def __init__(self, max_calls: int = 5000):
+        self._lock = threading.Lock()
+        self.max_calls = max_calls
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.started = time.time()
+            self._t0 = time.perf_counter()
+            self.spans: List[Dict[str, Any]] = []
+            self.stages: Dict[str, Dict[str, float]] = {}
+            self.llm: Dict[str, Dict[str, float]] = {}
+            self.calls: List[Dict[str, Any]] = []
+            self.counters: Dict[str, int] = {}
+
+    @contextmanager
+    def span(self, name: str, **attrs: Any) -> Iterator[Dict[str, Any]]:
+        """with METRICS.span("generate"): ... の所要時間を記録する。attrs は後から書き足せる"""
+        record: Dict[str, Any] = {"name": name, **attrs}
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            seconds = time.perf_counter() - start
+            record["start"] = round(start - self._t0, 6)
+            record["seconds"] = round(seconds, 6)
+            with self._lock:
+                if len(self.spans) < self.max_calls:  # 常駐サービスでも増え続けないように
+                    self.spans.append(record)
+                stage = self.stages.setdefault(name, {"count": 0, "seconds": 0.0, "max_seconds": 0.0})
+                stage["count"] += 1
+                stage["seconds"] += seconds
+                stage["max_seconds"] = max(stage["max_seconds"], seconds)
+
+    def record_llm_call(self, stage: str, response: Any, seconds: float, cached: bool = False) -> None:
+        """LLM呼び出し1回分。response は Ollama の応答（キャッシュヒット時は None）"""
+        stats = {f: int(_get(response, f) or 0) for f in LLM_FIELDS}
+        with self._lock:
+            agg = self.llm.setdefault(stage, {"calls": 0, "cached": 0, "seconds": 0.0, **{f: 0 for f in LLM_FIELDS}})
+            agg["calls"] += 1
+            agg["cached"] += int(cached)
+            agg["seconds"] += seconds
+            for f, v in stats.items():
+                agg[f] += v
+            if len(self.calls) < self.max_calls:
+                self.calls.append({"stage": stage, "seconds": round(seconds, 6), "cached": cached, **stats})
+
+    def incr(self, name: str, n: int = 1) -> None:
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def to_dict(self, extra_counters: Optional[Dict[str, Dict[str, int]]] = None) -> Dict[str, Any]:
+        with self._lock:
+            llm = {}
+            for stage, agg in self.llm.items():
+                row = dict(agg)
+                eval_s = agg["eval_duration"] / 1e9
+                prompt_s = agg["prompt_eval_duration"] / 1e9
+                # 生成速度はOllamaが測った時間で、実時間ベースの速度は待ち時間も含めて出す
+                row["tokens_per_second"] = round(agg["eval_count"] / eval_s, 2) if eval_s > 0 else None
+                row["prompt_tokens_per_second"] = round(agg["prompt_eval_count"] / prompt_s, 2) if prompt_s > 0 else None
+                row["wall_tokens_per_second"] = round(agg["eval_count"] / agg["seconds"], 2) if agg["seconds"] > 0 else None
+                llm[stage] = row
+            counters = dict(self.counters)
+            for prefix, values in (extra_counters or {}).items():
+                for k, v in values.items():
+                    counters[f"{prefix}_{k}"] = v
+            return {
+                "started": self.started,
+                "seconds": round(time.perf_counter() - self._t0, 6),
+                "stages": {k: dict(v) for k, v in self.stages.items()},
+                "llm": llm,
+                "counters": counters,
+                "spans": list(self.spans),
+                "calls": list(self.calls),
+            }
+
+    def write_json(self, path: str, extra_counters: Optional[Dict[str, Dict[str, int]]] = None) -> Dict[str, Any]:
+        data = self.to_dict(extra_counters)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        return data
+
+    def write_prometheus(self, path: str, data: Dict[str, Any], prefix: str = "senryu") -> None:
+        """node_exporter の textfile collector で読める形式（一時ファイル経由で置き換える）"""
+        lines: List[str] = []
+
+        def metric(name: str, kind: str, help_text: str, samples: List[tuple]) -> None:
+            if not samples:
+                return
+            lines.append(f"# HELP {prefix}_{name} {help_text}")
+            lines.append(f"# TYPE {prefix}_{name} {kind}")
+            for labels, value in samples:
+                label_str = ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items())
+                lines.append(f"{prefix}_{name}{{{label_str}}} {value}" if label_str else f"{prefix}_{name} {value}")
+
+        metric("run_seconds", "gauge", "Wall time of the run.", [({}, data["seconds"])])
+        stages = data["stages"].items()
+        metric("stage_seconds_total", "counter", "Time spent per pipeline stage.", [({"stage": k}, v["seconds"]) for k, v in stages])
+        metric("stage_spans_total", "counter", "Number of spans per stage.", [({"stage": k}, v["count"]) for k, v in stages])
+        llm = data["llm"].items()
+        metric("llm_calls_total", "counter", "LLM calls per stage.", [({"stage": k}, v["calls"]) for k, v in llm])
+        metric("llm_cached_calls_total", "counter", "LLM calls served from the response cache.", [({"stage": k}, v["cached"]) for k, v in llm])
+        metric("llm_call_seconds_total", "counter", "Wall time spent in LLM calls.", [({"stage": k}, v["seconds"]) for k, v in llm])
+        for field, name, help_text in (
+            ("eval_count", "llm_eval_tokens_total", "Output tokens (eval_count)."),
+            ("prompt_eval_count", "llm_prompt_tokens_total", "Prompt tokens (prompt_eval_count)."),
+        ):
+            metric(name, "counter", help_text, [({"stage": k}, v[field]) for k, v in llm])
+        for field, name, help_text in (
+            ("eval_duration", "llm_eval_seconds_total", "Generation time reported by Ollama (eval_duration)."),
+            ("prompt_eval_duration", "llm_prompt_eval_seconds_total", "Prompt processing time (prompt_eval_duration)."),
+            ("load_duration", "llm_load_seconds_total", "Model load time (load_duration)."),
+        ):
+            metric(name, "counter", help_text, [({"stage": k}, v[field] / 1e9) for k, v in llm])
+        metric(
+            "llm_tokens_per_second", "gauge", "Output tokens per second of generation time.",
+            [({"stage": k}, v["tokens_per_second"]) for k, v in llm if v["tokens_per_second"] is not None],
+        )
+        metric("events_total", "counter", "Retries, JSON repairs, cache hits and similar events.", [({"event": k}, v) for k, v in sorted(data["counters"].items())])
+
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(tmp_path, path)
+
+def _get(response: Any, key: str) -> Any:
+    if response is None:
+        return None
+    try:
+        return response.get(key)
+    except AttributeError:
+        return getattr(response, key, None)
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+METRICS = Metrics()
+
+# --- 実行（原句集1つ分）ごとの件数 ---
+# バッチでは複数の原句集が同じプロセスで同時に進むので、run_report.json に書く件数
+# （JSONパースの経路・LLM応答キャッシュ）はグローバルな集計とは別に、実行ごとにも数える
+
+_run_stats: contextvars.ContextVar[Optional[Dict[str, Dict[str, int]]]] = contextvars.ContextVar("run_stats", default=None)
+_run_stats_lock = threading.Lock()
+
+@contextmanager
+def run_stats(initial: Dict[str, Dict[str, int]]) -> Iterator[Dict[str, Dict[str, int]]]:
+    """with の中（と RunContextExecutor で投げた処理）で count_run された件数だけを集める"""
+    stats = {group: dict(counts) for group, counts in initial.items()}
+    token = _run_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        _run_stats.reset(token)
+
+def count_run(group: str, key: str) -> None:
+    stats = _run_stats.get()
+    if stats is not None:
+        with _run_stats_lock:
+            counts = stats.setdefault(group, {})
+            counts[key] = counts.get(key, 0) + 1
+
+class RunContextExecutor(ThreadPoolExecutor):
+    """投げた処理を呼び出し元の contextvars のまま動かす（実行ごとの件数が呼び出し元の実行に入るように）"""
+
+    def submit(self, fn: Callable[..., Any], /, *args: Any, **kwargs: Any) -> Future:
+        return super().submit(contextvars.copy_context().run, fn, *args, **kwargs)
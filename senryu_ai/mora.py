@@ -1,11 +1,18 @@
 import re
-from typing import List
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, List, Optional
+
+from senryu_ai.config import CONFIG
 
 _SMALL = set("ャュョァィゥェォヮゃゅょぁぃぅぇぉゎ")
 _LONG = set("ー")
 _SOKUON = set("ッっ")
 _N = set("ンん")
 
+_KANA_RE = re.compile(r"[ぁ-ゖァ-ヺーッっんン]")
+
 def _count_mora_from_kana(kana: str) -> int:
     mora = 0
     for ch in kana:
@@ -17,23 +24,168 @@ def _count_mora_from_kana(kana: str) -> int:
         mora += 1
     return mora
 
-def count_mora(text: str) -> int:
+# --- バックエンド（pyopenjtalk）の解決は1プロセスにつき1回だけ ---
+
+_backend_lock = threading.Lock()
+_backend_resolved = False
+_g2p: Optional[Callable[..., str]] = None
+
+def _get_g2p() -> Optional[Callable[..., str]]:
+    """pyopenjtalk.g2p を返す。使えなければ None（初回だけ import を試みる）。"""
+    global _backend_resolved, _g2p
+    if _backend_resolved:
+        return _g2p
+    with _backend_lock:
+        if not _backend_resolved:
+            try:
+                import pyopenjtalk  # type: ignore
+                _g2p = pyopenjtalk.g2p
+            except Exception:
+                _g2p = None
+            _backend_resolved = True
+    return _g2p
+
+def backend_name() -> str:
+    return "pyopenjtalk" if _get_g2p() is not None else "kana-fallback"
+
+_warm_thread: Optional[threading.Thread] = None
+
+def _load_dictionary() -> None:
+    g2p = _get_g2p()
+    if g2p is not None:
+        try:
+            g2p("あ", kana=True)  # 最初の変換で辞書が読み込まれる
+        except Exception:
+            pass
+
+def warm_up_dictionary() -> None:
+    """
+    OpenJTalk の辞書の読み込み（数秒かかる）を別スレッドで始める。
+    LLMの応答を待っている間に済ませておき、最初の五七五チェックで待たないようにする。2回目以降は何もしない。
+    """
+    global _warm_thread
+    with _backend_lock:
+        if _warm_thread is not None or _backend_resolved and _g2p is None:
+            return
+        _warm_thread = threading.Thread(target=_load_dictionary, daemon=True, name="openjtalk-warmup")
+    _warm_thread.start()
+
+def _normalize(text: str) -> str:
+    return unicodedata.normalize("NFKC", text).strip()
+
+def _count_mora_uncached(text: str) -> int:
     """
     pyopenjtalk が使えれば高精度。
     使えなければかな抽出で簡易推定。
     """
-    try:
-        import pyopenjtalk  # type: ignore
-        kana = pyopenjtalk.g2p(text, kana=True)
-        return _count_mora_from_kana(kana)
-    except Exception:
-        kana = "".join(re.findall(r"[ぁ-ゖァ-ヺーッっんン]", text))
-        if not kana:
-            return max(1, len(text))
-        return _count_mora_from_kana(kana)
+    g2p = _get_g2p()
+    if g2p is not None:
+        try:
+            return _count_mora_from_kana(g2p(text, kana=True))
+        except Exception:
+            pass
+    kana = "".join(_KANA_RE.findall(text))
+    if not kana:
+        return max(1, len(text))
+    return _count_mora_from_kana(kana)
+
+# --- 正規化済みテキストをキーにした上限付きLRUキャッシュ ---
+
+class _LRUCache:
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._data: "OrderedDict[str, int]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[int]:
+        with self._lock:
+            value = self._data.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: str, value: int) -> None:
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+_cache = _LRUCache(CONFIG.mora_cache_size)
+
+def cache_info() -> Dict[str, int]:
+    return {"hits": _cache.hits, "misses": _cache.misses, "size": len(_cache), "maxsize": _cache.maxsize}
+
+def clear_cache() -> None:
+    _cache.clear()
+
+def count_mora(text: str) -> int:
+    key = _normalize(text)
+    cached = _cache.get(key)
+    if cached is not None:
+        return cached
+    value = _count_mora_uncached(key)
+    _cache.put(key, value)
+    return value
+
+def _count_chunk(texts: List[str]) -> List[int]:
+    # プロセスプール側で実行される（子プロセスごとに辞書を1回だけ読む）
+    return [_count_mora_uncached(t) for t in texts]
+
+def count_mora_many(texts: Iterable[str], processes: Optional[int] = None, chunk_size: int = 2000) -> List[int]:
+    """
+    複数行のモーラ数をまとめて数える。
+    キャッシュ済みの行は再計算せず、未知の行だけを（重複を除いて）変換する。
+    processes が2以上で未知の行が chunk_size を超える場合はプロセスプールに分散する。
+    """
+    keys = [_normalize(t) for t in texts]
+    known: Dict[str, int] = {}
+    unknown: List[str] = []
+    for key in keys:
+        if key in known:
+            continue
+        cached = _cache.get(key)
+        if cached is not None:
+            known[key] = cached
+        else:
+            known[key] = -1
+            unknown.append(key)
+
+    if processes is None:
+        processes = CONFIG.mora_processes
+    if unknown:
+        if processes > 1 and len(unknown) > chunk_size:
+            from concurrent.futures import ProcessPoolExecutor  # multiprocessing の読み込みは使うときだけ
+
+            chunks = [unknown[i:i + chunk_size] for i in range(0, len(unknown), chunk_size)]
+            with ProcessPoolExecutor(max_workers=processes) as executor:
+                counted = [c for chunk in executor.map(_count_chunk, chunks) for c in chunk]
+        else:
+            counted = _count_chunk(unknown)
+        for key, value in zip(unknown, counted):
+            known[key] = value
+            _cache.put(key, value)
+
+    return [known[key] for key in keys]
 
 def mora_pattern(lines: List[str]) -> List[int]:
-    return [count_mora(s.strip()) for s in lines]
+    return [count_mora(s) for s in lines]
 
 def is_575(lines: List[str]) -> bool:
     if len(lines) != 3:
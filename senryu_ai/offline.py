@@ -0,0 +1,203 @@
+"""
+LLMを使わないコマンド（python main.py --check-mora FILE / --rerank out/results.json / --score FILE）。
+
+いずれもLLMサーバーに接続せず、重いライブラリ（ollama・NumPy/SciPy）も読み込まない。
+起動は1秒未満で、時間がかかるのはモーラ数の計算（OpenJTalk の辞書の読み込み）だけ。
+"""
+import json
+import os
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Iterator, List, Optional, TextIO
+
+from senryu_ai.config import CONFIG
+from senryu_ai.judge import rule_score
+from senryu_ai.mora import backend_name, count_mora_many, mora_pattern
+from senryu_ai.parse import load_originals, load_originals_index, split_senryu_line
+from senryu_ai.pipeline import write_results_md
+
+def check_mora_file(path: str) -> Dict[str, int]:
+    """ファイルの各行（originals.txt と同じ書式）が五七五かを数えて表示する"""
+    with open(path, "r", encoding="utf-8") as f:
+        rows = [split_senryu_line(line) for line in f.read().splitlines() if line.strip()]
+    counts = count_mora_many([p for parts in rows if len(parts) == 3 for p in parts])
+    result = {"lines": len(rows), "ok": 0, "ng": 0, "malformed": 0}
+    i = 0
+    for parts in rows:
+        if len(parts) != 3:
+            result["malformed"] += 1
+            print(f"NG  ({len(parts)}句に分かれた)  {' / '.join(parts)}")
+            continue
+        pattern = counts[i:i + 3]
+        i += 3
+        ok = pattern == [5, 7, 5]
+        result["ok" if ok else "ng"] += 1
+        print(f"{'OK' if ok else 'NG'}  {'-'.join(map(str, pattern)):<8}  {' / '.join(parts)}")
+    print(
+        f"\n{result['lines']}行: 五七五OK {result['ok']}件 / 字余り・字足らず {result['ng']}件"
+        f" / 3句に分かれない {result['malformed']}件（モーラ計算: {backend_name()}）"
+    )
+    return result
+
+def rerank_results(
+    results_path: str,
+    originals_path: Optional[str] = None,
+    n_keep: Optional[int] = None,
+) -> List[Dict[str, Any]]:
+    """
+    既存の results.json のルール点を今のルールで付け直し、LLM点はそのまま使って並べ直す。
+    results.json と results.md を同じ場所に書き直す。originals_path を渡すと原句の写しも減点し直す。
+    """
+    with open(results_path, "r", encoding="utf-8") as f:
+        rows: List[Dict[str, Any]] = json.load(f)
+    originals_index = None
+    if originals_path and CONFIG.enable_copy_check:
+        originals_index = load_originals_index(originals_path, load_originals(originals_path))
+
+    # 行のモーラ数はまとめて先に数えておく（rule_score の中ではキャッシュから引く）
+    count_mora_many([str(s) for row in rows for s in row.get("lines") or []])
+    reranked: List[Dict[str, Any]] = []
+    for row in rows:
+        item = {"type": row.get("type"), "lines": row.get("lines") or [], "note": row.get("note", "")}
+        rule, reasons = rule_score(item, originals_index)
+        llm = float(row.get("llm") or 0.0)
+        reranked.append({**row, "total": rule + llm, "rule": rule, "llm": llm, "reasons": reasons})
+    reranked.sort(key=lambda r: r["total"], reverse=True)
+    keep = reranked[: n_keep or CONFIG.n_keep]
+
+    out_dir = os.path.dirname(os.path.abspath(results_path))
+    with open(results_path, "w", encoding="utf-8") as f:
+        json.dump(keep, f, ensure_ascii=False, indent=2)
+    write_results_md(out_dir, keep, f"{results_path} の {len(rows)}件を並べ直し → 上位 {len(keep)}件")
+    print(f"並べ直しました: {os.path.join(out_dir, 'results.md')}")
+    return keep
+
+# --- 大きな候補ファイルの採点し直し（--score） ---
+
+_worker_index = None  # 子プロセスごとの原句索引（コピー検出用）
+
+def _init_worker(originals_path: Optional[str]) -> None:
+    global _worker_index
+    if originals_path and CONFIG.enable_copy_check:
+        _worker_index = load_originals_index(originals_path)
+
+def _score_line(line: str, jsonl: bool) -> Dict[str, Any]:
+    """入力1行を採点した出力1件。JSONL なら元のフィールドを残し、lines が無ければ text/raw を分割する"""
+    record: Dict[str, Any] = {}
+    if jsonl:
+        record = json.loads(line)
+        if not isinstance(record, dict):
+            raise ValueError("JSONオブジェクトではありません")
+        lines = record.get("lines")
+        if not isinstance(lines, list):
+            lines = split_senryu_line(str(record.get("text") or record.get("raw") or ""))
+    else:
+        record["raw"] = line.strip()
+        lines = split_senryu_line(line)
+    lines = [str(s).strip() for s in lines]
+    rule, reasons = rule_score({"lines": lines}, _worker_index)
+    record.update(lines=lines, mora=mora_pattern(lines) if len(lines) == 3 else [], rule=rule, reasons=reasons)
+    if isinstance(record.get("llm"), (int, float)):
+        record["total"] = rule + float(record["llm"])
+    return record
+
+def _score_chunk(start: int, lines: List[str], jsonl: bool) -> List[Dict[str, Any]]:
+    """チャンク1つ分を採点する（プロセスプール側で実行される）。読めない行は error を付けて返す"""
+    out: List[Dict[str, Any]] = []
+    for n, line in enumerate(lines, start):
+        try:
+            record = _score_line(line, jsonl)
+        except ValueError as e:  # json.JSONDecodeError を含む
+            record = {"error": str(e)[:200], "rule": -999.0, "reasons": ["読み込めない行"]}
+        record["line_no"] = n
+        out.append(record)
+    return out
+
+def _read_chunks(f: TextIO, chunk_size: int) -> Iterator[tuple[int, List[str]]]:
+    """空行を除いて chunk_size 行ずつ読む（ファイル全体はメモリに載せない）。行番号は1始まり"""
+    chunk: List[str] = []
+    start = 1
+    for n, line in enumerate(f, 1):
+        if not line.strip():
+            continue
+        if not chunk:
+            start = n
+        chunk.append(line)
+        if len(chunk) >= chunk_size:
+            yield start, chunk
+            chunk = []
+    if chunk:
+        yield start, chunk
+
+def _is_jsonl(path: str) -> bool:
+    if path.endswith((".jsonl", ".ndjson")):
+        return True
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                return line.lstrip().startswith("{")
+    return False
+
+def score_file(
+    input_path: str,
+    output_path: str,
+    originals_path: Optional[str] = None,
+    processes: Optional[int] = None,
+    chunk_size: int = 5000,
+    min_score: Optional[float] = None,
+) -> Dict[str, Any]:
+    """
+    JSONL（1行1件。lines または text/raw）か originals.txt 形式のファイルを、今のルールで採点し直して
+    JSONL（元のフィールド + lines/mora/rule/reasons/line_no）に書き出す。入力と同じ順番で出力する。
+
+    chunk_size 行ずつ読んでプロセスプールに渡し、処理中のチャンクは processes×2 個までに抑えるので、
+    百万行のファイルでもメモリは一定のまま。min_score を渡すとルール点がそれ未満の句は書き出さない。
+    """
+    processes = max(1, processes or os.cpu_count() or 1)
+    jsonl = _is_jsonl(input_path)
+    stats = {"read": 0, "written": 0, "ok_575": 0, "errors": 0}
+    started = time.perf_counter()
+
+    def write(f: TextIO, records: List[Dict[str, Any]]) -> None:
+        for record in records:
+            stats["read"] += 1
+            if "error" in record:
+                stats["errors"] += 1
+            elif record["mora"] == [5, 7, 5]:
+                stats["ok_575"] += 1
+            if min_score is None or record["rule"] >= min_score:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+                stats["written"] += 1
+        if stats["read"] % (chunk_size * 20) == 0:
+            print(f"  {stats['read']}件を採点しました")
+
+    out_dir = os.path.dirname(os.path.abspath(output_path))
+    os.makedirs(out_dir, exist_ok=True)
+    tmp_path = output_path + ".tmp"
+    with open(input_path, "r", encoding="utf-8") as src, open(tmp_path, "w", encoding="utf-8") as dst:
+        chunks = _read_chunks(src, chunk_size)
+        if processes == 1:
+            _init_worker(originals_path)
+            for start, lines in chunks:
+                write(dst, _score_chunk(start, lines, jsonl))
+        else:
+            from concurrent.futures import ProcessPoolExecutor
+
+            with ProcessPoolExecutor(max_workers=processes, initializer=_init_worker, initargs=(originals_path,)) as executor:
+                pending: Deque[Any] = deque()
+                for start, lines in chunks:
+                    pending.append(executor.submit(_score_chunk, start, lines, jsonl))
+                    if len(pending) >= processes * 2:
+                        write(dst, pending.popleft().result())
+                while pending:
+                    write(dst, pending.popleft().result())
+    os.replace(tmp_path, output_path)
+
+    seconds = time.perf_counter() - started
+    stats["seconds"] = round(seconds, 3)
+    print(
+        f"採点し直しました: {stats['read']}件（五七五OK {stats['ok_575']}件, 読めない行 {stats['errors']}件）"
+        f" → {output_path} に {stats['written']}件, {seconds:.1f}秒"
+        f"（{stats['read'] / seconds if seconds > 0 else 0:.0f}件/秒, {processes}プロセス, モーラ計算: {backend_name()}）"
+    )
+    return stats
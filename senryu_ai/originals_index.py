@@ -0,0 +1,123 @@
+import hashlib
+import os
+import pickle
+from typing import Any, Dict, List, Optional, Tuple
+from senryu_ai.dedup import normalize_text
+
+# 索引の形式を変えたら上げる（ディスクキャッシュが自動で作り直される）
+INDEX_VERSION = "1"
+
+class OriginalsIndex:
+    """
+    原句の文字n-gram転置索引。
+    候補1件あたり O(文字数) で「原句からどれだけ写しているか」を測れる。
+    - grams: n-gram → それを含む最初の原句の番号
+    - lines: 原句の各行（正規化済み）
+    - verses: 原句全体（正規化済み）
+    """
+
+    def __init__(self, originals: List[Dict[str, Any]], n: int = 3):
+        self.n = n
+        self.raws: List[str] = []
+        self.grams: Dict[str, int] = {}
+        self.lines: Dict[str, int] = {}
+        self.verses: Dict[str, int] = {}
+        for i, o in enumerate(originals):
+            self.raws.append(o["raw"])
+            parts = [normalize_text(s) for s in o["lines"]]
+            joined = "".join(parts)
+            self.verses.setdefault(joined, i)
+            for part in parts:
+                if part:
+                    self.lines.setdefault(part, i)
+            for j in range(len(joined) - n + 1):
+                self.grams.setdefault(joined[j:j + n], i)
+
+    def overlap(self, lines: List[str]) -> Dict[str, Any]:
+        """
+        exact: 原句と同一 / copied_lines: 原句の行と同じ行の数 /
+        coverage: 原句に現れるn-gramで覆われる文字の割合 / longest_run: 連続一致の最長文字数 /
+        source: 最も多く一致した原句の番号
+        """
+        parts = [normalize_text(str(s)) for s in lines]
+        joined = "".join(parts)
+        result: Dict[str, Any] = {
+            "exact": joined in self.verses,
+            "copied_lines": sum(1 for p in parts if p and p in self.lines),
+            "coverage": 0.0,
+            "longest_run": 0,
+            "source": self.verses.get(joined),
+        }
+        n = self.n
+        if len(joined) < n:
+            return result
+
+        covered = [False] * len(joined)
+        hits: Dict[int, int] = {}
+        run = 0
+        longest = 0
+        for j in range(len(joined) - n + 1):
+            src = self.grams.get(joined[j:j + n])
+            if src is None:
+                run = 0
+                continue
+            hits[src] = hits.get(src, 0) + 1
+            for k in range(j, j + n):
+                covered[k] = True
+            run += 1
+            longest = max(longest, run)
+        result["coverage"] = sum(covered) / len(joined)
+        result["longest_run"] = longest + n - 1 if longest else 0
+        if result["source"] is None and hits:
+            result["source"] = max(hits, key=hits.get)
+        return result
+
+    def copy_penalty(self, lines: List[str]) -> Tuple[float, List[str]]:
+        """rule_score に加える減点と理由"""
+        ov = self.overlap(lines)
+        if ov["exact"]:
+            return -60.0, ["原句と同一"]
+        penalty = 0.0
+        reasons: List[str] = []
+        if ov["copied_lines"]:
+            penalty -= 2.0 * ov["copied_lines"]
+            reasons.append(f"原句の行を流用({ov['copied_lines']}行)")
+        if ov["coverage"] >= 0.7:
+            penalty -= 3.0
+            reasons.append("原句と酷似")
+        elif ov["longest_run"] >= 8:
+            penalty -= 1.5
+            reasons.append("原句と長く一致")
+        return penalty, reasons
+
+def _file_digest(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+def load_or_build_index(
+    path: str,
+    originals: List[Dict[str, Any]],
+    cache_dir: Optional[str] = None,
+) -> OriginalsIndex:
+    """originals.txt の内容ハッシュをキーに、索引をディスクにキャッシュする"""
+    if cache_dir is None:
+        return OriginalsIndex(originals)
+    cache_path = os.path.join(cache_dir, f"{_file_digest(path)}-v{INDEX_VERSION}.pkl")
+    if os.path.exists(cache_path):
+        try:
+            with open(cache_path, "rb") as f:
+                index = pickle.load(f)
+            if isinstance(index, OriginalsIndex):
+                return index
+        except Exception:
+            pass  # 壊れたキャッシュは作り直す
+    index = OriginalsIndex(originals)
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_path = cache_path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        pickle.dump(index, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, cache_path)
+    return index
@@ -1,5 +1,8 @@
+import os
 import re
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
+from senryu_ai.config import CONFIG
+from senryu_ai.originals_index import OriginalsIndex, load_or_build_index
 
 def split_senryu_line(raw: str) -> List[str]:
     """
@@ -36,3 +39,12 @@ def load_originals(path: str) -> List[Dict[str, Any]]:
                 continue
             originals.append({"raw": raw, "lines": parts})
     return originals
+
+def load_originals_index(path: str, originals: Optional[List[Dict[str, Any]]] = None) -> OriginalsIndex:
+    """
+    原句のn-gram索引（コピー検出用）を返す。
+    originals.txt の内容が変わらなければ .cache/originals_index/ から読み込む。
+    """
+    if originals is None:
+        originals = load_originals(path)
+    return load_or_build_index(path, originals, os.path.join(CONFIG.cache_dir, "originals_index"))
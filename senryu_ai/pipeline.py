@@ -1,47 +1,343 @@
 import os
 import json
-from typing import List, Dict, Any
+import time
+from dataclasses import asdict
+from typing import Callable, List, Dict, Any, Optional, Tuple
 from senryu_ai.config import CONFIG
-from senryu_ai.parse import load_originals
-from senryu_ai.style import build_style_profile
-from senryu_ai.generate import generate_candidates
-from senryu_ai.judge import rule_score, llm_judge, ScoredItem
+from senryu_ai.parse import load_originals, load_originals_index
+from senryu_ai.originals_index import OriginalsIndex
+from senryu_ai.style import load_or_build_style_profile
+from senryu_ai.generate import generate_adaptive, generate_candidates, iter_candidates, PARSE_STATS
+from senryu_ai.judge import rule_score, apply_copy_penalty, llm_judge_scores, ScoredItem
+from senryu_ai.mora import cache_info, count_mora_many, mora_pattern, warm_up_dictionary
+from senryu_ai.score_store import RULE_VERSION, ScoreStore, get_score_store, lines_key, profile_hash
+from senryu_ai.prerank import shortlist
+from senryu_ai.repair import is_near_miss, repair_near_misses
+from senryu_ai.dedup import NearDuplicateIndex, add_item, dedup_candidates
+from senryu_ai.llm_cache import CACHE_STATS
+from senryu_ai.llm_ollama import model_id, warm_up_model
+from senryu_ai.metrics import METRICS, run_stats
+from senryu_ai.journal import RunJournal, run_fingerprint
+
+def rule_with_store(
+    it: Dict[str, Any],
+    store: Optional[ScoreStore],
+    report: Dict[str, Any],
+    originals_index: Optional[OriginalsIndex] = None,
+    journal: Optional[RunJournal] = None,
+    new_rules: Optional[Dict[str, List[Any]]] = None,
+) -> Tuple[float, List[str]]:
+    """
+    保存済みの句はルール点をそのまま使い（モーラ計算もしない）、未知の句は採点して保存する。
+    原句コピーの減点は原句集ごとに変わるので、保存せず毎回加える。
+    journal があれば前回の実行で採点した句も再利用し、新しく採点した句は new_rules に集める。
+    """
+    lines = it.get("lines")
+    if (store is None and journal is None) or not isinstance(lines, list):
+        return rule_score(it, originals_index)
+    key = lines_key(lines)
+    cached = journal.rules.get(key) if journal is not None else None
+    if cached is None and store is not None:
+        cached = store.get_rule(lines)
+        if cached is not None:
+            report["score_store_rule_hits"] += 1
+    if cached is not None:
+        r, reasons = cached[0], list(cached[1])
+    else:
+        r, reasons = rule_score(it)
+        if store is not None:
+            store.put_rule(it, r, reasons, mora_pattern([str(s) for s in lines]))
+    if journal is not None and new_rules is not None and key not in journal.rules:
+        new_rules[key] = [r, list(reasons)]
+    return apply_copy_penalty(it, r, reasons, originals_index)
+
+def judge_with_store(
+    style_profile: Dict[str, Any],
+    items: List[Dict[str, Any]],
+    store: Optional[ScoreStore],
+    report: Dict[str, Any],
+    journal: Optional[RunJournal] = None,
+    on_scores: Optional[Callable[[Dict[int, float]], None]] = None,
+) -> List[float]:
+    """
+    同じ作風・同じ採点モデルで採点済みの句はLLMに送らない。
+    journal があれば前回の実行で採点したチャンクも再利用し、チャンクごとに記録する。
+    on_scores には点数が決まった分を {items の添字: 点数} で順に渡す（再利用分 → チャンクごと）。
+    """
+    keys = [lines_key(it.get("lines", [])) for it in items]
+    scores: Dict[int, float] = {}
+    if journal is not None:
+        scores = {i: journal.judge[k] for i, k in enumerate(keys) if k in journal.judge}
+    todo = [i for i in range(len(items)) if i not in scores]
+    if store is not None:
+        style_hash = profile_hash(style_profile)
+        known = store.get_llm_scores([keys[i] for i in todo], style_hash, model_id())
+        hits = {i: known[keys[i]] for i in todo if keys[i] in known}
+        scores.update(hits)
+        todo = [i for i in todo if i not in hits]
+        report["score_store_llm_hits"] = len(hits)
+    if on_scores is not None and scores:
+        on_scores(dict(scores))
+
+    if todo:
+        def on_chunk(chunk: Dict[int, float]) -> None:
+            if journal is not None:
+                journal.record_judge({keys[todo[j]]: x for j, x in chunk.items()})
+            if on_scores is not None:
+                on_scores({todo[j]: x for j, x in chunk.items()})
+
+        judged = llm_judge_scores(style_profile, [items[i] for i in todo], on_chunk=on_chunk)
+        new_scores = {todo[j]: x for j, x in judged.items()}
+        scores.update(new_scores)
+        if store is not None:
+            store.put_llm_scores({keys[i]: x for i, x in new_scores.items()}, style_hash, model_id())
+
+    missing = len(items) - len(scores)
+    if missing:
+        print(f"警告: {missing}件の候補はLLM採点が得られなかったため 0点 とします。")
+    return [scores.get(i, 0.0) for i in range(len(items))]
+
+def result_row(k: ScoredItem) -> Dict[str, Any]:
+    """results.json の1件分"""
+    return {
+        "total": k.total,
+        "rule": k.rule,
+        "llm": k.llm,
+        "type": k.item.get("type"),
+        "lines": k.item.get("lines"),
+        "note": k.item.get("note", ""),
+        "reasons": k.reasons,
+    }
+
+def write_results_md(out_dir: str, rows: List[Dict[str, Any]], summary: str) -> None:
+    """results.json の行を読みやすく並べた out/results.md を書き出す"""
+    md: List[str] = ["# 川柳AI（ローカル）上位結果\n", f"{summary}\n"]
+    for i, k in enumerate(rows, 1):
+        md.append(f"## {i}. score={k['total']:.2f} (rule={k['rule']:.1f}, llm={k['llm']:.1f})")
+        md.extend([f"- {k['lines'][0]}", f"- {k['lines'][1]}", f"- {k['lines'][2]}"])
+        if k["note"]:
+            md.append(f"- note: {k['note']}")
+        if k["reasons"]:
+            md.append(f"- reasons: {', '.join(k['reasons'])}")
+        md.append("")
+
+    with open(os.path.join(out_dir, "results.md"), "w", encoding="utf-8") as f:
+        f.write("\n".join(md))
+
+def write_metrics(out_dir: str, report: Dict[str, Any], stats: Optional[Dict[str, Dict[str, int]]] = None) -> None:
+    """
+    out/run_metrics.json（METRICS_PROMETHEUS=1 なら run_metrics.prom も）を書き出す。
+    stats は run_stats で集めた実行ごとの件数（省略時はプロセス全体の件数）
+    """
+    extra = {
+        "parse": dict(stats["parse"]) if stats else dict(PARSE_STATS),
+        "llm_cache": dict(stats["llm_cache"]) if stats else dict(CACHE_STATS),
+        "mora_cache": cache_info(),
+        "score_store": {"rule_hits": report["score_store_rule_hits"], "llm_hits": report["score_store_llm_hits"]},
+    }
+    data = METRICS.write_json(os.path.join(out_dir, "run_metrics.json"), extra)
+    if CONFIG.metrics_prometheus:
+        METRICS.write_prometheus(os.path.join(out_dir, "run_metrics.prom"), data)
+    for stage, agg in data["llm"].items():
+        tps = f"{agg['tokens_per_second']:.1f} tok/s" if agg["tokens_per_second"] else "-"
+        print(f"  LLM[{stage}]: {agg['calls']}回, {agg['seconds']:.1f}秒, 出力 {agg['eval_count']}トークン ({tps})")
 
 def run_pipeline(
     originals_path: str = "originals.txt",
     out_dir: str = "out",
-) -> None:
+    resume: bool = False,
+    standalone: bool = True,
+) -> Dict[str, Any]:
+    """
+    resume=True なら out/journal.jsonl に残った前回の途中経過を読み戻して続きから実行する。
+    standalone=False はバッチ実行（batch.py）の1原句集分として動かす場合で、
+    計測値は複数の原句集で共有するため、初期化も run_metrics.json の書き出しもバッチ側で行う。
+    返り値は run_report.json と同じ集計。
+    """
+    # JSONパースとLLM応答キャッシュの件数はこの実行の分だけを数える（バッチで同時に進む他の原句集と混ぜない）
+    with run_stats({"parse": dict.fromkeys(PARSE_STATS, 0), "llm_cache": dict.fromkeys(CACHE_STATS, 0)}) as stats:
+        return _run_pipeline(originals_path, out_dir, resume, standalone, stats)
+
+def _run_pipeline(
+    originals_path: str,
+    out_dir: str,
+    resume: bool,
+    standalone: bool,
+    stats: Dict[str, Dict[str, int]],
+) -> Dict[str, Any]:
     os.makedirs(out_dir, exist_ok=True)
+    if standalone:
+        METRICS.reset()
+
+    with METRICS.span("load"):
+        originals = load_originals(originals_path)
+        if len(originals) < 10:
+            print("注意：10句未満だと作風抽出が弱くなります（100句あるなら理想）")
+
+        original_texts = [o["raw"] for o in originals]
+        # 原句コピー検出用の索引（originals.txt が変わらなければディスクから読む）
+        originals_index = load_originals_index(originals_path, originals) if CONFIG.enable_copy_check else None
 
-    originals = load_originals(originals_path)
-    if len(originals) < 10:
-        print("注意：10句未満だと作風抽出が弱くなります（100句あるなら理想）")
+    # 途中経過の記録（生成条件が同じときだけ --resume で再利用する）
+    journal = RunJournal(
+        os.path.join(out_dir, "journal.jsonl"),
+        run_fingerprint(
+            originals_path,
+            n_generate=CONFIG.n_generate, n_seeds=CONFIG.n_seeds, seed=CONFIG.seed,
+            temperature=CONFIG.temperature, structured_output=CONFIG.structured_output,
+            adaptive_generation=CONFIG.adaptive_generation, stream_generation=CONFIG.stream_generation,
+            target_valid=CONFIG.target_valid, rule_version=RULE_VERSION,
+        ),
+        resume=resume,
+    )
 
-    original_texts = [o["raw"] for o in originals]
+    # モデルを先に読み込み、OLLAMA_KEEP_ALIVE の間は載せたままにする。
+    # その間に五七五チェック用の辞書も別スレッドで読み込んでおく
+    warm_up_dictionary()
+    with METRICS.span("warmup"):
+        warm_up_model()
 
     # 1) 作風抽出
-    style_profile = build_style_profile(original_texts)
+    with METRICS.span("style"):
+        if journal.style is not None:
+            style_profile = journal.style
+        else:
+            style_profile = load_or_build_style_profile(original_texts)
+            journal.record_style(style_profile)
     with open(os.path.join(out_dir, "style_profile.json"), "w", encoding="utf-8") as f:
         json.dump(style_profile, f, ensure_ascii=False, indent=2)
 
-    # 2) 生成（量産）
-    candidates = generate_candidates(style_profile, original_texts, CONFIG.n_generate)
-    print(f"生成された候補数: {len(candidates)}")
+    # 実行結果の集計（out/run_report.json に書き出す）
+    report: Dict[str, Any] = {
+        "generated": 0, "dedup_exact": 0, "dedup_near": 0, "valid_575": 0,
+        "copy_flagged": 0, "repair_attempted": 0, "repair_fixed": 0,
+        "prerank_pruned": 0, "judged": 0, "kept": 0,
+        "score_store_rule_hits": 0, "score_store_llm_hits": 0,
+    }
 
-    # 3) ルール採点・足切り
+    # 2) 生成（量産） + 3) ルール採点・足切り
     ok_items: List[Dict[str, Any]] = []
     rule_meta: List[tuple[Dict[str, Any], float, list[str]]] = []
     rejected_samples: List[tuple[Dict[str, Any], float, list[str]]] = []
-    for it in candidates:
-        r, reasons = rule_score(it)
+
+    near_misses: List[Dict[str, Any]] = []
+    new_rules: Dict[str, List[Any]] = {}
+    store = get_score_store()
+    dedup_index = NearDuplicateIndex(threshold=CONFIG.dedup_threshold) if CONFIG.enable_dedup else None
+
+    def apply_rule(it: Dict[str, Any]) -> bool:
+        r, reasons = rule_with_store(it, store, report, originals_index, journal, new_rules)
+        if any(x.startswith("原句") for x in reasons):
+            report["copy_flagged"] += 1
         if r > -10:  # 五七五NGなどを落とす
             ok_items.append(it)
             rule_meta.append((it, r, reasons))
-        else:
-            # デバッグ用：最初の3件のNG候補を保存
-            if len(rejected_samples) < 3:
-                rejected_samples.append((it, r, reasons))
+            return True
+        # 五七五まであと1〜2音の句は修正ステージに回す
+        if (
+            CONFIG.enable_repair
+            and "五七五から外れている" in reasons
+            and len(near_misses) < CONFIG.repair_max_items
+            and is_near_miss(it.get("lines", []))
+        ):
+            near_misses.append(it)
+        # デバッグ用：最初の3件のNG候補を保存
+        if len(rejected_samples) < 3:
+            rejected_samples.append((it, r, reasons))
+        return False
+
+    def classify(it: Dict[str, Any]) -> str:
+        if dedup_index is not None and add_item(dedup_index, it) is not None:
+            return "duplicate"  # 既出の句（またはほぼ同じ句）は採点しない
+        return "valid" if apply_rule(it) else "rejected"
+
+    target_valid = CONFIG.target_valid or CONFIG.n_keep * 3
+    if CONFIG.adaptive_generation:
+        # 五七五OKの件数を目標に、歩留まりを見ながらバッチを追加する（ルール採点も generate の時間に含まれる）
+        with METRICS.span("generate", mode="adaptive") as span:
+            candidates, controller = generate_adaptive(
+                style_profile, original_texts, classify, target_valid, journal=journal
+            )
+            span["candidates"] = len(candidates)
+        report["stop_reason"] = controller.stop_reason
+        report["batches"] = [asdict(b) for b in controller.batches]
+        print(f"生成された候補数: {len(candidates)}（使用トークン {controller.tokens}）")
+    elif CONFIG.stream_generation:
+        # 届いた候補から順に採点し、五七五OKが目標数に達したらストリームを打ち切る
+        candidates: List[Dict[str, Any]] = []
+        with METRICS.span("generate", mode="stream") as span:
+            started = time.perf_counter()
+            stream = iter_candidates(style_profile, original_texts, CONFIG.n_generate, journal=journal)
+            try:
+                for it in stream:
+                    candidates.append(it)
+                    if classify(it) == "valid" and len(ok_items) == 1:
+                        span["first_valid_seconds"] = round(time.perf_counter() - started, 3)
+                        print(f"最初の五七五OK候補: {time.perf_counter() - started:.1f}秒")
+                    if len(ok_items) >= target_valid:
+                        print(f"五七五OKの候補が {target_valid} 件に達したため生成を打ち切ります。")
+                        break
+            finally:
+                stream.close()
+            span["candidates"] = len(candidates)
+        print(f"生成された候補数: {len(candidates)}")
+    else:
+        with METRICS.span("generate", mode="batch") as span:
+            candidates = generate_candidates(style_profile, original_texts, CONFIG.n_generate, journal=journal)
+            span["candidates"] = len(candidates)
+        print(f"生成された候補数: {len(candidates)}")
+        print(
+            f"JSONパース: 直接 {stats['parse']['fast']}回 / 修復処理 {stats['parse']['repair']}回"
+            f"（部分救済 {stats['parse']['salvage']}回, 失敗 {stats['parse']['failed']}回）"
+        )
+        with METRICS.span("dedup"):
+            unique_candidates = dedup_candidates(candidates, dedup_index) if dedup_index is not None else candidates
+
+        # 全候補の行をまとめてモーラ変換しておく（rule_score はキャッシュを引くだけになる）
+        # 採点済みとして保存されている句は数え直さない
+        with METRICS.span("mora") as span:
+            todo_lines = [
+                s for it in unique_candidates
+                if isinstance(it.get("lines"), list)
+                and lines_key(it["lines"]) not in journal.rules
+                and not (store and store.get_rule(it["lines"], touch=False))
+                for s in it["lines"] if isinstance(s, str)
+            ]
+            count_mora_many(todo_lines)
+            span["lines"] = len(todo_lines)
+        with METRICS.span("rules"):
+            for it in unique_candidates:
+                apply_rule(it)
+
+    # ここまでのルール点を記録しておく（修正の途中で止まっても失わない）
+    journal.record_rules(new_rules)
+    new_rules.clear()
+
+    # 3.5) 五七五まであと少しの句を直す（新しく生成するより安い）
+    if near_misses:
+        with METRICS.span("repair", items=len(near_misses)):
+            if journal.repair is not None:
+                # 修正は温度付きで毎回結果が変わるので、再開時は前回の結果を使う（その句のLLM採点も再利用できる）
+                repaired = journal.repair
+                print(f"前回修正した句 {len(repaired)}件を再利用します")
+            else:
+                print(f"五七五まであと少しの句 {len(near_misses)}件を修正します...")
+                repaired = repair_near_misses(near_misses)
+                journal.record_repair(repaired)
+            fixed = sum(1 for it in repaired if classify(it) == "valid")
+        report["repair_attempted"] = len(near_misses)
+        report["repair_fixed"] = fixed
+        print(f"修正で五七五OKになった句: {fixed}件")
+        journal.record_rules(new_rules)
+
+    if dedup_index is not None:
+        report["dedup_exact"] = dedup_index.exact_dups
+        report["dedup_near"] = dedup_index.near_dups
+        print(f"重複除去: 完全一致 {dedup_index.exact_dups}件 / ほぼ同一 {dedup_index.near_dups}件")
+    if report["copy_flagged"]:
+        print(f"原句コピーの疑い: {report['copy_flagged']}件（減点済み）")
 
+    report["generated"] = len(candidates)
     if not ok_items:
         print(f"\n五七五OKの候補が出ませんでした（生成数: {len(candidates)}件）。")
         if rejected_samples:
@@ -57,11 +353,25 @@ def run_pipeline(
         print("1. N_GENERATEを増やす（例: $env:N_GENERATE=\"500\"）")
         print("2. モデルを変える（例: $env:OLLAMA_MODEL=\"llama3.2:3b\"）")
         print("3. originals.txtに10句以上追加する（100句が理想）")
-        return
+        if standalone:
+            write_metrics(out_dir, report, stats)
+        return report
+
+    report["valid_575"] = len(ok_items)
 
     # 4) LLM採点（任意）
     if CONFIG.enable_llm_judge:
-        llm_scores = llm_judge(style_profile, ok_items)
+        # 軽い特徴量で上位M件に絞ってからLLMに渡す
+        top_m = CONFIG.prerank_top_m or CONFIG.n_keep * 3
+        if CONFIG.enable_prerank and len(rule_meta) > top_m:
+            with METRICS.span("prerank", items=len(rule_meta)):
+                rule_meta = shortlist(rule_meta, original_texts, top_m)
+            ok_items = [it for it, _, _ in rule_meta]
+            report["prerank_pruned"] = report["valid_575"] - len(ok_items)
+            print(f"事前選抜: {report['valid_575']}件 → {len(ok_items)}件（{report['prerank_pruned']}件をLLM採点から除外）")
+        report["judged"] = len(ok_items)
+        with METRICS.span("judge", items=len(ok_items)):
+            llm_scores = judge_with_store(style_profile, ok_items, store, report, journal)
     else:
         llm_scores = [0.0 for _ in ok_items]
 
@@ -73,35 +383,42 @@ def run_pipeline(
 
     merged.sort(key=lambda x: x.total, reverse=True)
     keep = merged[: CONFIG.n_keep]
+    report["kept"] = len(keep)
+    report["llm_cache"] = dict(stats["llm_cache"])
+    if store is not None:
+        store.flush()
+        print(
+            f"採点済みの句: ルール点 {report['score_store_rule_hits']}件 / LLM点 {report['score_store_llm_hits']}件を再利用"
+        )
+    if CONFIG.llm_cache:
+        print(
+            f"LLM応答キャッシュ: ヒット {stats['llm_cache']['hits']}回 / ミス {stats['llm_cache']['misses']}回"
+            f" / 対象外 {stats['llm_cache']['bypassed']}回"
+        )
 
     # 6) 出力
-    out_json = [
-        {
-            "total": k.total,
-            "rule": k.rule,
-            "llm": k.llm,
-            "type": k.item.get("type"),
-            "lines": k.item.get("lines"),
-            "note": k.item.get("note", ""),
-            "reasons": k.reasons,
-        }
-        for k in keep
-    ]
+    out_json = [result_row(k) for k in keep]
 
     with open(os.path.join(out_dir, "results.json"), "w", encoding="utf-8") as f:
         json.dump(out_json, f, ensure_ascii=False, indent=2)
 
-    md: List[str] = ["# 川柳AI（ローカル）上位結果\n"]
-    for i, k in enumerate(out_json, 1):
-        md.append(f"## {i}. score={k['total']:.2f} (rule={k['rule']:.1f}, llm={k['llm']:.1f})")
-        md.extend([f"- {k['lines'][0]}", f"- {k['lines'][1]}", f"- {k['lines'][2]}"])
-        if k["note"]:
-            md.append(f"- note: {k['note']}")
-        if k["reasons"]:
-            md.append(f"- reasons: {', '.join(k['reasons'])}")
-        md.append("")
+    with open(os.path.join(out_dir, "run_report.json"), "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
 
-    with open(os.path.join(out_dir, "results.md"), "w", encoding="utf-8") as f:
-        f.write("\n".join(md))
+    summary = f"生成 {report['generated']}件"
+    if report["dedup_exact"] or report["dedup_near"]:
+        summary += f" → 重複除去で {report['dedup_exact'] + report['dedup_near']}件を除外"
+    summary += f" → 五七五OK {report['valid_575']}件"
+    if report["repair_fixed"]:
+        summary += f"（うち修正 {report['repair_fixed']}件）"
+    if report["prerank_pruned"]:
+        summary += f" → 事前選抜で {report['prerank_pruned']}件を除外"
+    if CONFIG.enable_llm_judge:
+        summary += f" → LLM採点 {report['judged']}件"
+    write_results_md(out_dir, out_json, f"{summary} → 上位 {report['kept']}件")
 
+    journal.record_done()
+    if standalone:
+        write_metrics(out_dir, report, stats)
     print(f"Done! {os.path.join(out_dir, 'results.md')} を確認してください。")
+    return report
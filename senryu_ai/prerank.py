@@ -0,0 +1,77 @@
+import math
+from collections import Counter
+from typing import List, Dict, Any, Tuple
+
+# (候補, ルール点, 理由) の組。pipeline の rule_meta と同じ形
+RuleMeta = Tuple[Dict[str, Any], float, List[str]]
+
+def _bigrams(text: str) -> List[str]:
+    text = "".join(text.split())
+    return [text[i:i + 2] for i in range(len(text) - 1)] or ([text] if text else [])
+
+def _joined(item: Dict[str, Any]) -> str:
+    return "".join(s for s in item.get("lines", []) if isinstance(s, str))
+
+class StyleNgramProfile:
+    """原文全体の文字bigram分布。候補との近さ（コサイン類似度）を測る"""
+
+    def __init__(self, original_texts: List[str]):
+        self.counts: Counter = Counter()
+        for text in original_texts:
+            self.counts.update(_bigrams(text))
+        self.norm = math.sqrt(sum(c * c for c in self.counts.values())) or 1.0
+
+    def similarity(self, text: str) -> float:
+        grams = Counter(_bigrams(text))
+        if not grams:
+            return 0.0
+        dot = sum(c * self.counts.get(g, 0) for g, c in grams.items())
+        norm = math.sqrt(sum(c * c for c in grams.values()))
+        return dot / (norm * self.norm)
+
+def _note_score(item: Dict[str, Any]) -> float:
+    # 狙いが短く書けている候補をわずかに優遇（空・長すぎは0）
+    note = item.get("note", "")
+    return 1.0 if isinstance(note, str) and 0 < len(note) <= 30 else 0.0
+
+def _jaccard(a: set, b: set) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+def shortlist(
+    rule_meta: List[RuleMeta],
+    original_texts: List[str],
+    top_m: int,
+    style_weight: float = 10.0,
+    diversity_weight: float = 5.0,
+) -> List[RuleMeta]:
+    """
+    LLM採点の前に、軽い特徴量で上位 top_m 件に絞る。
+    基本点 = ルール点 + 作風の近さ（原文との文字bigram類似度）+ note の簡潔さ。
+    選ぶたびに、既に選んだ候補と似ているもの（bigram Jaccard）を減点して多様性を保つ（MMR）。
+    返り値は元の順序のまま。
+    """
+    if len(rule_meta) <= top_m:
+        return list(rule_meta)
+
+    profile = StyleNgramProfile(original_texts)
+    grams = [set(_bigrams(_joined(it))) for it, _, _ in rule_meta]
+    base = [
+        r + style_weight * profile.similarity(_joined(it)) + _note_score(it)
+        for it, r, _ in rule_meta
+    ]
+
+    max_sim = [0.0] * len(rule_meta)
+    remaining = set(range(len(rule_meta)))
+    selected: List[int] = []
+    while remaining and len(selected) < top_m:
+        best = max(remaining, key=lambda i: (base[i] - diversity_weight * max_sim[i], -i))
+        selected.append(best)
+        remaining.discard(best)
+        for i in remaining:
+            sim = _jaccard(grams[best], grams[i])
+            if sim > max_sim[i]:
+                max_sim[i] = sim
+
+    return [rule_meta[i] for i in sorted(selected)]
@@ -0,0 +1,128 @@
+import json
+from typing import List, Dict, Any, Optional
+from senryu_ai.config import CONFIG
+from senryu_ai.metrics import METRICS, RunContextExecutor
+from senryu_ai.llm_ollama import Prompt, call_ollama, llm_concurrency, size_options
+from senryu_ai.mora import is_575, mora_pattern
+
+TARGET = [5, 7, 5]
+_LINE_NAMES = ["上句", "中句", "下句"]
+
+# 修正結果のJSONスキーマ（候補IDと直した3行の組の配列）
+REPAIR_SCHEMA: Dict[str, Any] = {
+    "type": "array",
+    "items": {
+        "type": "object",
+        "properties": {
+            "id": {"type": "integer"},
+            "lines": {"type": "array", "items": {"type": "string"}, "minItems": 3, "maxItems": 3},
+        },
+        "required": ["id", "lines"],
+    },
+}
+
+def near_miss_distance(pattern: List[int]) -> int:
+    """五七五からのずれ（各句の音数差の合計）。3句でなければ大きな値"""
+    if len(pattern) != 3:
+        return 99
+    return sum(abs(p - t) for p, t in zip(pattern, TARGET))
+
+def is_near_miss(lines: List[str], max_off: Optional[int] = None) -> bool:
+    """五七五まであと1〜2音（REPAIR_MAX_OFF）の句か"""
+    max_off = CONFIG.repair_max_off if max_off is None else max_off
+    if len(lines) != 3:
+        return False
+    return 0 < near_miss_distance(mora_pattern([str(s) for s in lines])) <= max_off
+
+def _repair_prompt(entries: List[Dict[str, Any]]) -> Prompt:
+    blocks = []
+    for e in entries:
+        fixes = [
+            f"{name}は{count}音→{target}音に"
+            for name, count, target in zip(_LINE_NAMES, e["pattern"], TARGET)
+            if count != target
+        ]
+        blocks.append(json.dumps({"id": e["id"], "lines": e["lines"], "直す箇所": "、".join(fixes)}, ensure_ascii=False))
+    items = "\n".join(blocks)
+    system = """
+あなたは川柳の添削者です。渡される句は五七五（上5音・中7音・下5音）から1〜2音ずれています。
+「直す箇所」に書かれた句だけを、意味と雰囲気を保ったまま音数が合うように直してください。
+それ以外の句は一字も変えないこと。
+
+出力はJSON配列のみ。各要素は {"id": 元のid, "lines": ["上句", "中句", "下句"]}。
+""".strip()
+    return Prompt(system, f"【直す句（JSON、1行に1句）】\n{items}")
+
+def _repair_chunk(entries: List[Dict[str, Any]]) -> Dict[int, List[str]]:
+    try:
+        prompt = _repair_prompt(entries)
+        text = call_ollama(
+            prompt,
+            format=REPAIR_SCHEMA if CONFIG.structured_output else None,
+            options={
+                "temperature": CONFIG.repair_temperature,
+                **size_options(prompt, len(entries) * CONFIG.repair_tokens_per_item),
+            },
+            stage="repair",
+        )
+        data = json.loads(text[text.find("["):text.rfind("]") + 1])
+    except Exception as e:
+        print(f"  修正エラー（{len(entries)}件）: {str(e)[:50]}")
+        return {}
+    fixed: Dict[int, List[str]] = {}
+    for entry in data if isinstance(data, list) else []:
+        if not isinstance(entry, dict):
+            continue
+        lines = entry.get("lines")
+        if isinstance(lines, list) and len(lines) == 3 and all(isinstance(s, str) for s in lines):
+            try:
+                fixed[int(entry["id"])] = [s.strip() for s in lines]
+            except (KeyError, TypeError, ValueError):
+                continue
+    return fixed
+
+def repair_near_misses(
+    items: List[Dict[str, Any]],
+    chunk_size: int = 20,
+    max_rounds: int = 2,
+) -> List[Dict[str, Any]]:
+    """
+    五七五まであと少しの句を、ずれている句だけLLMに直させる。
+    直した結果はモーラ数で再チェックし、五七五になったものだけを返す。
+    まだずれているものは max_rounds まで繰り返す。
+    """
+    pending = [
+        {"id": i, "lines": [str(s) for s in it["lines"]], "item": it}
+        for i, it in enumerate(items)
+    ]
+    repaired: List[Dict[str, Any]] = []
+    concurrency = llm_concurrency(CONFIG.generate_concurrency)
+    for round_num in range(max_rounds):
+        if not pending:
+            break
+        for e in pending:
+            e["pattern"] = mora_pattern(e["lines"])
+        chunks = [pending[i:i + chunk_size] for i in range(0, len(pending), chunk_size)]
+        print(f"  修正ラウンド {round_num + 1}: {len(pending)}件 ({len(chunks)}回に分けて)...")
+        METRICS.incr("repair_rounds")
+        METRICS.incr("repair_attempts", len(pending))
+        with RunContextExecutor(max_workers=min(concurrency, len(chunks))) as executor:
+            results: Dict[int, List[str]] = {}
+            for fixed in executor.map(_repair_chunk, chunks):
+                results.update(fixed)
+
+        still: List[Dict[str, Any]] = []
+        for e in pending:
+            lines = results.get(e["id"])
+            if lines is None:
+                continue
+            if is_575(lines):
+                item = dict(e["item"])
+                item["lines"] = lines
+                item["type"] = "repaired"
+                item["repaired_from"] = e["item"]["lines"]
+                repaired.append(item)
+            elif 0 < near_miss_distance(mora_pattern(lines)) <= CONFIG.repair_max_off:
+                still.append({"id": e["id"], "lines": lines, "item": e["item"]})
+        pending = still
+    return repaired
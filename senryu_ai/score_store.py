@@ -0,0 +1,152 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from typing import Any, Dict, List, Optional, Tuple
+from senryu_ai.config import CONFIG
+
+# rule_score の判定ロジックを変えたら上げる（保存済みのルール点を再計算させる）
+RULE_VERSION = "1"
+
+def lines_key(lines: List[Any]) -> str:
+    """正規化した上中下を "/" でつないだもの（保存キー）"""
+    return "/".join(unicodedata.normalize("NFKC", str(s)).strip() for s in lines)
+
+def profile_hash(style_profile: Dict[str, Any]) -> str:
+    payload = json.dumps(style_profile, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+class ScoreStore:
+    """
+    これまでに採点した句の保存庫（SQLite）。
+    - verses: 句ごとのルール点・モーラ数・理由・初出/最終出現（全生成履歴のアーカイブを兼ねる）
+    - judgements: 句 × 作風プロファイル × 採点モデル ごとのLLM点
+    """
+
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._pending: List[Tuple[Any, ...]] = []
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS verses (
+                lines_key TEXT PRIMARY KEY,
+                lines TEXT NOT NULL,
+                pattern TEXT NOT NULL,
+                rule REAL NOT NULL,
+                reasons TEXT NOT NULL,
+                rule_version TEXT NOT NULL,
+                item TEXT NOT NULL,
+                first_seen REAL NOT NULL,
+                last_seen REAL NOT NULL,
+                seen_count INTEGER NOT NULL DEFAULT 1
+            );
+            CREATE TABLE IF NOT EXISTS judgements (
+                lines_key TEXT NOT NULL,
+                profile_hash TEXT NOT NULL,
+                judge_model TEXT NOT NULL,
+                llm REAL NOT NULL,
+                created REAL NOT NULL,
+                PRIMARY KEY (lines_key, profile_hash, judge_model)
+            );
+            """
+        )
+        self._conn.commit()
+
+    def get_rule(self, lines: List[Any], touch: bool = True) -> Optional[Tuple[float, List[str], List[int]]]:
+        """保存済みなら (ルール点, 理由, モーラ数) を返す。touch なら出現回数を数える"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT rule, reasons, pattern FROM verses WHERE lines_key = ? AND rule_version = ?",
+                (lines_key(lines), RULE_VERSION),
+            ).fetchone()
+            if row is None:
+                return None
+            if touch:
+                self._pending.append(("seen", lines_key(lines)))
+        return row[0], json.loads(row[1]), json.loads(row[2])
+
+    def put_rule(self, item: Dict[str, Any], rule: float, reasons: List[str], pattern: List[int]) -> None:
+        """書き込みは溜めておき、flush() でまとめて反映する"""
+        lines = item.get("lines", [])
+        with self._lock:
+            self._pending.append((
+                "rule",
+                lines_key(lines),
+                json.dumps(lines, ensure_ascii=False),
+                json.dumps(pattern),
+                rule,
+                json.dumps(reasons, ensure_ascii=False),
+                RULE_VERSION,
+                json.dumps(item, ensure_ascii=False),
+            ))
+            full = len(self._pending) >= 500
+        if full:
+            self.flush()
+
+    def get_llm_scores(self, keys: List[str], style_hash: str, judge_model: str) -> Dict[str, float]:
+        found: Dict[str, float] = {}
+        with self._lock:
+            for i in range(0, len(keys), 500):
+                chunk = keys[i:i + 500]
+                rows = self._conn.execute(
+                    "SELECT lines_key, llm FROM judgements WHERE profile_hash = ? AND judge_model = ?"
+                    f" AND lines_key IN ({','.join('?' * len(chunk))})",
+                    (style_hash, judge_model, *chunk),
+                ).fetchall()
+                found.update({k: v for k, v in rows})
+        return found
+
+    def put_llm_scores(self, scores: Dict[str, float], style_hash: str, judge_model: str) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO judgements (lines_key, profile_hash, judge_model, llm, created)"
+                " VALUES (?, ?, ?, ?, ?)",
+                [(k, style_hash, judge_model, v, now) for k, v in scores.items()],
+            )
+            self._conn.commit()
+
+    def flush(self) -> None:
+        now = time.time()
+        with self._lock:
+            pending, self._pending = self._pending, []
+            rules = [p[1:] for p in pending if p[0] == "rule"]
+            seen = [(now, p[1]) for p in pending if p[0] == "seen"]
+            self._conn.executemany(
+                "INSERT INTO verses (lines_key, lines, pattern, rule, reasons, rule_version, item, first_seen, last_seen)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)"
+                " ON CONFLICT(lines_key) DO UPDATE SET pattern = excluded.pattern, rule = excluded.rule,"
+                " reasons = excluded.reasons, rule_version = excluded.rule_version,"
+                " last_seen = excluded.last_seen, seen_count = verses.seen_count + 1",
+                [r + (now, now) for r in rules],
+            )
+            self._conn.executemany(
+                "UPDATE verses SET last_seen = ?, seen_count = seen_count + 1 WHERE lines_key = ?",
+                seen,
+            )
+            self._conn.commit()
+
+    def close(self) -> None:
+        self.flush()
+        with self._lock:
+            self._conn.close()
+
+_store: Optional[ScoreStore] = None
+_store_lock = threading.Lock()
+
+def get_score_store() -> Optional[ScoreStore]:
+    """SCORE_STORE が有効なら共有の保存庫を返す（初回に開く）"""
+    global _store
+    if not CONFIG.score_store:
+        return None
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = ScoreStore(os.path.join(CONFIG.cache_dir, "scores.sqlite3"))
+    return _store
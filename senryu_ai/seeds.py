@@ -0,0 +1,155 @@
+import math
+import random
+import threading
+from typing import Dict, List, Optional
+
+from senryu_ai.dedup import normalize_text
+
+# NumPy/SciPy があれば TF-IDF + MMR、なければ巡回サンプリング。
+# 読み込みに0.3秒ほどかかるので、最初に SeedSelector を作るときまで遅らせる
+np = None
+sparse = None
+_numeric_lock = threading.Lock()
+_numeric_resolved = False
+
+def _has_numeric() -> bool:
+    """NumPy/SciPy を読み込めれば True（初回だけ import を試みる）"""
+    global np, sparse, _numeric_resolved
+    if _numeric_resolved:
+        return np is not None
+    with _numeric_lock:
+        if not _numeric_resolved:
+            try:
+                import numpy  # type: ignore
+                from scipy import sparse as scipy_sparse  # type: ignore
+                np, sparse = numpy, scipy_sparse
+            except ImportError:  # pragma: no cover - 環境依存
+                np = sparse = None
+            _numeric_resolved = True
+    return np is not None
+
+def _char_ngrams(text: str, ns=(2, 3)) -> List[str]:
+    text = normalize_text(text)
+    grams = [text[i:i + n] for n in ns for i in range(len(text) - n + 1)]
+    return grams or ([text] if text else [])
+
+class SeedSelector:
+    """
+    プロンプトに載せる原句（お手本）を選ぶ。
+    原句を文字n-gramの TF-IDF ベクトルにしておき、テーマ（クエリ）に近く、
+    かつ互いに似ていない句を MMR で選ぶ。使った句は少し選ばれにくくして、
+    バッチごとに違う句・違うテーマを探索させる。
+    """
+
+    def __init__(self, original_texts: List[str], seed: int = 0, diversity: float = 0.5):
+        self.texts = list(original_texts)
+        self.diversity = diversity
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._used = [0] * len(self.texts)
+        self._order = list(range(len(self.texts)))
+        self._rng.shuffle(self._order)
+        self._cursor = 0
+        self._vocab: Dict[str, int] = {}
+        self._idf = None
+        self._matrix = None
+        if self.texts and _has_numeric():
+            self._build_tfidf()
+
+    def _build_tfidf(self) -> None:
+        indptr = [0]
+        indices: List[int] = []
+        data: List[float] = []
+        for text in self.texts:
+            counts: Dict[int, int] = {}
+            for g in _char_ngrams(text):
+                j = self._vocab.setdefault(g, len(self._vocab))
+                counts[j] = counts.get(j, 0) + 1
+            indices.extend(counts.keys())
+            data.extend(counts.values())
+            indptr.append(len(indices))
+        tf = sparse.csr_matrix(
+            (np.asarray(data, dtype=np.float32), np.asarray(indices), np.asarray(indptr)),
+            shape=(len(self.texts), len(self._vocab)),
+        )
+        df = np.bincount(tf.indices, minlength=len(self._vocab))
+        self._idf = (np.log((1 + len(self.texts)) / (1 + df)) + 1.0).astype(np.float32)
+        self._matrix = self._l2_normalize(tf @ sparse.diags(self._idf))
+
+    @staticmethod
+    def _l2_normalize(m):
+        norms = np.sqrt(np.asarray(m.multiply(m).sum(axis=1)).ravel())
+        norms[norms == 0] = 1.0
+        return sparse.diags(1.0 / norms) @ m
+
+    def _query_vector(self, query: str):
+        counts: Dict[int, int] = {}
+        for g in _char_ngrams(query):
+            j = self._vocab.get(g)
+            if j is not None:
+                counts[j] = counts.get(j, 0) + 1
+        if not counts:
+            return None
+        cols = list(counts.keys())
+        vec = sparse.csr_matrix(
+            (np.asarray(list(counts.values()), dtype=np.float32) * self._idf[cols], ([0] * len(cols), cols)),
+            shape=(1, len(self._vocab)),
+        )
+        return self._l2_normalize(vec)
+
+    def select(self, k: int, query: Optional[str] = None) -> List[str]:
+        """k件を選ぶ。query（テーマ語など）があればそれに近い句を優先する"""
+        if k >= len(self.texts):
+            return list(self.texts)
+        with self._lock:
+            if self._matrix is None:
+                picked = self._select_round_robin(k)
+            else:
+                picked = self._select_mmr(k, query)
+            for i in picked:
+                self._used[i] += 1
+        return [self.texts[i] for i in picked]
+
+    def _select_round_robin(self, k: int) -> List[int]:
+        picked = []
+        for _ in range(k):
+            picked.append(self._order[self._cursor])
+            self._cursor = (self._cursor + 1) % len(self._order)
+        return picked
+
+    def _select_mmr(self, k: int, query: Optional[str]) -> List[int]:
+        n = len(self.texts)
+        # 関連度：クエリとの類似度（なければ0）+ 小さな揺らぎ - 使用回数による減衰
+        relevance = np.zeros(n, dtype=np.float32)
+        qvec = self._query_vector(query) if query else None
+        if qvec is not None:
+            relevance += np.asarray((self._matrix @ qvec.T).todense()).ravel()
+        relevance += 0.05 * np.asarray([self._rng.random() for _ in range(n)], dtype=np.float32)
+        relevance -= 0.1 * np.log1p(np.asarray(self._used, dtype=np.float32))
+
+        # コーパスが大きくても計算量が増えないよう、関連度の上位だけから選ぶ
+        pool_size = min(n, max(20 * k, 200))
+        pool = np.argpartition(-relevance, pool_size - 1)[:pool_size] if pool_size < n else np.arange(n)
+        pool_matrix = self._matrix[pool]
+        pool_rel = relevance[pool]
+        max_sim = np.zeros(len(pool), dtype=np.float32)
+        chosen = np.zeros(len(pool), dtype=bool)
+        picked: List[int] = []
+        for _ in range(k):
+            mmr = (1 - self.diversity) * pool_rel - self.diversity * max_sim
+            mmr[chosen] = -math.inf
+            best = int(np.argmax(mmr))
+            chosen[best] = True
+            picked.append(int(pool[best]))
+            sims = np.asarray((pool_matrix @ pool_matrix[best].T).todense()).ravel()
+            np.maximum(max_sim, sims, out=max_sim)
+        return picked
+
+def profile_themes(style_profile: Dict) -> List[str]:
+    """作風プロファイルの themes をクエリ用の文字列のリストにする"""
+    themes = style_profile.get("themes") if isinstance(style_profile, dict) else None
+    if isinstance(themes, str):
+        themes = [themes]
+    if not isinstance(themes, list):
+        return []
+    return [t if isinstance(t, str) else " ".join(str(v) for v in t.values()) if isinstance(t, dict) else str(t) for t in themes]
@@ -0,0 +1,493 @@
+"""
+常駐サービスモード（python main.py --serve）。
+
+1回ごとにプロセスを起動すると、原句の読み込み・索引・作風抽出・モデルの読み込みを毎回やり直す。
+サービスモードではそれらをメモリに置いたまま、生成ジョブを小さなHTTP API（asyncio）で受け付ける。
+
+- POST /jobs {"corpus": "default", "count": 50, "keep": 5, "stream": true}
+    ジョブを待ち行列に入れる。stream=true なら進捗と採点結果を NDJSON で順に返す
+- GET /jobs/<id>          状態・進捗・結果
+- GET /jobs/<id>/events   これまでのイベント + 以降のイベント（NDJSON）
+- DELETE /jobs/<id>       取り消し
+- GET/POST /corpora       読み込み済みの原句集の一覧 / 追加（{"id": ..., "path": ...}）
+- GET /health, GET /metrics
+
+待ち行列の長さは SERVICE_QUEUE_SIZE、同時に実行するジョブ数は SERVICE_WORKERS。
+"""
+import asyncio
+import itertools
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import unquote
+
+from senryu_ai.config import CONFIG
+from senryu_ai.dedup import NearDuplicateIndex, add_item
+from senryu_ai.generate import BatchSeeds, batch_sizes, iter_candidates
+from senryu_ai.judge import ScoredItem
+from senryu_ai.llm_backend import get_backend
+from senryu_ai.llm_ollama import model_id, warm_up_model
+from senryu_ai.metrics import METRICS
+from senryu_ai.mora import warm_up_dictionary
+from senryu_ai.parse import load_originals, load_originals_index
+from senryu_ai.pipeline import judge_with_store, result_row, rule_with_store
+from senryu_ai.prerank import shortlist
+from senryu_ai.repair import is_near_miss, repair_near_misses
+from senryu_ai.score_store import get_score_store
+from senryu_ai.style import load_or_build_style_profile
+
+_MAX_BODY = 1 << 20
+_TERMINAL = ("done", "failed", "cancelled")
+
+class Corpus:
+    """
+    常駐中に持ち続ける原句集1つ分（原句・コピー検出の索引・作風プロファイル・お手本の選び方）。
+    originals.txt が更新されたら、次のジョブの前に読み直す。
+    """
+
+    def __init__(self, corpus_id: str, path: str):
+        self.id = corpus_id
+        self.path = path
+        self.lock = threading.Lock()
+        self.batches = 0  # これまでに使ったバッチ数（テーマの順番をジョブをまたいで進める）
+        self.load()
+
+    def load(self) -> None:
+        started = time.perf_counter()
+        self.mtime = os.path.getmtime(self.path)
+        self.originals = load_originals(self.path)
+        if not self.originals:
+            raise RuntimeError(f"原句が読み込めませんでした: {self.path}")
+        self.original_texts = [o["raw"] for o in self.originals]
+        self.originals_index = load_originals_index(self.path, self.originals) if CONFIG.enable_copy_check else None
+        self.style_profile = load_or_build_style_profile(self.original_texts)
+        self.seeds = BatchSeeds(self.style_profile, self.original_texts)
+        self.batches = 0
+        print(f"原句集 '{self.id}' を読み込みました（{len(self.originals)}句, {time.perf_counter() - started:.1f}秒）")
+
+    def refresh_if_changed(self) -> None:
+        if os.path.getmtime(self.path) != self.mtime:
+            print(f"原句集 '{self.id}' が更新されたため読み直します")
+            self.load()
+
+    def reserve_batches(self, n: int) -> int:
+        """このジョブが使うバッチ番号の開始位置を返す"""
+        with self.lock:
+            start = self.batches
+            self.batches += len(batch_sizes(n))
+            return start
+
+    def info(self) -> Dict[str, Any]:
+        return {"id": self.id, "path": self.path, "originals": len(self.originals)}
+
+class Job:
+    """
+    生成ジョブ1件。イベント（進捗・候補・採点結果）はワーカーのスレッドから publish し、
+    イベントループ側で履歴に追加して購読者（ストリーム中のHTTP応答）に配る。
+    """
+
+    def __init__(self, job_id: str, corpus_id: str, count: int, keep: int, loop: asyncio.AbstractEventLoop):
+        self.id = job_id
+        self.corpus_id = corpus_id
+        self.count = count
+        self.keep = keep
+        self.status = "queued"
+        self.progress: Dict[str, Any] = {"stage": "queued", "generated": 0, "valid": 0, "judged": 0}
+        self.results: List[Dict[str, Any]] = []
+        self.error = ""
+        self.created = time.time()
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+        self.cancel_requested = threading.Event()
+        self.events: List[Dict[str, Any]] = []
+        self._subscribers: List[asyncio.Queue] = []
+        self._loop = loop
+
+    def publish(self, event: Dict[str, Any]) -> None:
+        """どのスレッドからでも呼べる"""
+        self._loop.call_soon_threadsafe(self._publish, event)
+
+    def _publish(self, event: Dict[str, Any]) -> None:
+        self.events.append(event)
+        for queue in self._subscribers:
+            queue.put_nowait(event)
+
+    def subscribe(self) -> Tuple[List[Dict[str, Any]], asyncio.Queue]:
+        """（これまでのイベント, 以降のイベントが届くキュー）。イベントループ上で呼ぶ"""
+        queue: asyncio.Queue = asyncio.Queue()
+        self._subscribers.append(queue)
+        return list(self.events), queue
+
+    def unsubscribe(self, queue: asyncio.Queue) -> None:
+        if queue in self._subscribers:
+            self._subscribers.remove(queue)
+
+    def info(self, with_results: bool = True) -> Dict[str, Any]:
+        data: Dict[str, Any] = {
+            "id": self.id,
+            "corpus": self.corpus_id,
+            "count": self.count,
+            "keep": self.keep,
+            "status": self.status,
+            "progress": dict(self.progress),
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished,
+        }
+        if self.error:
+            data["error"] = self.error
+        if with_results and self.status == "done":
+            data["results"] = self.results
+        return data
+
+def run_job(job: Job, corpus: Corpus) -> List[Dict[str, Any]]:
+    """
+    1ジョブ分の生成 → 五七五チェック・ルール採点 → （修正）→ 事前選抜 → LLM採点 を行う（ワーカーのスレッドで実行）。
+    run_pipeline のストリーミング生成と同じ流れで、五七五OKの候補が keep の3倍集まったら生成を打ち切る。
+    """
+    with corpus.lock:
+        corpus.refresh_if_changed()
+    store = get_score_store()
+    report: Dict[str, Any] = {"score_store_rule_hits": 0, "score_store_llm_hits": 0}
+    dedup_index = NearDuplicateIndex(threshold=CONFIG.dedup_threshold) if CONFIG.enable_dedup else None
+    rule_meta: List[Tuple[Dict[str, Any], float, List[str]]] = []
+    near_misses: List[Dict[str, Any]] = []
+    target_valid = job.keep * 3
+
+    def stage(name: str) -> None:
+        job.progress["stage"] = name
+        job.publish({"event": "progress", **job.progress})
+
+    def classify(it: Dict[str, Any]) -> None:
+        if dedup_index is not None and add_item(dedup_index, it) is not None:
+            return
+        r, reasons = rule_with_store(it, store, report, corpus.originals_index)
+        if r > -10:
+            rule_meta.append((it, r, reasons))
+            job.progress["valid"] = len(rule_meta)
+            job.publish({"event": "candidate", "lines": it.get("lines"), "note": it.get("note", ""), "rule": r})
+        elif (
+            CONFIG.enable_repair
+            and "五七五から外れている" in reasons
+            and len(near_misses) < CONFIG.repair_max_items
+            and is_near_miss(it.get("lines", []))
+        ):
+            near_misses.append(it)
+
+    stage("generate")
+    with METRICS.span("service_generate", corpus=corpus.id):
+        stream = iter_candidates(
+            corpus.style_profile, corpus.original_texts, job.count,
+            seeds=corpus.seeds, batch_offset=corpus.reserve_batches(job.count),
+        )
+        try:
+            for it in stream:
+                job.progress["generated"] += 1
+                classify(it)
+                if len(rule_meta) >= target_valid or job.cancel_requested.is_set():
+                    break
+        finally:
+            stream.close()
+    if job.cancel_requested.is_set():
+        return []
+
+    if near_misses and len(rule_meta) < target_valid:
+        stage("repair")
+        with METRICS.span("service_repair", corpus=corpus.id):
+            for it in repair_near_misses(near_misses):
+                classify(it)
+
+    if CONFIG.enable_llm_judge and rule_meta:
+        if CONFIG.enable_prerank and len(rule_meta) > target_valid:
+            rule_meta = shortlist(rule_meta, corpus.original_texts, target_valid)
+        stage("judge")
+        items = [it for it, _, _ in rule_meta]
+
+        def on_scores(scores: Dict[int, float]) -> None:
+            for i, ls in scores.items():
+                it, r, _ = rule_meta[i]
+                job.publish({
+                    "event": "scored", "lines": it.get("lines"), "note": it.get("note", ""),
+                    "rule": r, "llm": float(ls), "total": r + float(ls),
+                })
+            job.progress["judged"] += len(scores)
+
+        with METRICS.span("service_judge", corpus=corpus.id, items=len(items)):
+            llm_scores = judge_with_store(corpus.style_profile, items, store, report, on_scores=on_scores)
+    else:
+        llm_scores = [0.0 for _ in rule_meta]
+    if store is not None:
+        store.flush()
+
+    merged = [
+        ScoredItem(total=r + float(ls), rule=r, llm=float(ls), reasons=reasons, item=it)
+        for (it, r, reasons), ls in zip(rule_meta, llm_scores)
+    ]
+    merged.sort(key=lambda x: x.total, reverse=True)
+    return [result_row(k) for k in merged[: job.keep]]
+
+class SenryuService:
+    """原句集とジョブの待ち行列を持つHTTPサービス"""
+
+    def __init__(self, workers: Optional[int] = None, queue_size: Optional[int] = None, max_jobs: Optional[int] = None):
+        self.workers = max(1, workers or CONFIG.service_workers)
+        self.queue_size = max(1, queue_size or CONFIG.service_queue_size)
+        self.max_jobs = max_jobs or CONFIG.service_max_jobs
+        self.corpora: Dict[str, Corpus] = {}
+        self.jobs: Dict[str, Job] = {}
+        self.running = 0
+        self._ids = itertools.count(1)
+        self._executor = ThreadPoolExecutor(max_workers=self.workers + 1, thread_name_prefix="senryu-job")
+        self._queue: Optional[asyncio.Queue] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def add_corpus(self, corpus_id: str, path: str) -> Corpus:
+        corpus = Corpus(corpus_id, path)
+        self.corpora[corpus_id] = corpus
+        return corpus
+
+    # ---- ジョブ ----
+
+    def submit(self, corpus_id: str, count: int, keep: int) -> Job:
+        assert self._queue is not None and self._loop is not None
+        if corpus_id not in self.corpora:
+            raise KeyError(corpus_id)
+        job = Job(f"{int(time.time())}-{next(self._ids)}", corpus_id, count, keep, self._loop)
+        self._queue.put_nowait(job)  # 満杯なら asyncio.QueueFull
+        self._forget_old_jobs()
+        self.jobs[job.id] = job
+        job._publish({"event": "queued", "job": job.id, "position": self._queue.qsize()})
+        return job
+
+    def cancel(self, job: Job) -> None:
+        if job.status == "queued":
+            self._finish(job, "cancelled")
+        elif job.status == "running":
+            job.cancel_requested.set()
+
+    def _finish(self, job: Job, status: str, error: str = "") -> None:
+        job.status = status
+        job.error = error
+        job.finished = time.time()
+        job.progress["stage"] = status
+        if status == "done":
+            job._publish({"event": "done", "results": job.results})
+        elif status == "failed":
+            job._publish({"event": "failed", "error": error})
+        else:
+            job._publish({"event": "cancelled"})
+
+    def _forget_old_jobs(self) -> None:
+        """終わったジョブは新しい順に max_jobs 件だけ残す"""
+        finished = [j for j in self.jobs.values() if j.status in _TERMINAL]
+        for job in sorted(finished, key=lambda j: j.finished or 0)[: max(0, len(finished) - self.max_jobs)]:
+            del self.jobs[job.id]
+
+    async def _worker(self) -> None:
+        assert self._queue is not None and self._loop is not None
+        while True:
+            job = await self._queue.get()
+            try:
+                if job.status != "queued":  # 待っている間に取り消された
+                    continue
+                job.status = "running"
+                job.started = time.time()
+                self.running += 1
+                job._publish({"event": "started"})
+                try:
+                    job.results = await self._loop.run_in_executor(self._executor, run_job, job, self.corpora[job.corpus_id])
+                except Exception as e:
+                    print(f"ジョブ {job.id} が失敗しました: {str(e)[:200]}")
+                    METRICS.incr("service_jobs_failed")
+                    self._finish(job, "failed", str(e))
+                else:
+                    METRICS.incr("service_jobs_done")
+                    self._finish(job, "cancelled" if job.cancel_requested.is_set() else "done")
+                finally:
+                    self.running -= 1
+            finally:
+                self._queue.task_done()
+
+    # ---- HTTP ----
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            request_line = await reader.readline()
+            if not request_line:
+                return
+            method, target, _ = request_line.decode("latin-1").split(" ", 2)
+            headers: Dict[str, str] = {}
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                key, _, value = line.decode("latin-1").partition(":")
+                headers[key.strip().lower()] = value.strip()
+            length = int(headers.get("content-length") or 0)
+            if length > _MAX_BODY:
+                await _send_json(writer, 413, {"error": "リクエストが大きすぎます"})
+                return
+            body = await reader.readexactly(length) if length else b""
+            path = unquote(target.split("?", 1)[0]).rstrip("/") or "/"
+            await self._route(method.upper(), path, body, writer)
+        except (ValueError, UnicodeDecodeError, asyncio.IncompleteReadError):
+            await _send_json(writer, 400, {"error": "リクエストを解釈できません"})
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            try:
+                writer.close()
+                await writer.wait_closed()
+            except (ConnectionError, RuntimeError):
+                pass
+
+    async def _route(self, method: str, path: str, body: bytes, writer: asyncio.StreamWriter) -> None:
+        parts = path.strip("/").split("/")
+        if path == "/health" and method == "GET":
+            await _send_json(writer, 200, {
+                "status": "ok", "model": model_id(), "corpora": sorted(self.corpora),
+                "queued": self._queue.qsize() if self._queue else 0, "running": self.running,
+                "hosts": get_backend().status(),
+            })
+        elif path == "/metrics" and method == "GET":
+            data = METRICS.to_dict()
+            data.pop("calls", None)
+            data.pop("spans", None)
+            await _send_json(writer, 200, data)
+        elif path == "/corpora" and method == "GET":
+            await _send_json(writer, 200, [c.info() for c in self.corpora.values()])
+        elif path == "/corpora" and method == "POST":
+            await self._post_corpus(_json_body(body), writer)
+        elif path == "/jobs" and method == "GET":
+            await _send_json(writer, 200, [j.info(with_results=False) for j in self.jobs.values()])
+        elif path == "/jobs" and method == "POST":
+            await self._post_job(_json_body(body), writer)
+        elif len(parts) >= 2 and parts[0] == "jobs" and parts[1] in self.jobs:
+            job = self.jobs[parts[1]]
+            if len(parts) == 2 and method == "GET":
+                await _send_json(writer, 200, job.info())
+            elif len(parts) == 2 and method == "DELETE":
+                self.cancel(job)
+                await _send_json(writer, 200, job.info(with_results=False))
+            elif len(parts) == 3 and parts[2] == "events" and method == "GET":
+                await self._stream_events(job, writer)
+            else:
+                await _send_json(writer, 404, {"error": "not found"})
+        else:
+            await _send_json(writer, 404, {"error": "not found"})
+
+    async def _post_corpus(self, req: Dict[str, Any], writer: asyncio.StreamWriter) -> None:
+        corpus_id, path = str(req.get("id") or ""), str(req.get("path") or "")
+        if not corpus_id or not path:
+            await _send_json(writer, 400, {"error": "id と path を指定してください"})
+            return
+        if not os.path.isfile(path):
+            await _send_json(writer, 400, {"error": f"ファイルがありません: {path}"})
+            return
+        assert self._loop is not None
+        try:
+            # 作風抽出でLLMを呼ぶことがあるので、イベントループを止めないよう別スレッドで読み込む
+            corpus = await self._loop.run_in_executor(self._executor, self.add_corpus, corpus_id, path)
+        except Exception as e:
+            await _send_json(writer, 500, {"error": str(e)})
+            return
+        await _send_json(writer, 201, corpus.info())
+
+    async def _post_job(self, req: Dict[str, Any], writer: asyncio.StreamWriter) -> None:
+        try:
+            corpus_id = str(req.get("corpus") or "default")
+            count = int(req.get("count") or CONFIG.n_generate)
+            keep = int(req.get("keep") or CONFIG.n_keep)
+        except (TypeError, ValueError):
+            await _send_json(writer, 400, {"error": "count と keep は整数で指定してください"})
+            return
+        if not 1 <= keep <= count <= CONFIG.service_max_count:
+            await _send_json(writer, 400, {"error": f"1 <= keep <= count <= {CONFIG.service_max_count} にしてください"})
+            return
+        try:
+            job = self.submit(corpus_id, count, keep)
+        except KeyError:
+            await _send_json(writer, 404, {"error": f"原句集がありません: {corpus_id}"})
+            return
+        except asyncio.QueueFull:
+            await _send_json(writer, 429, {"error": "待ち行列がいっぱいです。しばらくしてから送ってください"})
+            return
+        if req.get("stream"):
+            await self._stream_events(job, writer)
+        else:
+            await _send_json(writer, 202, job.info(with_results=False))
+
+    async def _stream_events(self, job: Job, writer: asyncio.StreamWriter) -> None:
+        """これまでのイベントを送ってから、ジョブが終わるまで届いた順に NDJSON で送る"""
+        history, queue = job.subscribe()
+        try:
+            writer.write(
+                b"HTTP/1.1 200 OK\r\nContent-Type: application/x-ndjson\r\n"
+                b"Transfer-Encoding: chunked\r\nCache-Control: no-cache\r\nConnection: close\r\n\r\n"
+            )
+            for event in history:
+                await _send_chunk(writer, event)
+                if event["event"] in _TERMINAL:
+                    break
+            else:
+                while True:
+                    event = await queue.get()
+                    await _send_chunk(writer, event)
+                    if event["event"] in _TERMINAL:
+                        break
+            writer.write(b"0\r\n\r\n")
+            await writer.drain()
+        finally:
+            job.unsubscribe(queue)
+
+    async def run(self, host: str, port: int) -> None:
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        workers = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        server = await asyncio.start_server(self._handle, host, port)
+        print(f"サービスを起動しました: http://{host}:{port}（ワーカー {self.workers}, 待ち行列 {self.queue_size}）")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            for task in workers:
+                task.cancel()
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+def _json_body(body: bytes) -> Dict[str, Any]:
+    if not body:
+        return {}
+    data = json.loads(body.decode("utf-8"))
+    if not isinstance(data, dict):
+        raise ValueError("JSONオブジェクトではありません")
+    return data
+
+async def _send_json(writer: asyncio.StreamWriter, status: int, data: Any) -> None:
+    body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+    reason = {200: "OK", 201: "Created", 202: "Accepted", 400: "Bad Request", 404: "Not Found",
+              413: "Payload Too Large", 429: "Too Many Requests", 500: "Internal Server Error"}.get(status, "")
+    writer.write(
+        f"HTTP/1.1 {status} {reason}\r\nContent-Type: application/json; charset=utf-8\r\n"
+        f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode("latin-1") + body
+    )
+    await writer.drain()
+
+async def _send_chunk(writer: asyncio.StreamWriter, event: Dict[str, Any]) -> None:
+    data = (json.dumps(event, ensure_ascii=False) + "\n").encode("utf-8")
+    writer.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+    await writer.drain()
+
+def serve(corpora: Dict[str, str], host: Optional[str] = None, port: Optional[int] = None) -> None:
+    """原句集（{id: path}）を読み込み、モデルを載せてから待ち受ける"""
+    service = SenryuService()
+    warm_up_dictionary()
+    warm_up_model()
+    for corpus_id, path in corpora.items():
+        service.add_corpus(corpus_id, path)
+    try:
+        asyncio.run(service.run(host or CONFIG.service_host, port or CONFIG.service_port))
+    except KeyboardInterrupt:
+        print("サービスを終了します")
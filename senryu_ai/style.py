@@ -1,10 +1,20 @@
+import hashlib
 import json
+import os
 import re
-from typing import List, Dict, Any
-from senryu_ai.llm_ollama import call_ollama
+import unicodedata
+from typing import List, Dict, Any, Optional
+from senryu_ai.llm_ollama import call_ollama, deterministic_options, model_id, size_options
+from senryu_ai.config import CONFIG
+from senryu_ai.seeds import SeedSelector
+
+# プロンプトや抽出ロジックを変えたら上げる（キャッシュが自動で無効になる）
+STYLE_PROMPT_VERSION = "2"
 
 def build_style_profile(original_texts: List[str]) -> Dict[str, Any]:
-    sample = "\n".join(f"- {s}" for s in original_texts[:200])
+    # 先頭200句ではなく、コーパス全体から互いに似ていない200句を選ぶ
+    picked = SeedSelector(original_texts, seed=CONFIG.seed).select(200) if len(original_texts) > 200 else original_texts
+    sample = "\n".join(f"- {s}" for s in picked)
     prompt = f"""
 あなたは川柳の編集者です。以下の川柳群から作者の作風を抽出し、
 生成時に再現できる「スタイルプロファイル」をJSONで作成してください。
@@ -24,7 +34,8 @@ def build_style_profile(original_texts: List[str]) -> Dict[str, Any]:
 出力はJSONのみ。余計な文章は禁止。
 """.strip()
 
-    text = call_ollama(prompt)
+    options = {**deterministic_options(), **size_options(prompt, CONFIG.style_num_predict)}
+    text = call_ollama(prompt, options=options, stage="style")
     start = text.find("{")
     end = text.rfind("}")
     if start == -1 or end == -1 or start >= end:
@@ -48,3 +59,54 @@ def build_style_profile(original_texts: List[str]) -> Dict[str, Any]:
                 error_msg += f"          {' ' * (e.colno - 1)}^\n"
         error_msg += f"\n抽出したJSON（最初の1000文字）:\n{json_str[:1000]}"
         raise RuntimeError(error_msg)
+
+def style_profile_key(original_texts: List[str], model: Optional[str] = None) -> str:
+    """原文（正規化済み）・モデル名・プロンプト版からキャッシュキーを作る"""
+    normalized = [" ".join(unicodedata.normalize("NFKC", t).split()) for t in original_texts]
+    payload = json.dumps(
+        {
+            "prompt_version": STYLE_PROMPT_VERSION,
+            "model": model or model_id(),
+            "originals": [t for t in normalized if t],
+        },
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def load_or_build_style_profile(
+    original_texts: List[str],
+    cache_dir: Optional[str] = None,
+    refresh: Optional[bool] = None,
+    pinned_path: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    作風プロファイルをキャッシュから読む。なければ抽出してキャッシュに保存する。
+    - pinned_path（STYLE_PROFILE_PATH）があればそのファイルをそのまま使う
+    - refresh（STYLE_PROFILE_REFRESH）ならキャッシュを無視して抽出し直す
+    """
+    pinned_path = CONFIG.style_profile_path if pinned_path is None else pinned_path
+    if pinned_path:
+        with open(pinned_path, "r", encoding="utf-8") as f:
+            print(f"作風プロファイルを固定ファイルから読み込みます: {pinned_path}")
+            return json.load(f)
+
+    cache_dir = cache_dir or os.path.join(CONFIG.cache_dir, "style")
+    refresh = CONFIG.style_profile_refresh if refresh is None else refresh
+    path = os.path.join(cache_dir, f"{style_profile_key(original_texts)}.json")
+
+    if not refresh and os.path.exists(path):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                profile = json.load(f)
+            print(f"作風プロファイルをキャッシュから読み込みました: {path}")
+            return profile
+        except (OSError, json.JSONDecodeError):
+            pass  # 壊れたキャッシュは作り直す
+
+    profile = build_style_profile(original_texts)
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(profile, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+    return profile